@@ -1,4 +1,5 @@
 import os
+import click
 import logging
 from logging.handlers import RotatingFileHandler
 
@@ -6,12 +7,12 @@ from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 load_dotenv()
 
-from flask import Flask, session, request, render_template, redirect, url_for, current_app, jsonify
+from flask import Flask, session, request, render_template, redirect, url_for, current_app, jsonify, send_from_directory
 from flask_talisman import Talisman
 from flask_compress import Compress
 from app.config import Config
 from app.extensions import (
-    db, migrate, cors, limiter, cache, mail, babel, mysql
+    db, cors, limiter, cache, mail, babel, mysql
 )
 from datetime import datetime
 
@@ -27,21 +28,14 @@ def create_app(config_class=Config):
     app.config['MYSQL_DB'] = os.environ.get('MYSQL_DB', 'chocomap')
     app.config['MYSQL_PORT'] = int(os.environ.get('MYSQL_PORT', 3306))
     
-    # Debug: Print MySQL config (excluding password)
-    print(f"[DEBUG] MySQL config: host={app.config['MYSQL_HOST']}, user={app.config['MYSQL_USER']}, db={app.config['MYSQL_DB']}, port={app.config['MYSQL_PORT']}, password={'set' if app.config['MYSQL_PASSWORD'] else 'NOT SET'}")
-    
-    # Debug: Print MySQL password (masked)
-    pw = app.config['MYSQL_PASSWORD']
-    if pw:
-        pw_masked = pw[:2] + '*'*(len(pw)-4) + pw[-2:] if len(pw) > 4 else '*'*len(pw)
-    else:
-        pw_masked = 'NOT SET'
-    print(f"[DEBUG] MySQL password: {pw_masked}")
-    
     # Initialize extensions
     mysql.init_app(app)
     db.init_app(app)
-    migrate.init_app(app, db)
+    
+    # Alembic is only needed by the `flask db` commands, not by workers
+    if os.environ.get('FLASK_RUN_FROM_CLI'):
+        from flask_migrate import Migrate
+        Migrate(app, db)
     cors.init_app(app)
     
     # Initialize rate limiter
@@ -50,6 +44,21 @@ def create_app(config_class=Config):
     cache.init_app(app)
     mail.init_app(app)
     
+    # Request, database and cache metrics on /metrics
+    from app import metrics, instrumentation
+    metrics.init_app(app)
+    
+    # Per-request SQL accounting: N+1 warnings, slow-query log, debug headers
+    instrumentation.init_app(app)
+    
+    # On-demand sampling profiler (idle unless an admin starts it)
+    from app import profiler
+    profiler.init_app(app)
+    
+    # Template bytecode cache and {% cache %} fragments
+    from app import templating
+    templating.init_app(app)
+    
     # Debug: Log MySQL config (excluding password)
     app.logger.info(f"MySQL config: host={app.config['MYSQL_HOST']}, user={app.config['MYSQL_USER']}, db={app.config['MYSQL_DB']}, port={app.config['MYSQL_PORT']}")
     
@@ -132,10 +141,15 @@ def create_app(config_class=Config):
     from app.routes.manager import manager_bp
     from app.routes.admin import admin_bp
     
+    # Fingerprinted, precompressed static files
+    from app import assets
+    assets.init_app(app)
+    
     # Add favicon route
     @app.route('/favicon.ico')
     def favicon():
-        return app.send_static_file('favicon.ico')
+        # Fixed URL, so cached for a day rather than forever
+        return send_from_directory(app.static_folder, 'favicon.ico', max_age=86400)
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(employee_bp)
@@ -143,6 +157,11 @@ def create_app(config_class=Config):
     app.register_blueprint(manager_bp)
     app.register_blueprint(admin_bp)
     
+    # Location pings drive automatic arrival detection
+    from app.services.location_service import LocationService
+    from app.services.geofence_service import GeofenceService
+    LocationService.add_listener(GeofenceService.process)
+    
     # Register error handlers
     @app.errorhandler(404)
     def not_found_error(error):
@@ -231,6 +250,44 @@ def create_app(config_class=Config):
         tests = unittest.TestLoader().discover('tests')
         unittest.TextTestRunner(verbosity=2).run(tests)
     
+    @app.cli.command()
+    @click.option('--limit', default=25, help='Number of imports to show.')
+    def import_profile(limit):
+        """Show the slowest imports of a worker boot (python -X importtime)."""
+        import subprocess
+        import sys
+        script = (
+            "import time; start = time.perf_counter()\n"
+            "from app import create_app; create_app()\n"
+            "print(f'create_app: {(time.perf_counter() - start) * 1000:.0f} ms')"
+        )
+        # Without the CLI flag the child boots exactly like a worker
+        env = {k: v for k, v in os.environ.items() if k != 'FLASK_RUN_FROM_CLI'}
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                                capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            print(result.stderr[-2000:])
+            return
+        imports = []
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            imports.append((int(cumulative_us), int(self_us), name.strip()))
+        print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+        for cumulative_us, self_us, name in sorted(imports, reverse=True)[:limit]:
+            print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:8.1f}  {name}")
+        print(result.stdout.strip())
+
+    @app.cli.command()
+    def build_assets():
+        """Minify, fingerprint and precompress the static files."""
+        from app import assets
+        manifest = assets.build(app.static_folder)
+        for source, built in sorted(manifest.items()):
+            print(f"{source} -> {built}")
+        print(f"Built {len(manifest)} assets.")
+
     @app.cli.command()
     def init_db():
         """Initialize the database."""
@@ -253,7 +310,61 @@ def create_app(config_class=Config):
             print('Admin user created successfully.')
         else:
             print('Error creating admin user.')
-    
+
+    @app.cli.command()
+    @click.option('--merge', is_flag=True, help='Merge each duplicate group into its oldest address.')
+    def dedup_addresses(merge):
+        """Find (and optionally merge) duplicate addresses."""
+        from app.services.address_dedup_service import AddressDedupService
+        groups = AddressDedupService.find_duplicate_groups()
+        for group in groups:
+            print(f"Keep {group['keep_id']}, duplicates {group['duplicate_ids']} ({group['reason']})")
+            if merge and not AddressDedupService.merge_addresses(group['keep_id'], group['duplicate_ids']):
+                print(f"  Error merging group {group['keep_id']}")
+        print(f"Found {len(groups)} duplicate groups.")
+
+    @app.cli.command()
+    def build_road_network():
+        """Parse ROAD_NETWORK_PATH and write its compiled graph."""
+        from app.services.routing_service import RoutingService
+        path = app.config.get('ROAD_NETWORK_PATH')
+        if not path:
+            print('ROAD_NETWORK_PATH is not set.')
+            return
+        graph = RoutingService.load_graph(path, rebuild=True)
+        print(f'Road network ready: {len(graph)} nodes, {graph.edge_count} edges.')
+
+    @app.cli.command()
+    @click.option('--repair', is_flag=True, help='Rebuild the counters of drivers that drifted.')
+    def reconcile_driver_stats(repair):
+        """Verify the driver_stats counters against the deliveries table."""
+        from app.services.delivery_service import DeliveryService
+        drift = DeliveryService.reconcile_driver_stats(repair=repair)
+        for entry in drift:
+            scope = 'lifetime' if entry['lifetime'] else ''
+            dates = ', '.join(entry['dates'][:5]) + (' ...' if len(entry['dates']) > 5 else '')
+            print(f"Driver {entry['driver_id']}: {' '.join(filter(None, [scope, dates]))}")
+        print(f"{len(drift)} drivers drifted{', repaired' if repair and drift else ''}.")
+
+    @app.cli.command()
+    @click.option('--once', is_flag=True, help='Run a single recalculation and exit.')
+    def live_etas(once):
+        """Recalculate live ETAs every LIVE_ETA_INTERVAL seconds."""
+        import time
+        from app.services.live_eta_service import LiveEtaService
+        while True:
+            started = time.time()
+            # A fresh context per tick ends the previous read snapshot
+            with app.app_context():
+                try:
+                    published = LiveEtaService.tick()
+                    app.logger.info(f"Live ETAs: republished {published} routes")
+                except Exception as e:
+                    app.logger.error(f"Error recalculating live ETAs: {str(e)}")
+            if once:
+                break
+            time.sleep(max(0, app.config['LIVE_ETA_INTERVAL'] - (time.time() - started)))
+
     # Add health check route
     @app.route('/health', methods=['GET'])
     def health_check():
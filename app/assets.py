@@ -0,0 +1,169 @@
+"""Static asset build and serving.
+
+``flask build-assets`` copies every file under ``app/static`` to
+``static/<ASSETS_DIR>`` with a content hash in its name (``js/main.js`` ->
+``dist/js/main.3f2a1b9c.js``), minifying JS and CSS on the way, and writes
+``.gz`` and ``.br`` siblings for compressible types plus a
+``manifest.json`` mapping source names to built ones.
+
+When a manifest exists, ``url_for('static', filename='js/main.js')``
+resolves to the fingerprinted file, so templates need no changes. The
+static view then sends fingerprinted files with a one-year immutable
+Cache-Control and picks the precompressed sibling the client accepts, so
+nothing is compressed at request time.
+
+JS/CSS minification uses rjsmin/rcssmin when installed and otherwise
+only drops indentation, blank lines and (for CSS) comments.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import shutil
+from typing import Dict, Optional
+from flask import Flask, request, send_from_directory
+from app.config import Config
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import rjsmin
+    import rcssmin
+except ImportError:  # pragma: no cover - optional dependency
+    rjsmin = rcssmin = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.js', '.css', '.svg', '.json', '.txt', '.html', '.ico', '.map')
+IMMUTABLE = 'public, max-age={}, immutable'
+
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+_manifest: Dict[str, str] = {}
+
+
+def _minify(name: str, text: str) -> str:
+    if name.endswith('.js'):
+        if rjsmin is not None:
+            return rjsmin.jsmin(text)
+    elif name.endswith('.css'):
+        if rcssmin is not None:
+            return rcssmin.cssmin(text)
+        text = _CSS_COMMENT.sub('', text)
+    else:
+        return text
+    return '\n'.join(line.strip() for line in text.splitlines() if line.strip()) + '\n'
+
+
+def _write_compressed(path: str, data: bytes) -> None:
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    for suffix, compressed in variants:
+        # Tiny files can grow; the static view then sends the plain file
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+
+
+def build(static_folder: str) -> Dict[str, str]:
+    """Build fingerprinted, minified and precompressed copies of the static files"""
+    out_dir = os.path.join(static_folder, Config.ASSETS_DIR)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        if os.path.abspath(root).startswith(os.path.abspath(out_dir)):
+            continue
+        for name in sorted(files):
+            if name.endswith(('.gz', '.br')):
+                continue
+            source = os.path.join(root, name)
+            rel = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+            if name.endswith(('.js', '.css')):
+                data = _minify(name, data.decode('utf-8')).encode('utf-8')
+
+            stem, ext = os.path.splitext(rel)
+            built = f"{Config.ASSETS_DIR}/{stem}.{hashlib.sha256(data).hexdigest()[:8]}{ext}"
+            target = os.path.join(static_folder, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(data)
+            if ext in COMPRESSIBLE:
+                _write_compressed(target, data)
+            manifest[rel] = built
+
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        logger.warning("brotli is not installed, only .gz files were written")
+    return manifest
+
+
+def load_manifest(static_folder: str) -> Dict[str, str]:
+    path = os.path.join(static_folder, Config.ASSETS_DIR, MANIFEST)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read asset manifest: {str(e)}")
+        return {}
+
+
+def _fingerprint_static(endpoint: str, values: Dict) -> None:
+    # url_defaults hook: rewrite url_for('static', filename=...) to the built file
+    if endpoint == 'static' and values.get('filename') in _manifest:
+        values['filename'] = _manifest[values['filename']]
+
+
+def _precompressed(static_folder: str, filename: str) -> Optional[str]:
+    accepted = request.headers.get('Accept-Encoding', '')
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.isfile(os.path.join(static_folder, filename + suffix)):
+            return encoding
+    return None
+
+
+def make_static_view(app: Flask):
+    static_folder = app.static_folder
+    prefix = Config.ASSETS_DIR + '/'
+
+    def static(filename: str):
+        if not filename.startswith(prefix):
+            return app.send_static_file(filename)
+
+        encoding = _precompressed(static_folder, filename)
+        suffix = {'br': '.br', 'gzip': '.gz'}.get(encoding, '')
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype,
+                                       max_age=Config.ASSETS_MAX_AGE)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        # The name changes with the content, so clients never need to revalidate
+        response.headers['Cache-Control'] = IMMUTABLE.format(Config.ASSETS_MAX_AGE)
+        return response
+
+    return static
+
+
+def init_app(app: Flask) -> None:
+    """Serve built assets and point url_for('static') at them when a manifest exists"""
+    global _manifest
+    app.view_functions['static'] = make_static_view(app)
+    if app.debug:
+        # Edited sources must show up without a rebuild
+        return
+    _manifest = load_manifest(app.static_folder)
+    if _manifest:
+        app.url_defaults(_fingerprint_static)
@@ -52,6 +52,129 @@ class Config:
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     LOG_FILE = os.environ.get('LOG_FILE', 'app.log')
     
+    # Metrics: /metrics is served to these networks or to the bearer token
+    METRICS_ALLOWED_NETWORKS = [n.strip() for n in os.environ.get(
+        'METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',') if n.strip()]
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    
+    # SQL instrumentation: slow-query threshold/log, N+1 detection, debug headers
+    SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 200))
+    SQL_SLOW_QUERY_LOG = os.environ.get('SQL_SLOW_QUERY_LOG')
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.environ.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+    SQL_SLOWEST_KEPT = int(os.environ.get('SQL_SLOWEST_KEPT', 3))
+    SQL_DEBUG_HEADERS = os.environ.get('SQL_DEBUG_HEADERS', 'False').lower() == 'true'
+    
+    # Sampling profiler: output directory, retention and sampling rate
+    # (absolute: send_file resolves relative paths against the app root, not the cwd)
+    PROFILER_DIR = os.path.abspath(os.environ.get('PROFILER_DIR', 'logs/profiles'))
+    PROFILER_KEEP = int(os.environ.get('PROFILER_KEEP', 20))
+    PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0.005))
+    PROFILER_MAX_SECONDS = int(os.environ.get('PROFILER_MAX_SECONDS', 60))
+    PROFILER_TOKEN_TTL = int(os.environ.get('PROFILER_TOKEN_TTL', 300))
+    
+    # Templates: compiled bytecode cache ('filesystem', 'redis' or '') and {% cache %} fragments
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', 'filesystem')
+    TEMPLATE_BYTECODE_DIR = os.environ.get('TEMPLATE_BYTECODE_DIR', '')
+    TEMPLATE_BYTECODE_TTL = int(os.environ.get('TEMPLATE_BYTECODE_TTL', 604800))
+    FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', 'True').lower() == 'true'
+    FRAGMENT_CACHE_TTL = int(os.environ.get('FRAGMENT_CACHE_TTL', 3600))
+    FRAGMENT_VERSION_TTL = int(os.environ.get('FRAGMENT_VERSION_TTL', 604800))
+    
+    # Static assets: build output under app/static and its cache lifetime
+    ASSETS_DIR = os.environ.get('ASSETS_DIR', 'dist')
+    ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 31536000))
+    
+    # Admin log viewer: file, backups to search, read sizes and follow-mode timing
+    ADMIN_LOG_FILE = os.environ.get('ADMIN_LOG_FILE', 'logs/chocomap.log')
+    LOG_VIEWER_BACKUPS = int(os.environ.get('LOG_VIEWER_BACKUPS', 10))
+    LOG_VIEWER_BLOCK_SIZE = int(os.environ.get('LOG_VIEWER_BLOCK_SIZE', 65536))
+    LOG_VIEWER_MAX_LINES = int(os.environ.get('LOG_VIEWER_MAX_LINES', 1000))
+    LOG_VIEWER_MAX_LINE_BYTES = int(os.environ.get('LOG_VIEWER_MAX_LINE_BYTES', 65536))
+    LOG_VIEWER_MAX_RECORD_LINES = int(os.environ.get('LOG_VIEWER_MAX_RECORD_LINES', 200))
+    LOG_VIEWER_MAX_SCAN_BYTES = int(os.environ.get('LOG_VIEWER_MAX_SCAN_BYTES', 16777216))
+    LOG_FOLLOW_INTERVAL = float(os.environ.get('LOG_FOLLOW_INTERVAL', 1.0))
+    LOG_FOLLOW_KEEPALIVE = float(os.environ.get('LOG_FOLLOW_KEEPALIVE', 15.0))
+    LOG_FOLLOW_MAX_SECONDS = int(os.environ.get('LOG_FOLLOW_MAX_SECONDS', 300))
+    
+    # Password hashing: bcrypt work factor and the thread pool it runs in
+    BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+    PASSWORD_HASH_THREADS = int(os.environ.get('PASSWORD_HASH_THREADS', 4))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 5))
+    
+    # Event loop monitor: tick interval and the stall that gets its stack logged
+    LOOP_MONITOR_ENABLED = os.environ.get('LOOP_MONITOR_ENABLED', 'True').lower() == 'true'
+    LOOP_MONITOR_INTERVAL = float(os.environ.get('LOOP_MONITOR_INTERVAL', 0.05))
+    LOOP_MONITOR_THRESHOLD = float(os.environ.get('LOOP_MONITOR_THRESHOLD', 0.2))
+    
+    # Pagination
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 50))
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 200))
+    
+    # Calendar API: widest start/end window a single request may ask for
+    CALENDAR_MAX_WINDOW_DAYS = int(os.environ.get('CALENDAR_MAX_WINDOW_DAYS', 62))
+    
+    # Scheduling: local travel-time model and conflict cache
+    SCHEDULE_AVG_SPEED_KMH = float(os.environ.get('SCHEDULE_AVG_SPEED_KMH', 30))
+    SCHEDULE_ROAD_FACTOR = float(os.environ.get('SCHEDULE_ROAD_FACTOR', 1.3))
+    SCHEDULE_MAX_TRAVEL_MINUTES = int(os.environ.get('SCHEDULE_MAX_TRAVEL_MINUTES', 90))
+    SCHEDULE_CACHE_TTL = int(os.environ.get('SCHEDULE_CACHE_TTL', 300))
+    
+    # Auto-dispatch: driver shift, stop cap and solver time limit
+    DISPATCH_SHIFT_START = os.environ.get('DISPATCH_SHIFT_START', '08:00')
+    DISPATCH_SHIFT_END = os.environ.get('DISPATCH_SHIFT_END', '18:00')
+    DISPATCH_SERVICE_MINUTES = int(os.environ.get('DISPATCH_SERVICE_MINUTES', 10))
+    DISPATCH_MAX_STOPS_PER_DRIVER = int(os.environ.get('DISPATCH_MAX_STOPS_PER_DRIVER', 25))
+    DISPATCH_BALANCE_TOLERANCE = float(os.environ.get('DISPATCH_BALANCE_TOLERANCE', 1.25))
+    DISPATCH_TIME_LIMIT = float(os.environ.get('DISPATCH_TIME_LIMIT', 2.0))
+    DISPATCH_PREVIEW_TTL = int(os.environ.get('DISPATCH_PREVIEW_TTL', 900))
+    
+    # Offline routing: OSM .pbf extract or edge CSV; unset uses straight-line estimates
+    ROAD_NETWORK_PATH = os.environ.get('ROAD_NETWORK_PATH')
+    
+    # Per driver/day travel-time matrices
+    MATRIX_CACHE_TTL = int(os.environ.get('MATRIX_CACHE_TTL', 86400))
+    MATRIX_LOCAL_ENTRIES = int(os.environ.get('MATRIX_LOCAL_ENTRIES', 256))
+    
+    # Delivery zones: clustering defaults and cache lifetime
+    ZONE_DEFAULT_K = int(os.environ.get('ZONE_DEFAULT_K', 4))
+    ZONE_MAX_ITERATIONS = int(os.environ.get('ZONE_MAX_ITERATIONS', 50))
+    ZONE_CACHE_TTL = int(os.environ.get('ZONE_CACHE_TTL', 3600))
+    
+    # Route re-planning: cached stop order per driver/day and repair bounds
+    ROUTE_CACHE_TTL = int(os.environ.get('ROUTE_CACHE_TTL', 86400))
+    ROUTE_REPAIR_WINDOW = int(os.environ.get('ROUTE_REPAIR_WINDOW', 4))
+    ROUTE_REPAIR_MAX_PASSES = int(os.environ.get('ROUTE_REPAIR_MAX_PASSES', 3))
+    ROUTE_LATE_PENALTY = int(os.environ.get('ROUTE_LATE_PENALTY', 10))
+    
+    # Driver GPS pings: buffered per worker, flushed to per driver/day segment files
+    LOCATION_STORE_DIR = os.environ.get('LOCATION_STORE_DIR', 'data/locations')
+    LOCATION_BUFFER_SIZE = int(os.environ.get('LOCATION_BUFFER_SIZE', 5000))
+    LOCATION_FLUSH_SECONDS = float(os.environ.get('LOCATION_FLUSH_SECONDS', 2))
+    LOCATION_MAX_BATCH = int(os.environ.get('LOCATION_MAX_BATCH', 1000))
+    LOCATION_MAX_AGE_SECONDS = int(os.environ.get('LOCATION_MAX_AGE_SECONDS', 86400))
+    LOCATION_POSITION_TTL = int(os.environ.get('LOCATION_POSITION_TTL', 3600))
+    LOCATION_RATE_LIMIT = os.environ.get('LOCATION_RATE_LIMIT', '120 per minute')
+    
+    # Geofences: arrival radius in metres, dwell before arrival, exit hysteresis
+    GEOFENCE_RADIUS = float(os.environ.get('GEOFENCE_RADIUS', 75))
+    GEOFENCE_DWELL_SECONDS = int(os.environ.get('GEOFENCE_DWELL_SECONDS', 60))
+    GEOFENCE_EXIT_FACTOR = float(os.environ.get('GEOFENCE_EXIT_FACTOR', 1.5))
+    GEOFENCE_CELL_DEGREES = float(os.environ.get('GEOFENCE_CELL_DEGREES', 0.002))
+    
+    # Live ETAs: recompute interval, republish threshold and position freshness
+    LIVE_ETA_INTERVAL = int(os.environ.get('LIVE_ETA_INTERVAL', 30))
+    LIVE_ETA_THRESHOLD = int(os.environ.get('LIVE_ETA_THRESHOLD', 3))
+    LIVE_ETA_MAX_POSITION_AGE = int(os.environ.get('LIVE_ETA_MAX_POSITION_AGE', 300))
+    LIVE_ETA_TTL = int(os.environ.get('LIVE_ETA_TTL', 3600))
+    
+    # Driver app sync: batch size and cursor overlap for late commits
+    SYNC_MAX_OPERATIONS = int(os.environ.get('SYNC_MAX_OPERATIONS', 500))
+    SYNC_CURSOR_OVERLAP = int(os.environ.get('SYNC_CURSOR_OVERLAP', 5))
+    
+    # Driver day manifests; the TTL also bounds how stale lifetime stats can get
+    MANIFEST_CACHE_TTL = int(os.environ.get('MANIFEST_CACHE_TTL', 300))
+    
     # File upload
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -1,17 +1,14 @@
-from flask_mysqldb import MySQL
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from flask_caching import Cache
 from flask_mail import Mail
 from flask_babel import Babel
+from app.instrumentation import InstrumentedMySQL, InstrumentedCache
 
 # Initialize extensions
-mysql = MySQL()
+mysql = InstrumentedMySQL()
 db = SQLAlchemy()
-migrate = Migrate()
 cors = CORS()
 limiter = Limiter(
     key_func=get_remote_address,
@@ -19,6 +16,7 @@ limiter = Limiter(
     storage_uri="redis://localhost:6379/0",
     strategy="fixed-window"
 )
-cache = Cache()
+# The {% cache %} tag is app.templating's, keyed by locale and role
+cache = InstrumentedCache(with_jinja2_ext=False)
 mail = Mail()
 babel = Babel()  # Initialize without app parameter 
\ No newline at end of file
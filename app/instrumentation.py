@@ -0,0 +1,197 @@
+"""Timing wrappers around the MySQL connection and the shared cache.
+
+Every cursor handed out by ``mysql.connection.cursor()`` is wrapped so
+that each ``execute``/``executemany`` is timed. Statements are grouped by
+fingerprint (the SQL with literals and placeholder lists collapsed) into
+per-request totals, which feed :mod:`app.metrics`, the slow-query log,
+N+1 detection and the optional ``X-DB-*`` debug headers. Shared cache
+reads are counted as hits or misses. Everything else is passed through
+to the wrapped objects unchanged.
+"""
+import hashlib
+import heapq
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from flask import Flask, Response, g, has_app_context, request
+from flask_caching import Cache
+from flask_mysqldb import MySQL
+from app import metrics
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+slow_logger = logging.getLogger('app.sql.slow')
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST = re.compile(r"\(\s*(?:\?\s*,\s*)+\?\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(query: str) -> str:
+    """Normalise a statement so that executions differing only in values match"""
+    text = query.decode(errors='replace') if isinstance(query, bytes) else str(query)
+    text = _STRING.sub('?', text.replace('%s', '?'))
+    text = _NUMBER.sub('?', text)
+    text = _SPACE.sub(' ', text).strip()
+    return _LIST.sub('(?+)', text)
+
+
+def fingerprint_id(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()[:10]
+
+
+class RequestQueries:
+    """SQL executed while handling one request (or one app context)"""
+    __slots__ = ('count', 'seconds', 'by_fingerprint', 'slowest')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.by_fingerprint: Dict[str, List[float]] = {}
+        self.slowest: List[Tuple[float, str]] = []
+
+    def record(self, fp: str, seconds: float) -> None:
+        self.count += 1
+        self.seconds += seconds
+        entry = self.by_fingerprint.get(fp)
+        if entry is None:
+            self.by_fingerprint[fp] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+        if len(self.slowest) < Config.SQL_SLOWEST_KEPT:
+            heapq.heappush(self.slowest, (seconds, fp))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, fp))
+
+    def repeated(self) -> List[Tuple[str, int, float]]:
+        """Fingerprints run often enough in one request to look like N+1 queries"""
+        return sorted(
+            ((fp, int(count), total) for fp, (count, total) in self.by_fingerprint.items()
+             if count >= Config.SQL_N_PLUS_ONE_THRESHOLD),
+            key=lambda item: -item[1]
+        )
+
+
+def current_queries() -> Optional[RequestQueries]:
+    if not has_app_context():
+        return None
+    stats = g.get('_sql_queries')
+    if stats is None:
+        stats = g._sql_queries = RequestQueries()
+    return stats
+
+
+def _record(query, seconds: float) -> None:
+    metrics.observe_query(seconds)
+    fp = fingerprint(query)
+    stats = current_queries()
+    if stats is not None:
+        stats.record(fp, seconds)
+    if seconds * 1000 >= Config.SQL_SLOW_QUERY_MS:
+        slow_logger.warning(
+            f"Slow query {seconds * 1000:.1f} ms [{fingerprint_id(fp)}] "
+            f"{request.endpoint if request else '-'}: {fp[:1000]}"
+        )
+
+
+class InstrumentedCursor:
+    __slots__ = ('_cursor',)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(query, args)
+        finally:
+            _record(query, time.perf_counter() - start)
+
+    def executemany(self, query, args):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(query, args)
+        finally:
+            _record(query, time.perf_counter() - start)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    __slots__ = ('_connection',)
+
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self, cursorclass=None):
+        return InstrumentedCursor(self._connection.cursor(cursorclass))
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+class InstrumentedMySQL(MySQL):
+    """Flask-MySQLdb whose per-context connection hands out timed cursors"""
+
+    @property
+    def connect(self):
+        return InstrumentedConnection(MySQL.connect.fget(self))
+
+
+class InstrumentedCache(Cache):
+    """Flask-Caching with hit/miss counting on reads"""
+
+    def get(self, *args, **kwargs):
+        value = super().get(*args, **kwargs)
+        metrics.observe_cache(int(value is not None), int(value is None))
+        return value
+
+    def get_many(self, *args, **kwargs):
+        values = super().get_many(*args, **kwargs)
+        hits = sum(1 for v in values if v is not None)
+        metrics.observe_cache(hits, len(values) - hits)
+        return values
+
+
+def _after_request(response: Response) -> Response:
+    stats = g.get('_sql_queries')
+    if stats is None:
+        return response
+    repeated = stats.repeated()
+    for fp, count, total in repeated:
+        logger.warning(
+            f"Possible N+1 in {request.endpoint}: {count} x [{fingerprint_id(fp)}] "
+            f"({total * 1000:.1f} ms) {fp[:300]}"
+        )
+    if Config.SQL_DEBUG_HEADERS:
+        response.headers['X-DB-Queries'] = str(stats.count)
+        response.headers['X-DB-Time-Ms'] = f"{stats.seconds * 1000:.1f}"
+        if repeated:
+            response.headers['X-DB-Repeated'] = ', '.join(
+                f"{fingerprint_id(fp)}x{count}" for fp, count, _ in repeated
+            )
+        if stats.slowest:
+            response.headers['X-DB-Slowest'] = ', '.join(
+                f"{fingerprint_id(fp)}={seconds * 1000:.1f}ms"
+                for seconds, fp in sorted(stats.slowest, reverse=True)
+            )
+    return response
+
+
+def init_app(app: Flask) -> None:
+    """Register N+1 detection, the debug headers and the slow-query log file"""
+    app.after_request(_after_request)
+    if Config.SQL_SLOW_QUERY_LOG and not slow_logger.handlers:
+        from logging.handlers import RotatingFileHandler
+        handler = RotatingFileHandler(Config.SQL_SLOW_QUERY_LOG, maxBytes=10240000, backupCount=5)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s'))
+        slow_logger.addHandler(handler)
@@ -0,0 +1,95 @@
+"""Event-loop lag and blocking-call monitor for gevent workers.
+
+A greenlet sleeps LOOP_MONITOR_INTERVAL seconds at a time; how much later
+than asked it wakes up is the hub's lag, i.e. how long every other
+connection of the worker waited too. A native watchdog thread notices
+when the greenlet has not ticked for LOOP_MONITOR_THRESHOLD seconds and
+takes the stack of the main thread at that moment: with the hub stalled,
+that is the greenlet doing the blocking call (a MySQLdb query, bcrypt,
+CPU-heavy code). The next tick records the lag, counts the block by the
+innermost application frame and logs the full stack.
+
+The watchdog thread only reads frames; metrics and logging happen in the
+greenlet, away from gevent-patched locks.
+"""
+import logging
+import os
+import sys
+import time
+import traceback
+from typing import Optional
+from app import metrics
+from app.config import Config
+from app.profiler import _frame_label, _get_ident, _sleep, _start_new_thread
+
+logger = logging.getLogger(__name__)
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class LoopMonitor:
+    _started_pid: Optional[int] = None
+
+    def __init__(self):
+        self.main_ident = _get_ident()
+        self.last_tick = time.perf_counter()
+        self.blocked_stack: Optional[str] = None
+        self.blocked_site: Optional[str] = None
+
+    @staticmethod
+    def _site(frame) -> str:
+        """Innermost frame in our own code: where the blocking call was made"""
+        innermost = frame
+        while frame is not None:
+            if frame.f_code.co_filename.startswith(APP_ROOT) and not frame.f_code.co_filename.endswith(
+                    ('instrumentation.py', 'loop_monitor.py')):
+                return _frame_label(frame)
+            frame = frame.f_back
+        return _frame_label(innermost) if innermost is not None else 'unknown'
+
+    def _watch(self) -> None:
+        # Native thread: keeps running while the hub is blocked
+        while True:
+            _sleep(Config.LOOP_MONITOR_INTERVAL)
+            stalled = time.perf_counter() - self.last_tick
+            if stalled < Config.LOOP_MONITOR_THRESHOLD or self.blocked_stack is not None:
+                continue
+            frame = sys._current_frames().get(self.main_ident)
+            if frame is None:
+                continue
+            self.blocked_site = self._site(frame)
+            self.blocked_stack = ''.join(traceback.format_stack(frame))
+
+    def _tick(self) -> None:
+        import gevent
+        interval = Config.LOOP_MONITOR_INTERVAL
+        while True:
+            start = time.perf_counter()
+            gevent.sleep(interval)
+            self.last_tick = now = time.perf_counter()
+            lag = max(now - start - interval, 0.0)
+            metrics.observe_loop_lag(lag)
+            if self.blocked_stack is not None:
+                site, stack = self.blocked_site, self.blocked_stack
+                self.blocked_stack = self.blocked_site = None
+                metrics.observe_loop_block(site)
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms at {site}:\n{stack}")
+
+    @staticmethod
+    def start() -> bool:
+        """Start monitoring this worker; False when not running under gevent"""
+        if not Config.LOOP_MONITOR_ENABLED or LoopMonitor._started_pid == os.getpid():
+            return False
+        try:
+            import gevent
+            from gevent import monkey
+        except ImportError:
+            return False
+        if not monkey.is_module_patched('socket'):
+            return False
+        LoopMonitor._started_pid = os.getpid()
+        monitor = LoopMonitor()
+        gevent.spawn(monitor._tick)
+        _start_new_thread(monitor._watch, ())
+        logger.info(f"Event loop monitor started in worker {os.getpid()}")
+        return True
@@ -0,0 +1,181 @@
+"""Prometheus metrics for requests, database queries, the shared cache
+and the gevent event loop.
+
+Under gunicorn every worker writes its samples to memory-mapped files in
+PROMETHEUS_MULTIPROC_DIR (set up by gunicorn.conf.py under /dev/shm) and
+``/metrics`` merges the files of all workers. Without that variable the
+metrics of the current process are exported. When prometheus_client is
+not installed every recording function is a no-op.
+"""
+import ipaddress
+import logging
+import os
+import time
+from typing import Dict, Tuple
+from flask import Flask, Response, abort, g, request
+from app.config import Config
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    )
+except ImportError:  # pragma: no cover - optional dependency
+    Counter = None
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+if Counter is not None:
+    REQUEST_LATENCY = Histogram(
+        'chocomap_request_duration_seconds', 'Request latency by endpoint',
+        ['endpoint', 'method'], buckets=LATENCY_BUCKETS
+    )
+    REQUEST_COUNT = Counter(
+        'chocomap_requests_total', 'Responses by endpoint and status code',
+        ['endpoint', 'method', 'status']
+    )
+    IN_FLIGHT = Gauge(
+        'chocomap_requests_in_flight', 'Requests being handled', multiprocess_mode='livesum'
+    )
+    DB_QUERIES = Histogram(
+        'chocomap_db_queries_per_request', 'SQL statements executed per request',
+        ['endpoint'], buckets=QUERY_COUNT_BUCKETS
+    )
+    DB_TIME = Histogram(
+        'chocomap_db_seconds_per_request', 'Time spent in SQL per request',
+        ['endpoint'], buckets=LATENCY_BUCKETS
+    )
+    DB_QUERIES_TOTAL = Counter('chocomap_db_queries_total', 'SQL statements executed')
+    CACHE_REQUESTS = Counter(
+        'chocomap_cache_requests_total', 'Shared cache reads by result', ['result']
+    )
+    PASSWORD_QUEUE = Gauge(
+        'chocomap_password_hash_queue', 'bcrypt calls queued or running in the thread pool',
+        multiprocess_mode='livesum'
+    )
+    PASSWORD_SECONDS = Histogram(
+        'chocomap_password_hash_seconds', 'bcrypt hash/verify time including the wait for a thread',
+        ['operation'], buckets=LATENCY_BUCKETS
+    )
+    PASSWORD_REJECTED = Counter(
+        'chocomap_password_hash_rejected_total', 'bcrypt calls refused because the queue was full',
+        ['operation']
+    )
+    LOOP_LAG = Histogram(
+        'chocomap_event_loop_lag_seconds', 'Delay of the gevent hub in waking a sleeping greenlet',
+        buckets=LOOP_LAG_BUCKETS
+    )
+    LOOP_BLOCKS = Counter(
+        'chocomap_event_loop_blocks_total', 'Event loop stalls past the threshold by blocking call site',
+        ['site']
+    )
+
+# Label children are looked up once per label set instead of on every request
+_children: Dict[Tuple, object] = {}
+
+def enabled() -> bool:
+    return Counter is not None
+
+def _child(metric, *labels):
+    key = (id(metric),) + labels
+    child = _children.get(key)
+    if child is None:
+        child = _children[key] = metric.labels(*labels)
+    return child
+
+def observe_query(seconds: float) -> None:
+    """Count one SQL statement; per-request totals are kept by app.instrumentation"""
+    if Counter is None:
+        return
+    DB_QUERIES_TOTAL.inc()
+
+def observe_cache(hits: int, misses: int) -> None:
+    if Counter is None:
+        return
+    if hits:
+        _child(CACHE_REQUESTS, 'hit').inc(hits)
+    if misses:
+        _child(CACHE_REQUESTS, 'miss').inc(misses)
+
+def track_password_queue(delta: int) -> None:
+    if Counter is None:
+        return
+    PASSWORD_QUEUE.inc(delta)
+
+def observe_password(operation: str, seconds: float) -> None:
+    if Counter is None:
+        return
+    _child(PASSWORD_SECONDS, operation).observe(seconds)
+
+def observe_password_rejected(operation: str) -> None:
+    if Counter is None:
+        return
+    _child(PASSWORD_REJECTED, operation).inc()
+
+def observe_loop_lag(seconds: float) -> None:
+    if Counter is None:
+        return
+    LOOP_LAG.observe(seconds)
+
+def observe_loop_block(site: str) -> None:
+    if Counter is None:
+        return
+    _child(LOOP_BLOCKS, site).inc()
+
+def _before_request() -> None:
+    g._metrics_start = time.perf_counter()
+    IN_FLIGHT.inc()
+
+def _after_request(response: Response) -> Response:
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+    IN_FLIGHT.dec()
+    endpoint = request.endpoint or 'unmatched'
+    _child(REQUEST_LATENCY, endpoint, request.method).observe(time.perf_counter() - start)
+    _child(REQUEST_COUNT, endpoint, request.method, str(response.status_code)).inc()
+    queries = g.get('_sql_queries')
+    _child(DB_QUERIES, endpoint).observe(queries.count if queries else 0)
+    _child(DB_TIME, endpoint).observe(queries.seconds if queries else 0.0)
+    return response
+
+def _teardown_request(exc) -> None:
+    # Requests that failed before after_request still leave the gauge
+    if g.pop('_metrics_start', None) is not None:
+        IN_FLIGHT.dec()
+
+def _allowed() -> bool:
+    token = Config.METRICS_TOKEN
+    if token and request.headers.get('Authorization') == f"Bearer {token}":
+        return True
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(net, strict=False) for net in Config.METRICS_ALLOWED_NETWORKS)
+
+def metrics_view() -> Response:
+    if not _allowed():
+        abort(403)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+def init_app(app: Flask) -> None:
+    """Register the request hooks and the /metrics endpoint"""
+    if Counter is None:
+        logger.warning("prometheus_client is not installed, metrics are disabled")
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    # Scrapers poll far more often than the default per-IP limits allow
+    from app.extensions import limiter
+    limiter.exempt(metrics_view)
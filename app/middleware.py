@@ -103,8 +103,8 @@ def track_request(f: Callable) -> Callable:
     def decorated_function(*args: Any, **kwargs: Any) -> Any:
         start_time = time.time()
         
-        # Log request details
-        logger.info(f"Request: {request.method} {request.path}")
+        # Log request details; latency is aggregated by app.metrics
+        logger.debug(f"Request: {request.method} {request.path}")
         logger.debug(f"Headers: {dict(request.headers)}")
         if request.is_json:
             logger.debug(f"JSON data: {request.get_json()}")
@@ -114,7 +114,7 @@ def track_request(f: Callable) -> Callable:
         
         # Calculate request duration
         duration = time.time() - start_time
-        logger.info(f"Request completed in {duration:.2f} seconds")
+        logger.debug(f"Request completed in {duration:.2f} seconds")
         
         return response
     return decorated_function
@@ -3,6 +3,8 @@ from typing import List, Dict, Any, Optional
 import logging
 from datetime import datetime
 import MySQLdb.cursors
+from app.utils import get_page_size, decode_cursor, keyset_condition, build_keyset_page
+from app.templating import invalidate_fragments
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +28,40 @@ def get_all_addresses() -> List[Dict[str, Any]]:
         if cursor:
             cursor.close()
 
+def get_addresses_page(cursor_token: Optional[str] = None,
+                       per_page: Optional[int] = None) -> Dict[str, Any]:
+    """Get one page of addresses ordered by label, using keyset pagination."""
+    per_page = get_page_size(per_page)
+    after, direction = decode_cursor(cursor_token)
+    descending = direction == 'prev'
+    order = 'DESC' if descending else 'ASC'
+
+    query = """
+        SELECT a.*, u.name as created_by_name 
+        FROM addresses a 
+        LEFT JOIN users u ON a.created_by = u.id 
+    """
+    params: List[Any] = []
+    if after:
+        condition, params = keyset_condition(['a.label', 'a.id'], after, descending)
+        query += f" WHERE {condition}"
+    query += f" ORDER BY a.label {order}, a.id {order} LIMIT %s"
+    params.append(per_page + 1)
+
+    cursor = None
+    try:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(query, tuple(params))
+        rows = cursor.fetchall()
+        return build_keyset_page(rows, per_page, lambda a: [a['label'], a['id']],
+                                 direction, after is not None)
+    except Exception as e:
+        logger.error(f"Error fetching addresses page: {str(e)}")
+        return build_keyset_page([], per_page, None, direction, False)
+    finally:
+        if cursor:
+            cursor.close()
+
 def get_address_by_id(address_id: int) -> Optional[Dict[str, Any]]:
     """Get address details by ID."""
     cursor = None
@@ -59,6 +95,7 @@ def create_address(label: str, street: str, city: str, zip_code: str,
             ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         """, (label, street, city, zip_code, lat, lon, user_id, datetime.utcnow()))
         mysql.connection.commit()
+        invalidate_fragments('addresses')
         address_id = cursor.lastrowid
         return address_id
     except Exception as e:
@@ -83,6 +120,7 @@ def update_address(address_id: int, label: str, street: str, city: str,
             WHERE id = %s
         """, (label, street, city, zip_code, lat, lon, datetime.utcnow(), address_id))
         mysql.connection.commit()
+        invalidate_fragments('addresses')
         success = cursor.rowcount > 0
         return success
     except Exception as e:
@@ -100,6 +138,7 @@ def delete_address(address_id: int) -> bool:
         cursor = mysql.connection.cursor()
         cursor.execute("DELETE FROM addresses WHERE id = %s", (address_id,))
         mysql.connection.commit()
+        invalidate_fragments('addresses')
         success = cursor.rowcount > 0
         return success
     except Exception as e:
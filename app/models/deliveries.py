@@ -116,7 +116,7 @@ def create_delivery(driver_id, address_id, date, start_time, end_time, assigned_
                     'key': os.getenv("GOOGLE_MAPS_API_KEY")
                 }
 
-                response = requests.get("https://maps.googleapis.com/maps/api/distancematrix/json", params=params)
+                response = requests.get("https://maps.googleapis.com/maps/api/distancematrix/json", params=params, timeout=5)
                 data = response.json()
                 eta = data['rows'][0]['elements'][0]['duration']['value'] // 60
             except Exception as e:
@@ -4,9 +4,11 @@ import functools
 from flask import current_app
 import time
 from datetime import datetime
-import bcrypt
 import logging
 import MySQLdb.cursors
+from app import utils
+from app.utils import get_page_size, decode_cursor, keyset_condition, build_keyset_page
+from app.templating import invalidate_fragments
 
 logger = logging.getLogger(__name__)
 
@@ -74,12 +76,13 @@ def create_user(name, email, password, role='employee', preferred_lang='cs'):
     cursor = None
     try:
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        password_hash = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+        password_hash = utils.hash_password(password)
         cursor.execute("""
             INSERT INTO users (name, email, password_hash, role, preferred_lang, active)
             VALUES (%s, %s, %s, %s, %s, TRUE)
         """, (name, email, password_hash, role, preferred_lang))
         mysql.connection.commit()
+        invalidate_fragments('drivers')
         return cursor.lastrowid
     except Exception as e:
         logger.error(f"Error creating user: {str(e)}")
@@ -105,6 +108,7 @@ def update_user(user_id, **kwargs):
         
         cursor.execute(query, values)
         mysql.connection.commit()
+        invalidate_fragments('drivers')
         return cursor.rowcount > 0
     except Exception as e:
         logger.error(f"Error updating user: {str(e)}")
@@ -118,7 +122,7 @@ def change_password(user_id, new_password):
     cursor = None
     try:
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
-        password_hash = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
+        password_hash = utils.hash_password(new_password)
         cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s",
                       (password_hash, user_id))
         mysql.connection.commit()
@@ -138,7 +142,7 @@ def verify_password(user_id, password):
         cursor.execute("SELECT password_hash FROM users WHERE id = %s", (user_id,))
         result = cursor.fetchone()
         if result:
-            return bcrypt.checkpw(password.encode(), result[0].encode())
+            return utils.verify_password(password, result['password_hash'])
         return False
     except Exception as e:
         logger.error(f"Error verifying password: {str(e)}")
@@ -153,6 +157,7 @@ def deactivate_user(user_id):
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
         cursor.execute("UPDATE users SET active = FALSE WHERE id = %s", (user_id,))
         mysql.connection.commit()
+        invalidate_fragments('drivers')
         return cursor.rowcount > 0
     except Exception as e:
         logger.error(f"Error deactivating user: {str(e)}")
@@ -183,6 +188,37 @@ def get_user_stats(user_id):
         if cursor:
             cursor.close()
 
+def get_users_page(cursor_token=None, per_page=None):
+    """Get one page of users ordered by id, using keyset pagination."""
+    per_page = get_page_size(per_page)
+    after, direction = decode_cursor(cursor_token)
+    descending = direction == 'prev'
+    order = 'DESC' if descending else 'ASC'
+
+    query = """
+        SELECT id, name, email, username, role, preferred_lang, active, approval_status, created_at
+        FROM users
+    """
+    params = []
+    if after:
+        condition, params = keyset_condition(['id'], after, descending)
+        query += f" WHERE {condition}"
+    query += f" ORDER BY id {order} LIMIT %s"
+    params.append(per_page + 1)
+
+    cursor = None
+    try:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        cursor.execute(query, tuple(params))
+        rows = cursor.fetchall()
+        return build_keyset_page(rows, per_page, lambda u: [u['id']], direction, after is not None)
+    except Exception as e:
+        logger.error(f"Error fetching users page: {str(e)}")
+        return build_keyset_page([], per_page, None, direction, False)
+    finally:
+        if cursor:
+            cursor.close()
+
 class User:
     def __init__(self, id, name, email, role, preferred_lang='en', approval_status='pending', created_at=None):
         self.id = id
@@ -300,6 +336,24 @@ class User:
             if cursor:
                 cursor.close()
 
+    @staticmethod
+    def get_page(cursor_token=None, per_page=None):
+        """Get one page of users as User objects (see get_users_page)."""
+        page = get_users_page(cursor_token, per_page)
+        page['items'] = [
+            User(
+                id=user_dict['id'],
+                name=user_dict['name'],
+                email=user_dict['email'],
+                role=user_dict['role'],
+                preferred_lang=user_dict['preferred_lang'],
+                approval_status=user_dict['approval_status'],
+                created_at=user_dict['created_at']
+            )
+            for user_dict in page['items']
+        ]
+        return page
+
     def update(self, **kwargs):
         allowed_fields = {'name', 'email', 'role', 'preferred_lang', 'approval_status'}
         updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
@@ -314,6 +368,7 @@ class User:
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
         cursor.execute(f'UPDATE users SET {set_clause} WHERE id = %s', values)
         mysql.connection.commit()
+        invalidate_fragments('drivers')
         cursor.close()
         
         for k, v in updates.items():
@@ -325,5 +380,6 @@ class User:
         cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
         cursor.execute('DELETE FROM users WHERE id = %s', (self.id,))
         mysql.connection.commit()
+        invalidate_fragments('drivers')
         cursor.close()
         return True
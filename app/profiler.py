@@ -0,0 +1,225 @@
+"""On-demand statistical profiler for live workers.
+
+A sampler runs in a native OS thread (not a greenlet, so it keeps running
+while the gevent hub is blocked) and every PROFILER_INTERVAL seconds
+records the stack executing in each other thread. Results are written to
+PROFILER_DIR as collapsed stacks (``frame;frame;frame count``), the input
+format of flamegraph.pl and speedscope; only the newest PROFILER_KEEP
+files are kept.
+
+Two ways to run it:
+
+* ``Sampler.start_for(seconds)`` profiles the whole worker for a while;
+* a request carrying ``?_profile=<token>`` (see ``make_token``) is
+  profiled on its own. Only samples whose stack passes through that
+  request's ``wsgi_app`` frame are counted, so other greenlets sharing
+  the thread do not show up.
+
+Nothing runs while no profile is active; the only per-request cost is a
+substring test on the query string.
+"""
+import importlib
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from flask import Flask, Response, current_app, g, request, session
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+FLAG = '_profile'
+
+
+def _native(module: str, name: str):
+    """The unpatched version of a threading primitive under gevent"""
+    try:
+        from gevent import monkey
+        return monkey.get_original(module, name)
+    except ImportError:
+        return getattr(importlib.import_module(module), name)
+
+
+_start_new_thread = _native('_thread', 'start_new_thread')
+_get_ident = _native('_thread', 'get_ident')
+_sleep = _native('time', 'sleep')
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class Sampler:
+    """Collects collapsed stacks from a native thread until stopped.
+
+    The native thread only samples: it must not touch gevent-patched locks
+    (logging, file writes with locks), so the result is written by the
+    greenlet that calls ``finish``.
+    """
+    _active: Optional['Sampler'] = None
+    _lock = _native('_thread', 'allocate_lock')()
+
+    def __init__(self, label: str, root_frame=None):
+        self.label = label
+        self.root_frame = root_frame
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.deadline: Optional[float] = None
+        self.done = False
+        self.error: Optional[Exception] = None
+        self.path: Optional[str] = None
+        self._stop = False
+        self._ident: Optional[int] = None
+
+    def _sample(self) -> None:
+        for ident, frame in sys._current_frames().items():
+            if ident == self._ident:
+                continue
+            stack: List[str] = []
+            inside = self.root_frame is None
+            while frame is not None:
+                if frame is self.root_frame:
+                    inside = True
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if inside:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def _run(self) -> None:
+        self._ident = _get_ident()
+        try:
+            while not self._stop and (self.deadline is None or time.time() < self.deadline):
+                self._sample()
+                _sleep(Config.PROFILER_INTERVAL)
+        except Exception as e:
+            self.error = e
+        finally:
+            with Sampler._lock:
+                if Sampler._active is self:
+                    Sampler._active = None
+            self.done = True
+
+    def start(self, seconds: Optional[float] = None) -> 'Sampler':
+        if seconds is not None:
+            self.deadline = time.time() + seconds
+        _start_new_thread(self._run, ())
+        return self
+
+    def finish(self, timeout: float = 5.0) -> Optional[str]:
+        """Wait for the sampler to end, write the profile and return its path"""
+        end = time.time() + timeout
+        while not self.done and time.time() < end:
+            # Patched under gevent, so other greenlets keep running meanwhile
+            time.sleep(0.01)
+        if self.error is not None:
+            logger.error(f"Profiler failed: {str(self.error)}")
+        if self.done and self.path is None:
+            self.path = self._write()
+        return self.path
+
+    def stop(self) -> Optional[str]:
+        """Stop sampling now and return the path of the written profile"""
+        self._stop = True
+        return self.finish()
+
+    def _write(self) -> Optional[str]:
+        if not self.stacks:
+            return None
+        os.makedirs(Config.PROFILER_DIR, exist_ok=True)
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.label}.folded"
+        path = os.path.join(Config.PROFILER_DIR, name)
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        _enforce_retention()
+        logger.info(f"Profile written to {path} ({self.samples} samples)")
+        return path
+
+    @staticmethod
+    def start_for(seconds: float) -> Optional['Sampler']:
+        """Profile the whole worker for a while; None if a profile is already running"""
+        with Sampler._lock:
+            if Sampler._active is not None:
+                return None
+            sampler = Sampler._active = Sampler('worker')
+        return sampler.start(min(seconds, Config.PROFILER_MAX_SECONDS))
+
+
+def _enforce_retention() -> None:
+    try:
+        files = sorted(list_profiles(), key=lambda p: p['modified'], reverse=True)
+    except OSError:
+        return
+    for stale in files[Config.PROFILER_KEEP:]:
+        try:
+            os.remove(os.path.join(Config.PROFILER_DIR, stale['name']))
+        except OSError:
+            pass
+
+
+def list_profiles() -> List[Dict]:
+    if not os.path.isdir(Config.PROFILER_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(Config.PROFILER_DIR):
+        if name.endswith('.folded'):
+            stat = os.stat(os.path.join(Config.PROFILER_DIR, name))
+            profiles.append({'name': name, 'size': stat.st_size, 'modified': stat.st_mtime})
+    return sorted(profiles, key=lambda p: p['modified'], reverse=True)
+
+
+def profile_path(name: str) -> Optional[str]:
+    """Path of a stored profile; None for unknown or unsafe names"""
+    if os.path.basename(name) != name or not name.endswith('.folded'):
+        return None
+    path = os.path.join(Config.PROFILER_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def _serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='request-profile')
+
+
+def make_token(path: str, user_id: int) -> str:
+    """Signed flag that enables profiling of one request to ``path``"""
+    return _serializer().dumps({'path': path, 'user_id': user_id})
+
+
+def _request_token_valid(token: str) -> bool:
+    try:
+        data = _serializer().loads(token, max_age=Config.PROFILER_TOKEN_TTL)
+    except BadSignature:
+        return False
+    return data.get('path') == request.path and data.get('user_id') == session.get('user_id')
+
+
+def _before_request() -> None:
+    if FLAG.encode() not in request.query_string:
+        return
+    token = request.args.get(FLAG)
+    if not token or not _request_token_valid(token):
+        return
+    frame = sys._getframe()
+    while frame is not None and frame.f_code.co_name != 'wsgi_app':
+        frame = frame.f_back
+    label = (request.endpoint or 'request').replace('.', '-')
+    g._profiler = Sampler(label, frame).start(Config.PROFILER_MAX_SECONDS)
+
+
+def _after_request(response: Response) -> Response:
+    sampler = g.pop('_profiler', None)
+    if sampler is not None:
+        path = sampler.stop()
+        if path:
+            response.headers['X-Profile'] = os.path.basename(path)
+    return response
+
+
+def init_app(app: Flask) -> None:
+    app.before_request(_before_request)
+    app.after_request(_after_request)
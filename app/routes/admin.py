@@ -1,14 +1,17 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, abort, jsonify, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, abort, jsonify, current_app, send_file, Response
 from flask_babel import _
-from app.models.users import User
+from app.models.users import User, get_users_page
 from app.middleware import login_required, role_required, rate_limit_by_ip
 from app.utils import validate_email, sanitize_input
 from app.services.user_service import UserService
+from app.services.log_service import LogService
 from datetime import datetime, date, timedelta
-from app import mysql
+from app import mysql, profiler
+from app.templating import invalidate_fragments
 import logging
 import os
 import json
+import threading
 
 logger = logging.getLogger(__name__)
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
@@ -63,32 +66,12 @@ def dashboard():
 def users():
     """Admin user management"""
     try:
-        cursor = mysql.connection.cursor()
-        cursor.execute("""
-            SELECT id, name, email, username, role, active, approval_status, created_at
-            FROM users
-            ORDER BY id ASC
-        """)
-        users = []
-        results = cursor.fetchall()
-        for row in results:
-            users.append({
-                'id': row[0],
-                'name': row[1],
-                'email': row[2],
-                'username': row[3],
-                'role': row[4],
-                'active': row[5],
-                'approval_status': row[6],
-                'created_at': row[7]
-            })
-        cursor.close()
-        
-        return render_template('admin/users.html', users=users)
+        page = get_users_page(request.args.get('cursor'), request.args.get('per_page'))
+        return render_template('admin/users.html', users=page['items'], page=page)
     except Exception as e:
         logger.error(f"Error loading admin users: {str(e)}", exc_info=True)
         flash(_("Error loading users"), "danger")
-        return render_template('admin/users.html', users=[])
+        return render_template('admin/users.html', users=[], page=None)
 
 @admin_bp.route('/users/pending')
 @login_required
@@ -221,6 +204,7 @@ def delete_user(user_id):
         cursor = mysql.connection.cursor()
         cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
         mysql.connection.commit()
+        invalidate_fragments('drivers')
         affected_rows = cursor.rowcount
         
         if affected_rows > 0:
@@ -367,16 +351,95 @@ def create_user_route():
 @login_required
 @role_required('admin')
 def view_logs():
-    """Serve logs for the admin dashboard."""
+    """Serve logs for the admin dashboard.
+
+    Returns the last ``limit`` records, the ones before the ``before``
+    cursor or the ones after the ``after`` cursor, optionally filtered by
+    minimum ``level`` and substring ``q``.
+    """
+    limit = min(request.args.get('limit', 100, type=int) or 100, current_app.config['LOG_VIEWER_MAX_LINES'])
+    level = request.args.get('level')
+    contains = request.args.get('q')
     try:
-        log_file_path = '/home/choco/chocomap/logs/chocomap.log'  # Example log file
-        with open(log_file_path, 'r') as log_file:
-            logs = log_file.readlines()
-        return jsonify({'logs': logs[-100:]})  # Return the last 100 log lines
+        if request.args.get('after'):
+            page = LogService.read_forward(request.args['after'], limit, level, contains)
+        else:
+            page = LogService.tail(limit, level, contains, before=request.args.get('before'))
+        return jsonify(page)
+    except ValueError:
+        return jsonify({'error': _('Invalid cursor')}), 400
     except Exception as e:
         current_app.logger.error(f"Error reading logs: {str(e)}")
         return jsonify({'error': 'Unable to fetch logs'}), 500
 
+@admin_bp.route('/logs/stream', methods=['GET'])
+@login_required
+@role_required('admin')
+def stream_logs():
+    """Follow the log as server-sent events"""
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        if after:
+            LogService.decode_cursor(after)
+    except ValueError:
+        return jsonify({'error': _('Invalid cursor')}), 400
+    events = LogService.follow(after, request.args.get('level'), request.args.get('q'))
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@admin_bp.route('/profiler', methods=['POST'])
+@login_required
+@role_required('admin')
+def start_profiler():
+    """Sample this worker for N seconds; with wait=1 the collapsed stacks are returned"""
+    data = request.get_json(silent=True) or {}
+    try:
+        seconds = float(data.get('seconds', 10))
+    except (TypeError, ValueError):
+        return jsonify({'error': _('Invalid duration')}), 400
+    if not 0 < seconds <= current_app.config['PROFILER_MAX_SECONDS']:
+        return jsonify({'error': _('Invalid duration')}), 400
+
+    sampler = profiler.Sampler.start_for(seconds)
+    if sampler is None:
+        return jsonify({'error': _('A profile is already running in this worker')}), 409
+    if not data.get('wait'):
+        # A greenlet under gevent: writes the profile once sampling ends
+        threading.Thread(target=sampler.finish, args=(seconds + 5,), daemon=True).start()
+        return jsonify({'message': _('Profiling started'), 'pid': os.getpid(), 'seconds': seconds}), 202
+
+    path = sampler.finish(seconds + 5)
+    if not path:
+        return jsonify({'error': _('No samples collected')}), 500
+    return send_file(path, mimetype='text/plain')
+
+@admin_bp.route('/profiler/token', methods=['POST'])
+@login_required
+@role_required('admin')
+def profiler_token():
+    """Signed ?_profile= flag that profiles one request to the given path"""
+    path = (request.get_json(silent=True) or {}).get('path', '')
+    if not path.startswith('/'):
+        return jsonify({'error': _('Invalid path')}), 400
+    token = profiler.make_token(path, session['user_id'])
+    return jsonify({'path': path, 'query': f"{profiler.FLAG}={token}",
+                    'expires_in': current_app.config['PROFILER_TOKEN_TTL']})
+
+@admin_bp.route('/profiler/profiles')
+@login_required
+@role_required('admin')
+def list_profiles():
+    return jsonify({'profiles': profiler.list_profiles()})
+
+@admin_bp.route('/profiler/profiles/<name>')
+@login_required
+@role_required('admin')
+def download_profile(name):
+    path = profiler.profile_path(name)
+    if not path:
+        abort(404)
+    return send_file(path, mimetype='text/plain', as_attachment=request.args.get('download') == '1')
+
 @admin_bp.route('/database/maintenance', methods=['GET', 'POST'])
 def database_maintenance():
     """Handle database maintenance actions."""
@@ -3,6 +3,12 @@ from flask_babel import _
 from datetime import datetime, date, timedelta
 from app.services.delivery_service import DeliveryService
 from app.services.user_service import UserService
+from app.services.location_service import LocationService
+from app.services.live_eta_service import LiveEtaService
+from app.services.sync_service import SyncService
+from app.services.manifest_service import ManifestService
+from app.config import Config
+from app.extensions import limiter
 from app.middleware import login_required, role_required, rate_limit_by_ip
 from app.utils import format_datetime
 import logging
@@ -15,19 +21,14 @@ driver_bp = Blueprint('driver', __name__, url_prefix='/driver')
 @role_required('driver')
 def dashboard():
     try:
-        # Get today's deliveries
-        today = date.today().isoformat()
-        deliveries = DeliveryService.get_driver_deliveries(
-            driver_id=session['user_id'],
-            date=today
-        )
-        
-        # Get driver stats
-        stats = DeliveryService.get_driver_stats(session['user_id'])
+        # Today's deliveries and stats, cached until the day changes
+        manifest, _etag = ManifestService.get_manifest(session['user_id'], date.today().isoformat())
+        live_eta = LiveEtaService.get(session['user_id'])
         
         return render_template('driver/dashboard.html',
-                             deliveries=deliveries,
-                             stats=stats)
+                             deliveries=manifest['deliveries'],
+                             stats=manifest['stats'],
+                             live_eta=live_eta)
     except Exception as e:
         logger.error(f"Error loading driver dashboard: {str(e)}")
         flash(_("Error loading dashboard"), "danger")
@@ -148,3 +149,74 @@ def get_delivery_route(delivery_id):
     except Exception as e:
         logger.error(f"Error getting delivery route: {str(e)}")
         return jsonify({"error": _("Internal server error")}), 500
+
+@driver_bp.route('/api/locations', methods=['POST'])
+@login_required
+@role_required('driver')
+@limiter.limit(Config.LOCATION_RATE_LIMIT)
+def post_locations():
+    """Accept a batch of GPS pings: {"pings": [{"lat", "lon", "ts", "speed"}, ...]}"""
+    data = request.get_json(silent=True) or {}
+    pings = data.get('pings')
+    if not isinstance(pings, list) or not pings:
+        return jsonify({"error": _("No pings provided")}), 400
+    if len(pings) > Config.LOCATION_MAX_BATCH:
+        return jsonify({"error": _("Too many pings in one batch")}), 413
+    try:
+        result = LocationService.ingest(session['user_id'], [p for p in pings if isinstance(p, dict)])
+        result['rejected'] = len(pings) - result['accepted']
+        return jsonify(result), 202
+    except Exception as e:
+        logger.error(f"Error ingesting locations: {str(e)}")
+        return jsonify({"error": _("Internal server error")}), 500
+
+@driver_bp.route('/api/live-eta')
+@login_required
+@role_required('driver')
+def live_eta():
+    """Latest published ETAs of the driver's remaining stops today"""
+    snapshot = LiveEtaService.get(session['user_id'])
+    if not snapshot:
+        return jsonify({"error": _("No live ETAs available")}), 404
+    return jsonify(snapshot)
+
+@driver_bp.route('/api/sync', methods=['POST'])
+@login_required
+@role_required('driver')
+@limiter.limit(Config.LOCATION_RATE_LIMIT)
+def sync():
+    """Apply queued offline operations and return changes since the client's cursor.
+
+    Body: {"cursor": "...", "ops": [{"id", "type": "status", "delivery_id", "status", "client_ts"}, ...]}
+    """
+    data = request.get_json(silent=True) or {}
+    ops = data.get('ops') or []
+    if not isinstance(ops, list):
+        return jsonify({"error": _("Operations must be a list")}), 400
+    if len(ops) > Config.SYNC_MAX_OPERATIONS:
+        return jsonify({"error": _("Too many operations in one batch")}), 413
+    try:
+        return jsonify(SyncService.sync(session['user_id'], ops, data.get('cursor')))
+    except Exception as e:
+        logger.error(f"Error syncing driver {session['user_id']}: {str(e)}")
+        return jsonify({"error": _("Internal server error")}), 500
+
+@driver_bp.route('/api/manifest')
+@login_required
+@role_required('driver')
+def manifest():
+    """The driver's day manifest, answered with 304 while the client's ETag is current"""
+    delivery_date = request.args.get('date') or date.today().isoformat()
+    try:
+        datetime.strptime(delivery_date, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": _("Invalid date format")}), 400
+    try:
+        body, etag = ManifestService.get_manifest(session['user_id'], delivery_date)
+    except Exception as e:
+        logger.error(f"Error building driver manifest: {str(e)}")
+        return jsonify({"error": _("Internal server error")}), 500
+    response = jsonify(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
@@ -4,17 +4,42 @@ from datetime import datetime, date, timedelta
 from typing import Dict, Any
 import logging
 
-from app.models.addresses import get_all_addresses, create_address, get_address_by_id, update_address
+from app.models.addresses import get_all_addresses, get_addresses_page, create_address, get_address_by_id, update_address
 from app.models.users import get_all_drivers, get_user_by_id
 from app.services.delivery_service import DeliveryService
+from app.services.address_dedup_service import AddressDedupService
+from app.services.scheduling_service import SchedulingService
+from app.services.dispatch_service import DispatchService
+from app.services.route_service import RouteService
+from app.services.zone_service import ZoneService, METHODS as ZONE_METHODS
+from app.services.location_service import LocationService
+from app.services.live_eta_service import LiveEtaService
+from app.templating import Deferred
 from app.middleware import login_required, role_required, rate_limit_by_ip
-from app.utils import validate_email, sanitize_input, format_datetime, get_google_maps_api_key, get_warehouse_location
+from app.utils import (validate_email, sanitize_input, format_datetime, get_google_maps_api_key, get_warehouse_location,
+                       get_page_size, decode_cursor, keyset_condition, build_keyset_page)
 from app import mysql
 
 logger = logging.getLogger(__name__)
 
 employee_bp = Blueprint('employee', __name__, url_prefix='/employee')
 
+def _conflict_message(conflicts):
+    """Build a flash message describing driver schedule conflicts"""
+    parts = []
+    for conflict in conflicts:
+        if conflict['type'] == 'overlap':
+            parts.append(_("overlaps delivery #%(id)s (%(start)s-%(end)s)",
+                           id=conflict['delivery_id'], start=conflict['start'], end=conflict['end']))
+        else:
+            parts.append(_("only %(gap)s min after/before delivery #%(id)s (%(start)s-%(end)s), "
+                           "about %(travel)s min of travel needed",
+                           gap=conflict['gap_minutes'], id=conflict['delivery_id'],
+                           start=conflict['start'], end=conflict['end'],
+                           travel=conflict['travel_minutes']))
+    return _("The driver is not available: %(details)s. Tick \"Schedule anyway\" to override.",
+             details='; '.join(parts))
+
 @employee_bp.route('/dashboard')
 @login_required
 @role_required('employee', 'manager')
@@ -181,6 +206,16 @@ def addresses():
                 flash(_("All fields are required"), "danger")
                 return redirect(url_for('employee.addresses'))
 
+            # Suggest reusing an existing address instead of inserting a duplicate
+            if not request.form.get('allow_duplicate'):
+                existing = AddressDedupService.suggest_merge(street, city, zip_code, lat, lon)
+                if existing:
+                    flash(_("This address looks like an existing one: %(label)s (%(street)s, %(city)s). "
+                            "Use the existing address or tick 'Save anyway' to add it.",
+                            label=existing['label'], street=existing['street_address'],
+                            city=existing['city']), "warning")
+                    return redirect(url_for('employee.addresses'))
+
             # Create address
             address_id = create_address(
                 label=label,
@@ -200,8 +235,8 @@ def addresses():
             flash(_("Error processing address"), "danger")
         return redirect(url_for('employee.addresses'))
 
-    addresses = get_all_addresses()
-    return render_template('employee/addresses.html', addresses=addresses)
+    page = get_addresses_page(request.args.get('cursor'), request.args.get('per_page'))
+    return render_template('employee/addresses.html', addresses=page['items'], page=page)
 
 @employee_bp.route('/address/<int:address_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -282,6 +317,14 @@ def schedule():
                 flash(_("Invalid driver or address"), "danger")
                 return redirect(url_for('employee.schedule'))
 
+            if not request.form.get('allow_conflicts'):
+                conflicts = SchedulingService.check_delivery(
+                    int(driver_id), delivery_date, start_time, end_time, int(address_id)
+                )
+                if conflicts:
+                    flash(_conflict_message(conflicts), "warning")
+                    return redirect(url_for('employee.schedule'))
+
             # Create delivery
             delivery_id = DeliveryService.create_delivery(
                 driver_id=int(driver_id),
@@ -301,14 +344,15 @@ def schedule():
             flash(_("Error processing delivery schedule"), "danger")
         return redirect(url_for('employee.schedule'))
 
-    drivers = get_all_drivers()
-    addresses = get_all_addresses()
+    # Only queried when the cached option lists have to be rebuilt
+    drivers = Deferred(get_all_drivers)
+    addresses = Deferred(get_all_addresses)
     today = date.today().isoformat()
     warehouse_location = get_warehouse_location()
     google_maps_api_key = get_google_maps_api_key()
     
     # Handle pre-selected address from query parameters
-    selected_address_id = request.args.get('address_id')
+    selected_address_id = request.args.get('address_id', type=int)
 
     return render_template('employee/schedule.html',
                      drivers=drivers,
@@ -335,7 +379,11 @@ def calendar():
                 filter_date = None
                 flash(_("Invalid date format"), "warning")
 
-        # Get deliveries with enhanced filtering
+        # Get one page of deliveries with enhanced filtering
+        per_page = get_page_size(request.args.get('per_page'))
+        after, direction = decode_cursor(request.args.get('cursor'))
+        descending = direction == 'prev'
+        order = 'DESC' if descending else 'ASC'
         cursor = None
         try:
             cursor = mysql.connection.cursor()
@@ -358,11 +406,23 @@ def calendar():
             if filter_status:
                 query += " AND d.status = %s"
                 params.append(filter_status)
+            if after:
+                condition, seek_params = keyset_condition(
+                    ['d.delivery_date', 'd.start_time', 'd.id'], after, descending
+                )
+                query += f" AND {condition}"
+                params.extend(seek_params)
                 
-            query += " ORDER BY d.delivery_date, d.start_time"
+            query += f" ORDER BY d.delivery_date {order}, d.start_time {order}, d.id {order} LIMIT %s"
+            params.append(per_page + 1)
             
             cursor.execute(query, tuple(params))
-            deliveries = cursor.fetchall()
+            page = build_keyset_page(
+                cursor.fetchall(), per_page,
+                lambda d: [d['delivery_date'], d['start_time'], d['id']],
+                direction, after is not None
+            )
+            deliveries = page['items']
             
             # Format datetime fields
             for delivery in deliveries:
@@ -391,11 +451,39 @@ def calendar():
         
         return render_template('employee/calendar.html', 
                              schedule=schedule, 
-                             drivers=drivers)
+                             drivers=drivers,
+                             page=page)
     except Exception as e:
         logger.error(f"Error loading calendar: {str(e)}", exc_info=True)
         flash(_("Error loading calendar"), "danger")
-        return render_template('employee/calendar.html', schedule={}, drivers=[])
+        return render_template('employee/calendar.html', schedule={}, drivers=[], page=None)
+
+@employee_bp.route('/api/calendar')
+@login_required
+@role_required('employee', 'manager')
+def calendar_data():
+    """Deliveries for the visible calendar window as a columnar payload"""
+    try:
+        start = datetime.strptime(request.args.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(request.args.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": _("Start and end dates (YYYY-MM-DD) are required")}), 400
+
+    max_days = current_app.config.get('CALENDAR_MAX_WINDOW_DAYS', 62)
+    if end < start or (end - start).days >= max_days:
+        return jsonify({"error": _("Calendar window must be between 1 and %(days)s days", days=max_days)}), 400
+
+    try:
+        payload = DeliveryService.get_calendar_window(
+            start.isoformat(),
+            end.isoformat(),
+            driver_filter=request.args.get('driver'),
+            status_filter=request.args.get('status')
+        )
+        return jsonify(payload)
+    except Exception as e:
+        logger.error(f"Error fetching calendar window: {str(e)}", exc_info=True)
+        return jsonify({"error": _("Error loading calendar")}), 500
 
 @employee_bp.route('/delivery/<int:delivery_id>/delete', methods=['POST'])
 @login_required
@@ -428,6 +516,15 @@ def edit_delivery(delivery_id):
                 flash(_("All fields are required"), "danger")
                 return redirect(url_for('employee.edit_delivery', delivery_id=delivery_id))
 
+            if not request.form.get('allow_conflicts'):
+                conflicts = SchedulingService.check_delivery(
+                    int(driver_id), delivery_date, start_time, end_time, int(address_id),
+                    exclude_id=delivery_id
+                )
+                if conflicts:
+                    flash(_conflict_message(conflicts), "warning")
+                    return redirect(url_for('employee.edit_delivery', delivery_id=delivery_id))
+
             # Update delivery
             if DeliveryService.update_delivery(
                 delivery_id=delivery_id,
@@ -562,6 +659,121 @@ def optimize_route(driver_id):
     except Exception as e:
         return jsonify({"error": _("Error optimizing route")}), 500
 
+@employee_bp.route('/api/route-timeline/<int:driver_id>')
+@login_required
+@role_required('employee', 'manager')
+def route_timeline(driver_id):
+    """Arrival times, slack and return time for a driver's planned route"""
+    delivery_date = request.args.get('date')
+    try:
+        datetime.strptime(delivery_date or '', '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": _("Invalid date format")}), 400
+
+    try:
+        return jsonify(RouteService.get_timeline(driver_id, delivery_date))
+    except Exception as e:
+        logger.error(f"Error building route timeline: {str(e)}", exc_info=True)
+        return jsonify({"error": _("Error building route timeline")}), 500
+
+@employee_bp.route('/api/zones')
+@login_required
+@role_required('employee', 'manager')
+def delivery_zones():
+    """Geographic zones of a day's deliveries with per-zone workload"""
+    delivery_date = request.args.get('date')
+    try:
+        datetime.strptime(delivery_date or '', '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": _("Invalid date format")}), 400
+
+    method = request.args.get('method', 'kmeans')
+    if method not in ZONE_METHODS:
+        return jsonify({"error": _("Invalid clustering method")}), 400
+    k = request.args.get('k', type=int)
+    if k is not None and not 1 <= k <= 50:
+        return jsonify({"error": _("Number of zones must be between 1 and 50")}), 400
+
+    try:
+        return jsonify(ZoneService.get_zones(
+            delivery_date, k, method, request.args.get('balanced') in ('1', 'true')
+        ))
+    except Exception as e:
+        logger.error(f"Error clustering deliveries: {str(e)}", exc_info=True)
+        return jsonify({"error": _("Error clustering deliveries")}), 500
+
+@employee_bp.route('/api/driver-positions')
+@login_required
+@role_required('employee', 'manager')
+def driver_positions():
+    """Latest reported GPS position of every active driver"""
+    try:
+        drivers = get_all_drivers()
+        positions = LocationService.get_latest_positions([d['id'] for d in drivers])
+        return jsonify([
+            dict(positions[d['id']], name=d['name'])
+            for d in drivers if d['id'] in positions
+        ])
+    except Exception as e:
+        logger.error(f"Error getting driver positions: {str(e)}")
+        return jsonify({"error": _("Internal server error")}), 500
+
+@employee_bp.route('/api/live-etas')
+@login_required
+@role_required('employee', 'manager')
+def live_etas():
+    """Latest published live ETAs of every driver on the road today"""
+    try:
+        drivers = get_all_drivers()
+        snapshots = LiveEtaService.get_many([d['id'] for d in drivers])
+        return jsonify([
+            dict(snapshots[d['id']], name=d['name'])
+            for d in drivers if d['id'] in snapshots
+        ])
+    except Exception as e:
+        logger.error(f"Error getting live ETAs: {str(e)}")
+        return jsonify({"error": _("Internal server error")}), 500
+
+@employee_bp.route('/api/dispatch/preview')
+@login_required
+@role_required('employee', 'manager')
+def dispatch_preview():
+    """Plan driver assignments for a day's pending deliveries without saving them"""
+    delivery_date = request.args.get('date')
+    try:
+        datetime.strptime(delivery_date or '', '%Y-%m-%d')
+    except ValueError:
+        return jsonify({"error": _("Invalid date format")}), 400
+
+    try:
+        return jsonify(DispatchService.preview(delivery_date, session['user_id']))
+    except Exception as e:
+        logger.error(f"Error planning dispatch: {str(e)}", exc_info=True)
+        return jsonify({"error": _("Error planning dispatch")}), 500
+
+@employee_bp.route('/api/dispatch/commit', methods=['POST'])
+@login_required
+@role_required('employee', 'manager')
+def dispatch_commit():
+    """Apply a previewed dispatch plan in one transaction"""
+    data = request.get_json() or {}
+    token = data.get('token')
+    if not token:
+        return jsonify({"error": _("Preview token is required")}), 400
+
+    result = DispatchService.commit_plan(token, session['user_id'])
+    if result['success']:
+        return jsonify({
+            "success": True,
+            "message": _("Successfully updated {} deliveries").format(result['updated_count']),
+            "updated_count": result['updated_count']
+        })
+    if result['reason'] == 'expired':
+        return jsonify({"error": _("The dispatch preview has expired, please plan again")}), 410
+    if result['reason'] == 'stale':
+        return jsonify({"error": _("Deliveries changed since the preview, please plan again")}), 409
+    return jsonify({"error": _("Error applying dispatch plan")}), 500
+
 @employee_bp.route('/map-config', methods=['POST'])
 @login_required
 @role_required('employee', 'manager')
@@ -782,6 +994,20 @@ def bulk_operations():
         if not operation or not delivery_ids:
             return jsonify({"error": _("Operation and delivery IDs are required")}), 400
         
+        # Validate moves against the target drivers' days before writing
+        if operation in ('reschedule', 'assign_driver') and not data.get('force'):
+            conflicts = SchedulingService.validate_bulk(
+                delivery_ids,
+                new_date=data.get('new_date') if operation == 'reschedule' else None,
+                new_driver_id=data.get('driver_id') if operation == 'assign_driver' else None
+            )
+            if conflicts:
+                return jsonify({
+                    "error": _("Some deliveries conflict with the driver's schedule"),
+                    "conflicts": {str(delivery_id): items for delivery_id, items in conflicts.items()}
+                }), 409
+        
+        old_slots = SchedulingService.invalidate_deliveries(delivery_ids)
         cursor = mysql.connection.cursor()
         success_count = 0
         
@@ -828,6 +1054,8 @@ def bulk_operations():
         
         mysql.connection.commit()
         cursor.close()
+        new_slots = SchedulingService.invalidate_deliveries(delivery_ids)
+        RouteService.sync(old_slots + new_slots)
         
         return jsonify({
             "success": True,
@@ -4,6 +4,7 @@ from datetime import datetime, date, timedelta
 from app.services.delivery_service import DeliveryService
 from app.services.user_service import UserService
 from app.services.address_service import AddressService
+from app.services.address_dedup_service import AddressDedupService
 from app.services.analytics_service import AnalyticsService
 from app.middleware import login_required, role_required, rate_limit_by_ip
 from app.utils import format_datetime
@@ -109,6 +110,16 @@ def addresses():
                 flash(_("All fields are required"), "danger")
                 return redirect(url_for('manager.addresses'))
 
+            # Suggest reusing an existing address instead of inserting a duplicate
+            if not request.form.get('allow_duplicate'):
+                existing = AddressDedupService.suggest_merge(street, city, zip_code, lat, lon)
+                if existing:
+                    flash(_("This address looks like an existing one: %(label)s (%(street)s, %(city)s). "
+                            "Use the existing address or tick 'Save anyway' to add it.",
+                            label=existing['label'], street=existing['street_address'],
+                            city=existing['city']), "warning")
+                    return redirect(url_for('manager.addresses'))
+
             # Create address
             address_id = create_address(
                 label=label,
@@ -130,8 +141,8 @@ def addresses():
         return redirect(url_for('manager.addresses'))
     
     try:
-        addresses = AddressService.get_all_addresses()
-        return render_template('manager/addresses.html', addresses=addresses)
+        page = AddressService.get_addresses_page(request.args.get('cursor'), request.args.get('per_page'))
+        return render_template('manager/addresses.html', addresses=page['items'], page=page)
     except Exception as e:
         logger.error(f"Error loading addresses: {str(e)}")
         flash(_("Error loading addresses"), "danger")
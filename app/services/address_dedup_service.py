@@ -0,0 +1,302 @@
+from typing import Optional, List, Dict, Any, Tuple
+from app import mysql
+from app.utils import calculate_distance
+from app.templating import invalidate_fragments
+from math import cos, floor, radians
+import logging
+import MySQLdb.cursors
+import os
+import re
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Two addresses closer than this (in meters) are considered the same place
+# when they also share a ZIP code or a normalized street.
+DUPLICATE_RADIUS_M = float(os.environ.get('ADDRESS_DUPLICATE_RADIUS_M', 25))
+
+# Common street-type spellings collapsed to a single token (Czech + English)
+STREET_ABBREVIATIONS = {
+    'ulice': 'ul',
+    'namesti': 'nam',
+    'trida': 'tr',
+    'nabrezi': 'nabr',
+    'street': 'st',
+    'avenue': 'ave',
+    'road': 'rd',
+}
+
+class AddressDedupService:
+    @staticmethod
+    def normalize_text(value: Optional[str]) -> str:
+        """Lowercase, strip diacritics and punctuation, collapse whitespace"""
+        if not value:
+            return ""
+        value = unicodedata.normalize('NFKD', str(value))
+        value = ''.join(c for c in value if not unicodedata.combining(c))
+        value = re.sub(r'[^a-z0-9 ]+', ' ', value.lower())
+        return ' '.join(value.split())
+
+    @staticmethod
+    def normalize_street(street: Optional[str]) -> str:
+        """Normalize a street address, unifying street-type abbreviations"""
+        tokens = AddressDedupService.normalize_text(street).split()
+        return ' '.join(STREET_ABBREVIATIONS.get(t, t) for t in tokens)
+
+    @staticmethod
+    def normalize_zip(zip_code: Optional[str]) -> str:
+        """Keep only the alphanumeric part of a ZIP code ('110 00' -> '11000')"""
+        return re.sub(r'[^0-9A-Za-z]', '', str(zip_code or '')).upper()
+
+    @staticmethod
+    def canonical_key(street: Optional[str], city: Optional[str], zip_code: Optional[str]) -> str:
+        """Build the canonical street/city/zip key used for exact matching"""
+        return '|'.join([
+            AddressDedupService.normalize_zip(zip_code),
+            AddressDedupService.normalize_text(city),
+            AddressDedupService.normalize_street(street)
+        ])
+
+    @staticmethod
+    def _is_duplicate(a: Dict[str, Any], b: Dict[str, Any], radius_m: float) -> Optional[str]:
+        """Return the reason two prepared rows are duplicates, or None"""
+        if a['key'] == b['key']:
+            return 'same_address'
+        if a['lat'] is None or b['lat'] is None:
+            return None
+        if a['zip'] != b['zip'] and a['street'] != b['street']:
+            return None
+        distance_m = calculate_distance(a['lat'], a['lon'], b['lat'], b['lon']) * 1000
+        if distance_m <= radius_m:
+            return 'nearby'
+        return None
+
+    @staticmethod
+    def _prepare(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Attach normalized fields to an address row"""
+        lat = row.get('latitude')
+        lon = row.get('longitude')
+        has_coords = lat is not None and lon is not None
+        return {
+            'id': row.get('id'),
+            'label': row.get('label'),
+            'street_address': row.get('street_address'),
+            'city': row.get('city'),
+            'zip_code': row.get('zip_code'),
+            'key': AddressDedupService.canonical_key(
+                row.get('street_address'), row.get('city'), row.get('zip_code')
+            ),
+            'zip': AddressDedupService.normalize_zip(row.get('zip_code')),
+            'street': AddressDedupService.normalize_street(row.get('street_address')),
+            'lat': float(lat) if has_coords else None,
+            'lon': float(lon) if has_coords else None,
+        }
+
+    @staticmethod
+    def find_duplicates(
+        street: str,
+        city: str,
+        zip_code: str,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None,
+        exclude_id: Optional[int] = None,
+        radius_m: float = DUPLICATE_RADIUS_M
+    ) -> List[Dict[str, Any]]:
+        """Find existing addresses that look like the given one.
+
+        Candidates are fetched by normalized ZIP code (the indexed zip_norm
+        column) or by a small bounding box around the coordinates, then
+        compared on the canonical key and distance.
+        """
+        candidate = AddressDedupService._prepare({
+            'street_address': street, 'city': city, 'zip_code': zip_code,
+            'latitude': lat, 'longitude': lon
+        })
+
+        # Separate UNION branches so each one can use its own index
+        columns = "SELECT id, label, street_address, city, zip_code, latitude, longitude FROM addresses"
+        exclude = " AND id != %s" if exclude_id is not None else ""
+        branches = [f"{columns} WHERE zip_norm = %s{exclude}"]
+        params: List[Any] = [candidate['zip']]
+        if exclude_id is not None:
+            params.append(exclude_id)
+        if candidate['lat'] is not None:
+            dlat = radius_m / 111320.0
+            dlon = dlat / max(cos(radians(candidate['lat'])), 0.01)
+            branches.append(
+                f"{columns} WHERE latitude BETWEEN %s AND %s AND longitude BETWEEN %s AND %s{exclude}"
+            )
+            params.extend([
+                candidate['lat'] - dlat, candidate['lat'] + dlat,
+                candidate['lon'] - dlon, candidate['lon'] + dlon
+            ])
+            if exclude_id is not None:
+                params.append(exclude_id)
+        query = ' UNION '.join(branches) + " ORDER BY id"
+
+        cursor = None
+        try:
+            cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+            cursor.execute(query, tuple(params))
+            rows = cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Error looking up duplicate addresses: {str(e)}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
+
+        matches = []
+        for row in rows:
+            existing = AddressDedupService._prepare(row)
+            reason = AddressDedupService._is_duplicate(candidate, existing, radius_m)
+            if reason:
+                matches.append({
+                    'id': existing['id'],
+                    'label': existing['label'],
+                    'street_address': existing['street_address'],
+                    'city': existing['city'],
+                    'zip_code': existing['zip_code'],
+                    'reason': reason
+                })
+        # Exact key matches are the stronger suggestion
+        matches.sort(key=lambda m: (m['reason'] != 'same_address', m['id']))
+        return matches
+
+    @staticmethod
+    def suggest_merge(
+        street: str,
+        city: str,
+        zip_code: str,
+        lat: Optional[float] = None,
+        lon: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Return the best existing address to reuse instead of inserting, if any"""
+        matches = AddressDedupService.find_duplicates(street, city, zip_code, lat, lon)
+        return matches[0] if matches else None
+
+    @staticmethod
+    def find_duplicate_groups(radius_m: float = DUPLICATE_RADIUS_M) -> List[Dict[str, Any]]:
+        """Scan the whole address table for duplicate clusters.
+
+        Exact duplicates are found by sorting on the canonical key; nearby
+        duplicates by bucketing coordinates into a grid whose cells are at
+        least ``radius_m`` wide and comparing only neighbouring cells. Both
+        passes avoid pairwise comparison of the whole table.
+        """
+        cursor = None
+        try:
+            cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+            cursor.execute("""
+                SELECT id, label, street_address, city, zip_code, latitude, longitude
+                FROM addresses
+            """)
+            rows = [AddressDedupService._prepare(row) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error scanning addresses for duplicates: {str(e)}")
+            return []
+        finally:
+            if cursor:
+                cursor.close()
+
+        parent = {row['id']: row['id'] for row in rows}
+        reasons: Dict[int, str] = {}
+
+        def find(x: int) -> int:
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        def union(a: int, b: int, reason: str) -> None:
+            ra, rb = find(a), find(b)
+            if ra == rb:
+                return
+            keep, drop = min(ra, rb), max(ra, rb)
+            parent[drop] = keep
+            if reasons.get(keep) != 'same_address':
+                reasons[keep] = reasons.get(drop) if reasons.get(drop) == 'same_address' else reason
+
+        # Pass 1: sort by canonical key, equal neighbours are exact duplicates
+        by_key = sorted(rows, key=lambda r: (r['key'], r['id']))
+        for prev, cur in zip(by_key, by_key[1:]):
+            if prev['key'] and prev['key'] == cur['key']:
+                union(prev['id'], cur['id'], 'same_address')
+
+        # Pass 2: grid blocking on coordinates
+        located = [r for r in rows if r['lat'] is not None]
+        if located:
+            max_lat = max(abs(r['lat']) for r in located)
+            dlat = radius_m / 111320.0
+            dlon = dlat / max(cos(radians(max_lat)), 0.01)
+            grid: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+            for row in located:
+                cell = (floor(row['lat'] / dlat), floor(row['lon'] / dlon))
+                grid.setdefault(cell, []).append(row)
+
+            for (cy, cx), bucket in grid.items():
+                neighbours = []
+                for dy in (0, 1):
+                    for dx in (-1, 0, 1):
+                        # Visit each unordered pair of cells once
+                        if dy == 0 and dx < 0:
+                            continue
+                        neighbours.append(grid.get((cy + dy, cx + dx), []))
+                for i, a in enumerate(bucket):
+                    for j, other in enumerate(neighbours):
+                        start = i + 1 if j == 0 and other is bucket else 0
+                        for b in other[start:]:
+                            if find(a['id']) == find(b['id']):
+                                continue
+                            reason = AddressDedupService._is_duplicate(a, b, radius_m)
+                            if reason:
+                                union(a['id'], b['id'], reason)
+
+        clusters: Dict[int, List[Dict[str, Any]]] = {}
+        for row in rows:
+            clusters.setdefault(find(row['id']), []).append(row)
+
+        groups = []
+        for root, members in clusters.items():
+            if len(members) < 2:
+                continue
+            members.sort(key=lambda r: r['id'])
+            groups.append({
+                'keep_id': members[0]['id'],
+                'duplicate_ids': [m['id'] for m in members[1:]],
+                'reason': reasons.get(root, 'nearby'),
+                'addresses': [
+                    {k: m[k] for k in ('id', 'label', 'street_address', 'city', 'zip_code')}
+                    for m in members
+                ]
+            })
+        groups.sort(key=lambda g: g['keep_id'])
+        return groups
+
+    @staticmethod
+    def merge_addresses(keep_id: int, duplicate_ids: List[int]) -> bool:
+        """Point deliveries at ``keep_id`` and delete the duplicates in one transaction"""
+        duplicate_ids = [d for d in duplicate_ids if d != keep_id]
+        if not duplicate_ids:
+            return False
+
+        placeholders = ', '.join(['%s'] * len(duplicate_ids))
+        cursor = mysql.connection.cursor()
+        try:
+            cursor.execute(
+                f"UPDATE deliveries SET address_id = %s WHERE address_id IN ({placeholders})",
+                (keep_id, *duplicate_ids)
+            )
+            cursor.execute(
+                f"DELETE FROM addresses WHERE id IN ({placeholders})",
+                tuple(duplicate_ids)
+            )
+            mysql.connection.commit()
+            invalidate_fragments('addresses')
+            return True
+        except Exception as e:
+            mysql.connection.rollback()
+            logger.error(f"Error merging addresses into {keep_id}: {str(e)}")
+            return False
+        finally:
+            cursor.close()
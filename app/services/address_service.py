@@ -1,6 +1,7 @@
 from typing import Optional, List, Dict, Any
 from app import mysql
 from app.utils import sanitize_input
+from app.templating import invalidate_fragments
 import logging
 import requests
 from requests.exceptions import RequestException
@@ -75,6 +76,7 @@ class AddressService:
             """, (label, street, city, zip_code, lat, lon, user_id))
             
             mysql.connection.commit()
+            invalidate_fragments('addresses')
             return cursor.lastrowid
         except Exception as e:
             mysql.connection.rollback()
@@ -139,6 +141,7 @@ class AddressService:
             
             cursor.execute(query, tuple(params))
             mysql.connection.commit()
+            invalidate_fragments('addresses')
             return cursor.rowcount > 0
         except Exception as e:
             mysql.connection.rollback()
@@ -194,4 +197,10 @@ class AddressService:
     def get_all_addresses() -> list:
         """Get all addresses with their details."""
         from app.models.addresses import get_all_addresses as model_get_all_addresses
-        return model_get_all_addresses()
\ No newline at end of file
+        return model_get_all_addresses()
+
+    @staticmethod
+    def get_addresses_page(cursor_token: Optional[str] = None, per_page: Optional[int] = None) -> Dict[str, Any]:
+        """Get one page of addresses using keyset pagination."""
+        from app.models.addresses import get_addresses_page as model_get_addresses_page
+        return model_get_addresses_page(cursor_token, per_page)
@@ -2,18 +2,27 @@ from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
 from app import mysql
 from app.models.addresses import get_address_by_id
-from app.utils import format_datetime, parse_datetime
+from app.services.scheduling_service import SchedulingService
+from app.services.route_service import RouteService
+from app.services.routing_service import RoutingService
+from app.utils import format_datetime
 import requests
 from requests.exceptions import RequestException
 import logging
+import MySQLdb.cursors
 import os
 
 logger = logging.getLogger(__name__)
 
+STATS_COLUMNS = ('total_deliveries', 'completed_deliveries', 'pending_deliveries',
+                 'in_progress_deliveries', 'cancelled_deliveries')
+
 class DeliveryService:
     @staticmethod
     def calculate_eta(origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Optional[int]:
-        """Calculate ETA using Google Maps API"""
+        """Calculate ETA using the local road network, or Google Maps API without one"""
+        if RoutingService.available():
+            return RoutingService.travel_minutes(origin_lat, origin_lng, dest_lat, dest_lng)
         try:
             params = {
                 'origins': f"{origin_lat},{origin_lng}",
@@ -74,7 +83,11 @@ class DeliveryService:
             ))
             
             mysql.connection.commit()
-            return cursor.lastrowid
+            delivery_id = cursor.lastrowid
+            SchedulingService.invalidate(driver_id, date)
+            # Replace the single-leg estimate with the stop's place in the route
+            RouteService.update_etas(driver_id, date)
+            return delivery_id
         except Exception as e:
             mysql.connection.rollback()
             logger.error(f"Error creating delivery: {str(e)}")
@@ -97,7 +110,12 @@ class DeliveryService:
                 WHERE id = %s
             """, (status, delivery_id))
             mysql.connection.commit()
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+            if updated:
+                # Cancelled deliveries free their slot in the driver's day
+                slots = SchedulingService.invalidate_deliveries([delivery_id])
+                RouteService.sync(slots)
+            return updated
         except Exception as e:
             mysql.connection.rollback()
             logger.error(f"Error updating delivery status: {str(e)}")
@@ -194,13 +212,12 @@ class DeliveryService:
             
             deliveries = cursor.fetchall()
             
-            # Simple optimization: sort by start time and ETA
+            # Follow the cached plan, which is repaired incrementally as stops change
+            order = RouteService.get_route(driver_id, date)
+            position = {delivery_id: i for i, delivery_id in enumerate(order)}
             optimized = sorted(
                 deliveries,
-                key=lambda x: (
-                    parse_datetime(x['start_time']),
-                    x['eta_minutes'] or float('inf')
-                )
+                key=lambda x: (position.get(x['id'], len(position)), x['id'])
             )
             
             return optimized
@@ -208,28 +225,106 @@ class DeliveryService:
             cursor.close()
 
     @staticmethod
-    def get_driver_stats(driver_id: int) -> Dict[str, Any]:
-        """Get delivery statistics for a specific driver"""
-        cursor = mysql.connection.cursor()
+    def get_driver_stats(
+        driver_id: int,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Delivery counts for a driver, lifetime or for a delivery date range.
+
+        Reads the counters maintained by the deliveries triggers instead of
+        scanning the driver's deliveries.
+        """
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
         try:
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_deliveries,
-                    COUNT(CASE WHEN status = 'completed' THEN 1 END) as completed_deliveries,
-                    COUNT(CASE WHEN status = 'pending' THEN 1 END) as pending_deliveries,
-                    COUNT(CASE WHEN status = 'in_progress' THEN 1 END) as in_progress_deliveries,
-                    COUNT(CASE WHEN status = 'cancelled' THEN 1 END) as cancelled_deliveries
+            if start_date or end_date:
+                cursor.execute(f"""
+                    SELECT {', '.join(f'COALESCE(SUM({c}), 0) AS {c}' for c in STATS_COLUMNS)}
+                    FROM driver_stats_daily
+                    WHERE driver_id = %s AND delivery_date BETWEEN %s AND %s
+                """, (driver_id, start_date or '1000-01-01', end_date or '9999-12-31'))
+            else:
+                cursor.execute(f"""
+                    SELECT {', '.join(STATS_COLUMNS)}
+                    FROM driver_stats
+                    WHERE driver_id = %s
+                """, (driver_id,))
+            result = cursor.fetchone() or {}
+            return {c: int(result.get(c) or 0) for c in STATS_COLUMNS}
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def reconcile_driver_stats(repair: bool = False) -> List[Dict[str, Any]]:
+        """Compare the counters with the deliveries table, rebuilding drifted drivers.
+
+        Returns one entry per driver whose lifetime or daily counters differ.
+        """
+        sums = ', '.join([
+            'COUNT(*) AS total_deliveries',
+            "SUM(status = 'pending') AS pending_deliveries",
+            "SUM(status = 'in_progress') AS in_progress_deliveries",
+            "SUM(status = 'completed') AS completed_deliveries",
+            "SUM(status = 'cancelled') AS cancelled_deliveries"
+        ])
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute(f"""
+                SELECT driver_id, delivery_date, {sums}
                 FROM deliveries
-                WHERE driver_id = %s
-            """, (driver_id,))
-            result = cursor.fetchone()
-            return {
-                'total_deliveries': result[0] or 0,
-                'completed_deliveries': result[1] or 0,
-                'pending_deliveries': result[2] or 0,
-                'in_progress_deliveries': result[3] or 0,
-                'cancelled_deliveries': result[4] or 0
-            }
+                WHERE driver_id IS NOT NULL AND delivery_date IS NOT NULL
+                GROUP BY driver_id, delivery_date
+            """)
+            actual = {(r['driver_id'], str(r['delivery_date'])): r for r in cursor.fetchall()}
+            cursor.execute(f"SELECT driver_id, delivery_date, {', '.join(STATS_COLUMNS)} FROM driver_stats_daily")
+            stored = {(r['driver_id'], str(r['delivery_date'])): r for r in cursor.fetchall()}
+            cursor.execute(f"""
+                SELECT driver_id, {sums}
+                FROM deliveries
+                WHERE driver_id IS NOT NULL
+                GROUP BY driver_id
+            """)
+            actual_total = {r['driver_id']: r for r in cursor.fetchall()}
+            cursor.execute(f"SELECT driver_id, {', '.join(STATS_COLUMNS)} FROM driver_stats")
+            stored_total = {r['driver_id']: r for r in cursor.fetchall()}
+
+            def counts(row):
+                return [int(row[c] or 0) for c in STATS_COLUMNS] if row else [0] * len(STATS_COLUMNS)
+
+            drift: Dict[int, Dict[str, Any]] = {}
+            for key in set(actual) | set(stored):
+                if counts(actual.get(key)) != counts(stored.get(key)):
+                    drift.setdefault(key[0], {'driver_id': key[0], 'dates': [], 'lifetime': False})['dates'].append(key[1])
+            for driver_id in set(actual_total) | set(stored_total):
+                if counts(actual_total.get(driver_id)) != counts(stored_total.get(driver_id)):
+                    drift.setdefault(driver_id, {'driver_id': driver_id, 'dates': [], 'lifetime': False})['lifetime'] = True
+            if not repair:
+                return sorted(drift.values(), key=lambda d: d['driver_id'])
+
+            # INSERT ... SELECT locks the source rows, so concurrent writes wait for the rebuild
+            for driver_id in drift:
+                try:
+                    cursor.execute("DELETE FROM driver_stats_daily WHERE driver_id = %s", (driver_id,))
+                    cursor.execute("DELETE FROM driver_stats WHERE driver_id = %s", (driver_id,))
+                    cursor.execute(f"""
+                        INSERT INTO driver_stats_daily (driver_id, delivery_date, {', '.join(STATS_COLUMNS)})
+                        SELECT driver_id, delivery_date, {sums}
+                        FROM deliveries
+                        WHERE driver_id = %s AND delivery_date IS NOT NULL
+                        GROUP BY driver_id, delivery_date
+                    """, (driver_id,))
+                    cursor.execute(f"""
+                        INSERT INTO driver_stats (driver_id, {', '.join(STATS_COLUMNS)})
+                        SELECT driver_id, {sums}
+                        FROM deliveries
+                        WHERE driver_id = %s
+                        GROUP BY driver_id
+                    """, (driver_id,))
+                    mysql.connection.commit()
+                except Exception as e:
+                    mysql.connection.rollback()
+                    logger.error(f"Error repairing stats of driver {driver_id}: {str(e)}")
+            return sorted(drift.values(), key=lambda d: d['driver_id'])
         finally:
             cursor.close()
 
@@ -286,6 +381,92 @@ class DeliveryService:
         finally:
             cursor.close()
 
+    @staticmethod
+    def get_calendar_window(
+        start_date: str,
+        end_date: str,
+        driver_filter: Optional[str] = None,
+        status_filter: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get deliveries in [start_date, end_date] as a compact columnar payload.
+
+        Deliveries are returned as parallel arrays; days are offsets from
+        start_date, times are minutes after midnight, and drivers, addresses
+        and statuses are referenced by index into their own tables.
+        """
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            query = """
+                SELECT
+                    d.id,
+                    DATEDIFF(d.delivery_date, %s) AS day,
+                    TIME_TO_SEC(d.start_time) DIV 60 AS start_min,
+                    TIME_TO_SEC(d.end_time) DIV 60 AS end_min,
+                    d.status,
+                    d.driver_id,
+                    u.name AS driver_name,
+                    d.address_id,
+                    a.label,
+                    a.street_address,
+                    a.city
+                FROM deliveries d
+                JOIN users u ON d.driver_id = u.id
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.delivery_date BETWEEN %s AND %s
+            """
+            params = [start_date, start_date, end_date]
+            if driver_filter:
+                query += " AND u.name LIKE %s"
+                params.append(f"%{driver_filter}%")
+            if status_filter:
+                query += " AND d.status = %s"
+                params.append(status_filter)
+            query += " ORDER BY d.delivery_date, d.start_time, d.id"
+            cursor.execute(query, tuple(params))
+
+            statuses = ['pending', 'in_progress', 'completed', 'cancelled']
+            status_index = {s: i for i, s in enumerate(statuses)}
+            drivers = {'id': [], 'name': []}
+            addresses = {'id': [], 'label': [], 'street': [], 'city': []}
+            driver_index: Dict[int, int] = {}
+            address_index: Dict[int, int] = {}
+            columns = {'id': [], 'day': [], 'start': [], 'end': [],
+                       'status': [], 'driver': [], 'address': []}
+
+            for row in cursor.fetchall():
+                if row['driver_id'] not in driver_index:
+                    driver_index[row['driver_id']] = len(drivers['id'])
+                    drivers['id'].append(row['driver_id'])
+                    drivers['name'].append(row['driver_name'])
+                if row['address_id'] not in address_index:
+                    address_index[row['address_id']] = len(addresses['id'])
+                    addresses['id'].append(row['address_id'])
+                    addresses['label'].append(row['label'])
+                    addresses['street'].append(row['street_address'])
+                    addresses['city'].append(row['city'])
+                if row['status'] not in status_index:
+                    status_index[row['status']] = len(statuses)
+                    statuses.append(row['status'])
+
+                columns['id'].append(row['id'])
+                columns['day'].append(int(row['day']))
+                columns['start'].append(int(row['start_min']) if row['start_min'] is not None else None)
+                columns['end'].append(int(row['end_min']) if row['end_min'] is not None else None)
+                columns['status'].append(status_index[row['status']])
+                columns['driver'].append(driver_index[row['driver_id']])
+                columns['address'].append(address_index[row['address_id']])
+
+            return {
+                'start': start_date,
+                'end': end_date,
+                'statuses': statuses,
+                'drivers': drivers,
+                'addresses': addresses,
+                'deliveries': columns
+            }
+        finally:
+            cursor.close()
+
     @staticmethod
     def get_delivery_by_id(delivery_id: int) -> Optional[Dict[str, Any]]:
         """Get a single delivery by ID"""
@@ -335,6 +516,7 @@ class DeliveryService:
         notes: str
     ) -> bool:
         """Update an existing delivery"""
+        old_slots = SchedulingService.invalidate_deliveries([delivery_id])
         cursor = mysql.connection.cursor()
         try:
             cursor.execute("""
@@ -345,6 +527,8 @@ class DeliveryService:
             """, (driver_id, address_id, date, start_time, end_time, notes, delivery_id))
             
             mysql.connection.commit()
+            SchedulingService.invalidate(driver_id, date)
+            RouteService.sync(old_slots + [(driver_id, date)])
             return cursor.rowcount > 0
         except Exception as e:
             mysql.connection.rollback()
@@ -356,10 +540,12 @@ class DeliveryService:
     @staticmethod
     def delete_delivery(delivery_id: int) -> bool:
         """Delete a delivery"""
+        old_slots = SchedulingService.invalidate_deliveries([delivery_id])
         cursor = mysql.connection.cursor()
         try:
             cursor.execute("DELETE FROM deliveries WHERE id = %s", (delivery_id,))
             mysql.connection.commit()
+            RouteService.sync(old_slots)
             return cursor.rowcount > 0
         except Exception as e:
             mysql.connection.rollback()
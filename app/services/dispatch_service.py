@@ -0,0 +1,389 @@
+from typing import Optional, List, Dict, Any, Tuple
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.models.users import get_all_drivers
+from app.services.scheduling_service import SchedulingService
+from app.services.route_service import RouteService
+from app.services.routing_service import RoutingService
+from app.utils import time_to_minutes, minutes_to_time, get_warehouse_location
+from math import atan2, ceil
+import logging
+import MySQLdb.cursors
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+class DispatchService:
+    """Automatic assignment of a day's pending deliveries to drivers.
+
+    The problem is a capacitated vehicle routing problem with time windows:
+    every driver leaves the warehouse at the start of the shift, must reach
+    each stop before the end of its window, may serve at most a capped
+    number of stops and has to be back before the shift ends. Routes are
+    built with a sweep around the warehouse and then improved with
+    relocate, swap and 2-opt moves until no move helps or the time limit
+    is reached.
+    """
+
+    @staticmethod
+    def _preview_key(token: str) -> str:
+        return f"dispatch_preview:{token}"
+
+    @staticmethod
+    def _load_deliveries(delivery_date: str) -> List[Dict[str, Any]]:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT d.id, d.driver_id, d.address_id, d.start_time, d.end_time, d.updated_at,
+                       a.label, a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.delivery_date = %s AND d.status = 'pending'
+                ORDER BY d.id
+            """, (delivery_date,))
+            return list(cursor.fetchall())
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _build_matrix(points: List[Tuple[float, float]]) -> List[List[int]]:
+        """Travel minutes between every pair of points (index 0 is the warehouse)"""
+        return RoutingService.travel_matrix(points)
+
+    @staticmethod
+    def solve(
+        stops: List[Dict[str, Any]],
+        driver_count: int,
+        matrix: List[List[int]],
+        shift_start: int,
+        shift_end: int,
+        service_minutes: int,
+        max_stops: int,
+        time_limit: float
+    ) -> Tuple[List[List[int]], List[int]]:
+        """Solve the routing problem for prepared stops.
+
+        ``stops[i]`` describes node ``i + 1`` of ``matrix`` and needs
+        ``ready``/``due`` minutes and an ``angle`` around the warehouse.
+        Returns one list of stop indices per driver, in visiting order, and
+        the indices that could not be placed in any route.
+        """
+        deadline = time.monotonic() + time_limit
+        n = len(stops)
+        if not n or not driver_count:
+            return [[] for _ in range(driver_count)], list(range(n))
+
+        # Balance the load: nobody gets much more than an even share
+        cap = max(1, min(max_stops, ceil(n / driver_count * Config.DISPATCH_BALANCE_TOLERANCE)))
+
+        def route_cost(route: List[int]) -> Optional[int]:
+            """Total drive minutes of a route, or None if it breaks a constraint"""
+            if len(route) > cap:
+                return None
+            clock, prev, travel = shift_start, 0, 0
+            for s in route:
+                leg = matrix[prev][s + 1]
+                travel += leg
+                clock = max(clock + leg, stops[s]['ready'])
+                if clock > stops[s]['due']:
+                    return None
+                clock += service_minutes
+                prev = s + 1
+            travel += matrix[prev][0]
+            if clock + matrix[prev][0] > shift_end:
+                return None
+            return travel
+
+        def best_insertion(route: List[int], s: int, current: int) -> Tuple[Optional[int], int]:
+            """Cheapest feasible position for stop s in route, as (delta, position)"""
+            best_delta, best_pos = None, -1
+            for pos in range(len(route) + 1):
+                cost = route_cost(route[:pos] + [s] + route[pos:])
+                if cost is not None and (best_delta is None or cost - current < best_delta):
+                    best_delta, best_pos = cost - current, pos
+            return best_delta, best_pos
+
+        # Sweep construction: start after the widest angular gap so that a
+        # geographic cluster is not split between the first and last driver
+        order = sorted(range(n), key=lambda s: stops[s]['angle'])
+        if n > 1:
+            gaps = [(stops[order[(i + 1) % n]]['angle'] - stops[order[i]]['angle']) % 6.283185307179586
+                    for i in range(n)]
+            widest = max(range(n), key=lambda i: gaps[i])
+            order = order[widest + 1:] + order[:widest + 1]
+
+        target = ceil(n / driver_count)
+        routes: List[List[int]] = [[] for _ in range(driver_count)]
+        costs = [0] * driver_count
+        leftovers = []
+        current = 0
+        for s in order:
+            placed = False
+            while current < driver_count:
+                if len(routes[current]) < target:
+                    delta, pos = best_insertion(routes[current], s, costs[current])
+                    if delta is not None:
+                        routes[current].insert(pos, s)
+                        costs[current] += delta
+                        placed = True
+                        break
+                    if not routes[current]:
+                        break
+                current += 1
+            if not placed:
+                leftovers.append(s)
+
+        # Stops the sweep could not place go wherever they fit cheapest
+        unassigned = []
+        for s in leftovers:
+            best = None
+            for r, route in enumerate(routes):
+                delta, pos = best_insertion(route, s, costs[r])
+                if delta is not None and (best is None or delta < best[0]):
+                    best = (delta, r, pos)
+            if best:
+                delta, r, pos = best
+                routes[r].insert(pos, s)
+                costs[r] += delta
+            else:
+                unassigned.append(s)
+
+        # Local search with first-improvement moves until the deadline
+        improved = True
+        while improved and time.monotonic() < deadline:
+            improved = False
+
+            # Relocate: move one stop to its best position in any route
+            for a in range(driver_count):
+                i = 0
+                while i < len(routes[a]) and time.monotonic() < deadline:
+                    s = routes[a][i]
+                    reduced = routes[a][:i] + routes[a][i + 1:]
+                    reduced_cost = route_cost(reduced)
+                    if reduced_cost is None:
+                        i += 1
+                        continue
+                    gain = costs[a] - reduced_cost
+                    moved = False
+                    for b in range(driver_count):
+                        if b == a:
+                            delta, pos = best_insertion(reduced, s, reduced_cost)
+                        else:
+                            delta, pos = best_insertion(routes[b], s, costs[b])
+                        if delta is not None and delta < gain:
+                            if b == a:
+                                reduced.insert(pos, s)
+                                routes[a], costs[a] = reduced, reduced_cost + delta
+                            else:
+                                routes[a], costs[a] = reduced, reduced_cost
+                                routes[b].insert(pos, s)
+                                costs[b] += delta
+                            improved = moved = True
+                            break
+                    if not moved:
+                        i += 1
+
+            # Swap: exchange two stops between different routes
+            for a in range(driver_count):
+                for b in range(a + 1, driver_count):
+                    if time.monotonic() >= deadline:
+                        break
+                    for i in range(len(routes[a])):
+                        for j in range(len(routes[b])):
+                            ra = routes[a][:i] + [routes[b][j]] + routes[a][i + 1:]
+                            rb = routes[b][:j] + [routes[a][i]] + routes[b][j + 1:]
+                            ca, cb = route_cost(ra), route_cost(rb)
+                            if ca is not None and cb is not None and ca + cb < costs[a] + costs[b]:
+                                routes[a], routes[b], costs[a], costs[b] = ra, rb, ca, cb
+                                improved = True
+
+            # 2-opt: reverse a segment within one route
+            for r in range(driver_count):
+                route = routes[r]
+                for i in range(len(route) - 1):
+                    if time.monotonic() >= deadline:
+                        break
+                    for j in range(i + 1, len(route)):
+                        candidate = route[:i] + route[i:j + 1][::-1] + route[j + 1:]
+                        cost = route_cost(candidate)
+                        if cost is not None and cost < costs[r]:
+                            route, costs[r] = candidate, cost
+                            improved = True
+                routes[r] = route
+
+            # Improved routes may now have room for stops left out so far
+            for s in list(unassigned):
+                best = None
+                for r, route in enumerate(routes):
+                    delta, pos = best_insertion(route, s, costs[r])
+                    if delta is not None and (best is None or delta < best[0]):
+                        best = (delta, r, pos)
+                if best:
+                    delta, r, pos = best
+                    routes[r].insert(pos, s)
+                    costs[r] += delta
+                    unassigned.remove(s)
+                    improved = True
+
+        return routes, unassigned
+
+    @staticmethod
+    def preview(delivery_date: str, created_by: Optional[int] = None) -> Dict[str, Any]:
+        """Plan the day's pending deliveries and store the plan for commit_plan"""
+        drivers = get_all_drivers()
+        deliveries = DispatchService._load_deliveries(delivery_date)
+        warehouse = get_warehouse_location()
+        shift_start = time_to_minutes(Config.DISPATCH_SHIFT_START)
+        shift_end = time_to_minutes(Config.DISPATCH_SHIFT_END)
+
+        located = [d for d in deliveries if d['latitude'] is not None and d['longitude'] is not None]
+        points = [(warehouse['lat'], warehouse['lng'])]
+        stops = []
+        for d in located:
+            lat, lng = float(d['latitude']), float(d['longitude'])
+            ready = time_to_minutes(d['start_time'])
+            due = time_to_minutes(d['end_time'])
+            points.append((lat, lng))
+            stops.append({
+                'ready': ready if ready is not None else shift_start,
+                'due': due if due is not None else shift_end,
+                'angle': atan2(lat - warehouse['lat'], lng - warehouse['lng'])
+            })
+
+        started = time.monotonic()
+        matrix = DispatchService._build_matrix(points)
+        routes, unassigned = DispatchService.solve(
+            stops, len(drivers), matrix,
+            shift_start, shift_end, Config.DISPATCH_SERVICE_MINUTES,
+            Config.DISPATCH_MAX_STOPS_PER_DRIVER, Config.DISPATCH_TIME_LIMIT
+        )
+        elapsed_ms = int((time.monotonic() - started) * 1000)
+
+        plan_routes = []
+        assignments = []
+        total_travel = 0
+        for driver, route in zip(drivers, routes):
+            clock, prev, travel = shift_start, 0, 0
+            route_stops = []
+            for s in route:
+                travel += matrix[prev][s + 1]
+                clock = max(clock + matrix[prev][s + 1], stops[s]['ready'])
+                d = located[s]
+                route_stops.append({
+                    'delivery_id': d['id'],
+                    'address_id': d['address_id'],
+                    'label': d['label'],
+                    'arrival': minutes_to_time(clock),
+                    'window': [minutes_to_time(stops[s]['ready']),
+                               minutes_to_time(stops[s]['due'])],
+                    'previous_driver_id': d['driver_id']
+                })
+                assignments.append({
+                    'delivery_id': d['id'],
+                    'driver_id': driver['id'],
+                    'updated_at': str(d['updated_at'])
+                })
+                clock += Config.DISPATCH_SERVICE_MINUTES
+                prev = s + 1
+            if route:
+                travel += matrix[prev][0]
+                clock += matrix[prev][0]
+            total_travel += travel
+            plan_routes.append({
+                'driver_id': driver['id'],
+                'driver_name': driver['name'],
+                'stops': route_stops,
+                'travel_minutes': travel,
+                'return_at': minutes_to_time(clock) if route else None
+            })
+
+        unplaced = [located[s]['id'] for s in unassigned]
+        unplaced += [d['id'] for d in deliveries if d['latitude'] is None or d['longitude'] is None]
+
+        token = uuid.uuid4().hex
+        plan = {
+            'token': token,
+            'date': delivery_date,
+            'routes': plan_routes,
+            'unassigned': unplaced,
+            'total_travel_minutes': total_travel,
+            'solve_ms': elapsed_ms
+        }
+        try:
+            cache.set(DispatchService._preview_key(token), {
+                'date': delivery_date,
+                'created_by': created_by,
+                'assignments': assignments
+            }, timeout=Config.DISPATCH_PREVIEW_TTL)
+        except Exception as e:
+            logger.error(f"Error storing dispatch preview: {str(e)}")
+            plan['token'] = None
+        return plan
+
+    @staticmethod
+    def commit_plan(token: str, assigned_by: int) -> Dict[str, Any]:
+        """Apply a previewed plan in one transaction.
+
+        Fails with ``stale`` if any planned delivery was changed or left the
+        pending state since the preview was made.
+        """
+        stored = cache.get(DispatchService._preview_key(token)) if token else None
+        if not stored:
+            return {'success': False, 'reason': 'expired'}
+        assignments = stored['assignments']
+        if not assignments:
+            return {'success': True, 'updated_count': 0}
+
+        ids = [a['delivery_id'] for a in assignments]
+        placeholders = ', '.join(['%s'] * len(ids))
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute(f"""
+                SELECT id, driver_id, delivery_date, status, updated_at
+                FROM deliveries
+                WHERE id IN ({placeholders})
+                FOR UPDATE
+            """, tuple(ids))
+            current = {row['id']: row for row in cursor.fetchall()}
+            for a in assignments:
+                row = current.get(a['delivery_id'])
+                if not row or row['status'] != 'pending' or str(row['updated_at']) != a['updated_at']:
+                    mysql.connection.rollback()
+                    return {'success': False, 'reason': 'stale'}
+
+            changes = [
+                (a['driver_id'], assigned_by, a['delivery_id'])
+                for a in assignments
+                if current[a['delivery_id']]['driver_id'] != a['driver_id']
+            ]
+            if changes:
+                cursor.executemany("""
+                    UPDATE deliveries
+                    SET driver_id = %s, assigned_by = %s, updated_at = NOW()
+                    WHERE id = %s
+                """, changes)
+            mysql.connection.commit()
+        except Exception as e:
+            mysql.connection.rollback()
+            logger.error(f"Error committing dispatch plan: {str(e)}")
+            return {'success': False, 'reason': 'error'}
+        finally:
+            cursor.close()
+
+        cache.delete(DispatchService._preview_key(token))
+        slots = {(row['driver_id'], str(row['delivery_date'])[:10]) for row in current.values()}
+        slots |= {(a['driver_id'], stored['date']) for a in assignments}
+        for driver_id, delivery_date in slots:
+            SchedulingService.invalidate(driver_id, delivery_date)
+
+        # The planned stop order becomes each driver's cached route
+        planned: Dict[int, List[int]] = {}
+        for a in assignments:
+            planned.setdefault(a['driver_id'], []).append(a['delivery_id'])
+        for driver_id, order in planned.items():
+            RouteService.store_route(driver_id, stored['date'], order)
+            RouteService.update_etas(driver_id, stored['date'])
+        RouteService.sync(slots)
+        return {'success': True, 'updated_count': len(changes)}
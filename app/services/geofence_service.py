@@ -0,0 +1,215 @@
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.services.scheduling_service import SchedulingService
+from app.services.route_service import RouteService
+from math import cos, floor, radians, sqrt
+import logging
+import MySQLdb.cursors
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METRES_PER_DEGREE = 111320.0
+
+class FenceGrid:
+    """Uniform lat/lon grid of circular fences.
+
+    Each fence is registered in every cell its circle overlaps, so a point
+    only has to look at the fences listed in its own cell.
+    """
+
+    def __init__(self, fences: List[Dict[str, Any]], cell: float, radius: float):
+        self.cell = cell
+        self.radius = radius
+        self.fences = {f['id']: f for f in fences}
+        self.cells: Dict[Tuple[int, int], List[Dict[str, Any]]] = {}
+        for fence in fences:
+            dlat = radius / METRES_PER_DEGREE
+            dlon = radius / (METRES_PER_DEGREE * max(cos(radians(fence['lat'])), 0.01))
+            for i in range(floor((fence['lat'] - dlat) / cell), floor((fence['lat'] + dlat) / cell) + 1):
+                for j in range(floor((fence['lng'] - dlon) / cell), floor((fence['lng'] + dlon) / cell) + 1):
+                    self.cells.setdefault((i, j), []).append(fence)
+
+    def __len__(self) -> int:
+        return len(self.fences)
+
+    @staticmethod
+    def distance(fence: Dict[str, Any], lat: float, lng: float) -> float:
+        """Metres between a fence centre and a point (equirectangular)"""
+        dy = (lat - fence['lat']) * METRES_PER_DEGREE
+        dx = (lng - fence['lng']) * METRES_PER_DEGREE * cos(radians(fence['lat']))
+        return sqrt(dx * dx + dy * dy)
+
+    def locate(self, lat: float, lng: float) -> Optional[Dict[str, Any]]:
+        """The nearest fence containing the point, if any"""
+        best, best_d = None, self.radius
+        for fence in self.cells.get((floor(lat / self.cell), floor(lng / self.cell)), ()):
+            d = self.distance(fence, lat, lng)
+            if d <= best_d:
+                best, best_d = fence, d
+        return best
+
+
+class GeofenceService:
+    """Automatic arrival detection from driver location pings.
+
+    Every pending or in-progress delivery of a driver's day is a fence of
+    GEOFENCE_RADIUS metres around its address. A driver who stays inside a
+    fence for GEOFENCE_DWELL_SECONDS has arrived: the delivery becomes
+    ``in_progress`` and ``arrived_at`` is set to the time of entry. Leaving
+    it by more than GEOFENCE_EXIT_FACTOR times the radius is a departure:
+    the delivery becomes ``completed`` with ``departed_at`` and the actual
+    service time. Grids are cached per worker and rebuilt when the
+    schedule version of the day changes; the per-driver state lives in the
+    shared cache so consecutive batches may land on different workers.
+    """
+    # (driver_id, 'YYYY-MM-DD') -> (grid, schedule version token, loaded_at)
+    _grids: Dict[Tuple[int, str], Tuple[FenceGrid, Optional[str], float]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _state_key(driver_id: int) -> str:
+        return f"geofence_state:{int(driver_id)}"
+
+    @staticmethod
+    def _load_fences(driver_id: int, delivery_date: str) -> List[Dict[str, Any]]:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT d.id, a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.driver_id = %s AND d.delivery_date = %s
+                AND d.status IN ('pending', 'in_progress')
+                AND a.latitude IS NOT NULL AND a.longitude IS NOT NULL
+            """, (driver_id, delivery_date))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        return [{'id': row['id'], 'lat': float(row['latitude']), 'lng': float(row['longitude'])} for row in rows]
+
+    @staticmethod
+    def get_grid(driver_id: int, delivery_date: str) -> FenceGrid:
+        """Fence grid of a driver's day, rebuilt whenever the day's schedule changes"""
+        key = (int(driver_id), str(delivery_date)[:10])
+        version = SchedulingService._current_version(*key)
+        cached = GeofenceService._grids.get(key)
+        if cached:
+            grid, cached_version, loaded_at = cached
+            if cached_version == version and time.time() - loaded_at < Config.SCHEDULE_CACHE_TTL:
+                return grid
+
+        grid = FenceGrid(GeofenceService._load_fences(*key), Config.GEOFENCE_CELL_DEGREES,
+                         Config.GEOFENCE_RADIUS)
+        with GeofenceService._lock:
+            # Only today's grids are ever asked for, older days can go
+            for old in [k for k in GeofenceService._grids if k[1] != key[1]]:
+                GeofenceService._grids.pop(old, None)
+            GeofenceService._grids[key] = (grid, version, time.time())
+        return grid
+
+    @staticmethod
+    def detect(grid: FenceGrid, state: Dict[str, Any], pings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Advance a driver's fence state over time-ordered pings, returning arrive/depart events"""
+        events = []
+        exit_radius = grid.radius * Config.GEOFENCE_EXIT_FACTOR
+        for ping in pings:
+            if ping['ts'] <= state.get('last_ts', 0):
+                continue
+            state['last_ts'] = ping['ts']
+            current = grid.fences.get(state.get('inside'))
+            if state.get('inside') is not None and current is None:
+                # Delivery was completed or moved by hand meanwhile
+                state.update(inside=None, arrived=False)
+
+            if current is not None:
+                if FenceGrid.distance(current, ping['lat'], ping['lon']) <= exit_radius:
+                    state['seen'] = ping['ts']
+                    if not state['arrived'] and ping['ts'] - state['since'] >= Config.GEOFENCE_DWELL_SECONDS:
+                        state['arrived'] = True
+                        events.append({'type': 'arrive', 'delivery_id': current['id'], 'ts': state['since']})
+                    continue
+                if state['arrived']:
+                    events.append({'type': 'depart', 'delivery_id': current['id'], 'ts': state['seen'],
+                                   'arrived_ts': state['since']})
+                state.update(inside=None, arrived=False)
+
+            fence = grid.locate(ping['lat'], ping['lon'])
+            if fence is not None:
+                state.update(inside=fence['id'], since=ping['ts'], seen=ping['ts'], arrived=False)
+        return events
+
+    @staticmethod
+    def _apply(driver_id: int, events: List[Dict[str, Any]]) -> None:
+        """Write the events' status changes in one transaction"""
+        cursor = mysql.connection.cursor()
+        try:
+            for event in events:
+                at = datetime.fromtimestamp(event['ts'])
+                if event['type'] == 'arrive':
+                    cursor.execute("""
+                        UPDATE deliveries
+                        SET status = 'in_progress', arrived_at = COALESCE(arrived_at, %s), updated_at = NOW()
+                        WHERE id = %s AND status IN ('pending', 'in_progress')
+                    """, (at, event['delivery_id']))
+                else:
+                    arrived = datetime.fromtimestamp(event['arrived_ts'])
+                    cursor.execute("""
+                        UPDATE deliveries
+                        SET status = 'completed', departed_at = %s,
+                            actual_service_minutes = TIMESTAMPDIFF(MINUTE, COALESCE(arrived_at, %s), %s),
+                            updated_at = NOW()
+                        WHERE id = %s AND status = 'in_progress'
+                    """, (at, arrived, at, event['delivery_id']))
+                if cursor.rowcount > 0:
+                    cursor.execute("""
+                        INSERT INTO user_activity (user_id, action, details, created_at)
+                        VALUES (%s, %s, %s, NOW())
+                    """, (driver_id, f"geofence_{event['type']}",
+                          str({'delivery_id': event['delivery_id'], 'at': at.isoformat()})))
+            mysql.connection.commit()
+        except Exception:
+            mysql.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def process(driver_id: int, pings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Run a batch of accepted pings through the driver's fences"""
+        delivery_date = datetime.fromtimestamp(pings[-1]['ts']).strftime('%Y-%m-%d')
+        todays = [p for p in pings if datetime.fromtimestamp(p['ts']).strftime('%Y-%m-%d') == delivery_date]
+        grid = GeofenceService.get_grid(driver_id, delivery_date)
+
+        key = GeofenceService._state_key(driver_id)
+        try:
+            state = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Could not read geofence state: {str(e)}")
+            state = None
+        if not state or state.get('date') != delivery_date:
+            state = {'date': delivery_date, 'inside': None, 'arrived': False, 'last_ts': 0}
+        if not len(grid) and state['inside'] is None:
+            return []
+
+        events = GeofenceService.detect(grid, state, todays)
+        if events:
+            try:
+                GeofenceService._apply(driver_id, events)
+            except Exception as e:
+                logger.error(f"Error applying geofence events: {str(e)}")
+                # Keep the old state so the next batch detects the events again
+                return []
+            for event in events:
+                logger.info(f"Driver {driver_id} {event['type']} delivery {event['delivery_id']}")
+            SchedulingService.invalidate(driver_id, delivery_date)
+            RouteService.sync([(int(driver_id), delivery_date)])
+        try:
+            cache.set(key, state, timeout=86400)
+        except Exception as e:
+            logger.warning(f"Could not store geofence state: {str(e)}")
+        return events
@@ -0,0 +1,159 @@
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.services.location_service import LocationService
+from app.services.route_service import RouteService, ORIGIN
+import logging
+import MySQLdb.cursors
+import time
+
+logger = logging.getLogger(__name__)
+
+POSITION = 'position'
+
+class LiveEtaService:
+    """Remaining-stop ETAs recomputed from the drivers' latest positions.
+
+    ``tick`` walks every driver with open stops today in one pass: the
+    positions come from a single cache read, each route is timed from the
+    driver's position and the current time, and all changed ETAs are
+    written back in one UPDATE. A driver's ETAs are only republished when
+    some stop moved by at least LIVE_ETA_THRESHOLD minutes or the set of
+    stops changed. Views read the published snapshot from the cache and
+    never compute anything themselves.
+    """
+
+    @staticmethod
+    def _key(driver_id: int) -> str:
+        return f"live_eta:{int(driver_id)}"
+
+    @staticmethod
+    def _active_drivers(delivery_date: str) -> List[int]:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT DISTINCT driver_id
+                FROM deliveries
+                WHERE delivery_date = %s AND driver_id IS NOT NULL
+                AND status IN ('pending', 'in_progress')
+            """, (delivery_date,))
+            return [row['driver_id'] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _live_timeline(driver_id: int, delivery_date: str,
+                       position: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Timeline of the planned route starting from where the driver is now"""
+        ctx, order = RouteService._plan(driver_id, delivery_date)
+        if position:
+            ctx['matrix'] = ctx['matrix'].extended({POSITION: (position['lat'], position['lon'])})
+            ctx['nodes'][ORIGIN] = POSITION
+        now = datetime.now()
+        ctx['clock'] = now.hour * 60 + now.minute
+        return RouteService._timeline(ctx, order)
+
+    @staticmethod
+    def _changed(previous: Optional[Dict[str, Any]], etas: Dict[int, int], return_eta: int) -> bool:
+        if not previous or set(previous['etas']) != set(etas):
+            return True
+        threshold = Config.LIVE_ETA_THRESHOLD
+        if abs(previous['return_eta_minutes'] - return_eta) >= threshold:
+            return True
+        return any(abs(previous['etas'][stop_id] - eta) >= threshold for stop_id, eta in etas.items())
+
+    @staticmethod
+    def _write(published: List[Dict[str, Any]]) -> None:
+        """Store the ETAs of every republished route in a single UPDATE"""
+        stops = [(stop_id, eta, snap['return_eta_minutes'])
+                 for snap in published for stop_id, eta in snap['etas'].items()]
+        if not stops:
+            return
+        params: List[Any] = []
+        for stop_id, eta, _ in stops:
+            params.extend([stop_id, eta])
+        for stop_id, _, return_eta in stops:
+            params.extend([stop_id, return_eta])
+        params.extend(stop_id for stop_id, _, _ in stops)
+        cases = ' '.join(['WHEN %s THEN %s'] * len(stops))
+        placeholders = ', '.join(['%s'] * len(stops))
+
+        cursor = mysql.connection.cursor()
+        try:
+            cursor.execute(f"""
+                UPDATE deliveries
+                SET arrival_minutes = CASE id {cases} END,
+                    return_eta_minutes = CASE id {cases} END
+                WHERE id IN ({placeholders})
+            """, tuple(params))
+            mysql.connection.commit()
+        except Exception as e:
+            mysql.connection.rollback()
+            logger.error(f"Error writing live ETAs: {str(e)}")
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def tick() -> int:
+        """Recompute all of today's routes once, returning how many were republished"""
+        today = date.today().isoformat()
+        driver_ids = LiveEtaService._active_drivers(today)
+        if not driver_ids:
+            return 0
+        positions = LocationService.get_latest_positions(driver_ids)
+        try:
+            previous = cache.get_many(*[LiveEtaService._key(d) for d in driver_ids])
+        except Exception as e:
+            logger.warning(f"Could not read live ETAs: {str(e)}")
+            previous = [None] * len(driver_ids)
+
+        now = time.time()
+        published = []
+        for driver_id, before in zip(driver_ids, previous):
+            position = positions.get(driver_id)
+            if position and now - position['ts'] > Config.LIVE_ETA_MAX_POSITION_AGE:
+                position = None
+            try:
+                timeline = LiveEtaService._live_timeline(driver_id, today, position)
+            except Exception as e:
+                logger.error(f"Error computing live ETAs for driver {driver_id}: {str(e)}")
+                continue
+            etas = {stop['delivery_id']: stop['arrival_minutes'] for stop in timeline['stops']}
+            if not LiveEtaService._changed(before, etas, timeline['return_eta_minutes']):
+                continue
+            timeline.update(driver_id=driver_id, date=today, etas=etas, computed_at=int(now),
+                            from_position=position is not None)
+            published.append(timeline)
+
+        if published:
+            LiveEtaService._write(published)
+            try:
+                cache.set_many({LiveEtaService._key(t['driver_id']): t for t in published},
+                               timeout=Config.LIVE_ETA_TTL)
+            except Exception as e:
+                logger.warning(f"Could not publish live ETAs: {str(e)}")
+        return len(published)
+
+    @staticmethod
+    def get(driver_id: int) -> Optional[Dict[str, Any]]:
+        """Last published live timeline of a driver's day"""
+        try:
+            snapshot = cache.get(LiveEtaService._key(driver_id))
+        except Exception as e:
+            logger.warning(f"Could not read live ETAs: {str(e)}")
+            return None
+        return snapshot if snapshot and snapshot['date'] == date.today().isoformat() else None
+
+    @staticmethod
+    def get_many(driver_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        if not driver_ids:
+            return {}
+        try:
+            values = cache.get_many(*[LiveEtaService._key(d) for d in driver_ids])
+        except Exception as e:
+            logger.warning(f"Could not read live ETAs: {str(e)}")
+            return {}
+        today = date.today().isoformat()
+        return {int(d): v for d, v in zip(driver_ids, values) if v and v['date'] == today}
@@ -0,0 +1,211 @@
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+from app.config import Config
+from app.extensions import cache
+from app.utils import validate_coordinates
+import atexit
+import logging
+import os
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# One ping on disk: unix seconds, lat/lon in microdegrees, speed in cm/s
+RECORD = struct.Struct('<IiiH')
+
+# Stores the position only if its ts is newer than the one already shared.
+# KEYS: ts key, position key; ARGV: ts, serialized position, ttl
+STORE_IF_NEWER = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+if tonumber(ARGV[1]) <= current then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+class LocationService:
+    """Driver GPS ping ingestion.
+
+    Pings are appended to an in-memory buffer and flushed in bulk to
+    append-only segment files, one per driver and day
+    (``LOCATION_STORE_DIR/<date>/<driver_id>.bin``), as fixed 14-byte
+    records. A flush happens when the buffer reaches LOCATION_BUFFER_SIZE
+    pings or LOCATION_FLUSH_SECONDS have passed, and at worker exit. The
+    newest ping of every driver is also kept in the shared cache.
+    """
+    _buffer: List[Tuple[int, str, bytes]] = []
+    _last_flush = time.monotonic()
+    _lock = threading.Lock()
+    _listeners: List[Any] = []
+
+    @staticmethod
+    def _position_key(driver_id: int) -> str:
+        return f"driver_position:{int(driver_id)}"
+
+    @staticmethod
+    def _store_position(driver_id: int, position: Dict[str, Any]) -> bool:
+        """Publish a position unless the shared cache already holds a newer one.
+
+        Offline-queued batches can reach a worker after newer pings went
+        through another one, so the check must use the shared state. On
+        Redis it is one atomic script; other backends read, then write.
+        """
+        key = LocationService._position_key(driver_id)
+        backend = cache.cache
+        client = getattr(backend, '_write_client', None)
+        if client is not None:
+            prefix = backend.key_prefix
+            return bool(client.eval(
+                STORE_IF_NEWER, 2, f"{prefix}{key}:ts", f"{prefix}{key}",
+                position['ts'], backend.serializer.dumps(position), Config.LOCATION_POSITION_TTL
+            ))
+        current = cache.get(key)
+        if current and current['ts'] >= position['ts']:
+            return False
+        cache.set(key, position, timeout=Config.LOCATION_POSITION_TTL)
+        return True
+
+    @staticmethod
+    def _segment_path(driver_id: int, day: str) -> str:
+        return os.path.join(Config.LOCATION_STORE_DIR, day, f"{int(driver_id)}.bin")
+
+    @staticmethod
+    def _parse(ping: Dict[str, Any], now: float) -> Optional[Dict[str, Any]]:
+        """Validate one client ping, returning None if it is unusable"""
+        try:
+            lat = float(ping['lat'])
+            lon = float(ping['lon'])
+            ts = int(ping.get('ts') or now)
+            speed = max(0.0, float(ping.get('speed') or 0))
+        except (KeyError, TypeError, ValueError):
+            return None
+        if not validate_coordinates(lat, lon):
+            return None
+        # Clients queue pings while offline, but not for days or from the future
+        if ts > now + 300 or ts < now - Config.LOCATION_MAX_AGE_SECONDS:
+            return None
+        return {'lat': lat, 'lon': lon, 'ts': ts, 'speed': speed}
+
+    @staticmethod
+    def add_listener(listener) -> None:
+        """Register ``listener(driver_id, pings)`` to run for every accepted batch"""
+        if listener not in LocationService._listeners:
+            LocationService._listeners.append(listener)
+
+    @staticmethod
+    def ingest(driver_id: int, pings: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Accept a batch of pings for one driver"""
+        now = time.time()
+        accepted = []
+        for ping in pings[:Config.LOCATION_MAX_BATCH]:
+            parsed = LocationService._parse(ping, now)
+            if parsed:
+                accepted.append(parsed)
+        rejected = len(pings) - len(accepted)
+        if not accepted:
+            return {'accepted': 0, 'rejected': rejected}
+
+        accepted.sort(key=lambda p: p['ts'])
+        records = []
+        for p in accepted:
+            day = datetime.fromtimestamp(p['ts']).strftime('%Y-%m-%d')
+            records.append((int(driver_id), day, RECORD.pack(
+                p['ts'], round(p['lat'] * 1e6), round(p['lon'] * 1e6), min(int(p['speed'] * 100), 65535)
+            )))
+
+        with LocationService._lock:
+            LocationService._buffer.extend(records)
+            due = (len(LocationService._buffer) >= Config.LOCATION_BUFFER_SIZE or
+                   time.monotonic() - LocationService._last_flush >= Config.LOCATION_FLUSH_SECONDS)
+
+        newest = accepted[-1]
+        try:
+            LocationService._store_position(driver_id, {
+                'driver_id': int(driver_id),
+                'lat': newest['lat'],
+                'lon': newest['lon'],
+                'speed': newest['speed'],
+                'ts': newest['ts']
+            })
+        except Exception as e:
+            logger.warning(f"Could not store driver position: {str(e)}")
+        if due:
+            LocationService.flush()
+
+        for listener in LocationService._listeners:
+            try:
+                listener(int(driver_id), accepted)
+            except Exception as e:
+                logger.error(f"Error in location listener: {str(e)}")
+        return {'accepted': len(accepted), 'rejected': rejected}
+
+    @staticmethod
+    def flush() -> int:
+        """Write buffered pings to their segments, one append per file"""
+        with LocationService._lock:
+            records, LocationService._buffer = LocationService._buffer, []
+            LocationService._last_flush = time.monotonic()
+        if not records:
+            return 0
+
+        segments: Dict[Tuple[int, str], List[bytes]] = {}
+        for driver_id, day, packed in records:
+            segments.setdefault((driver_id, day), []).append(packed)
+        for (driver_id, day), chunks in segments.items():
+            path = LocationService._segment_path(driver_id, day)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'ab') as f:
+                    f.write(b''.join(chunks))
+            except OSError as e:
+                logger.error(f"Error writing location segment {path}: {str(e)}")
+        return len(records)
+
+    @staticmethod
+    def get_track(driver_id: int, day: str, since_ts: int = 0) -> List[Dict[str, Any]]:
+        """Stored and still-buffered pings of a driver's day, oldest first"""
+        data = b''
+        path = LocationService._segment_path(driver_id, day)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+        with LocationService._lock:
+            data += b''.join(packed for d, dd, packed in LocationService._buffer
+                             if d == int(driver_id) and dd == day)
+
+        # Ignore a partially written trailing record
+        usable = len(data) - len(data) % RECORD.size
+        track = [
+            {'ts': ts, 'lat': lat / 1e6, 'lon': lon / 1e6, 'speed': speed / 100}
+            for ts, lat, lon, speed in RECORD.iter_unpack(data[:usable])
+            if ts >= since_ts
+        ]
+        track.sort(key=lambda p: p['ts'])
+        return track
+
+    @staticmethod
+    def get_latest_position(driver_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            return cache.get(LocationService._position_key(driver_id))
+        except Exception as e:
+            logger.warning(f"Could not read driver position: {str(e)}")
+            return None
+
+    @staticmethod
+    def get_latest_positions(driver_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Latest known position of each driver, in one cache round trip"""
+        if not driver_ids:
+            return {}
+        try:
+            values = cache.get_many(*[LocationService._position_key(d) for d in driver_ids])
+        except Exception as e:
+            logger.warning(f"Could not read driver positions: {str(e)}")
+            return {}
+        return {int(d): v for d, v in zip(driver_ids, values) if v}
+
+
+atexit.register(LocationService.flush)
@@ -0,0 +1,266 @@
+from typing import Optional, List, Dict, Any, Iterator, Tuple
+from app.config import Config
+import logging
+import os
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40, 'CRITICAL': 50}
+
+# A record starts with a timestamp; anything else (tracebacks) continues the previous one
+HEADER = re.compile(rb'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}')
+LEVEL = re.compile(rb'\b(DEBUG|INFO|WARNING|ERROR|CRITICAL)\b')
+
+# (inode, start offset, end offset, lines) of one log record
+Record = Tuple[int, int, int, List[bytes]]
+
+
+class LogService:
+    """Reads the application log and its rotated backups without loading them.
+
+    Positions are cursors of the form ``<inode>:<offset>``: the inode keeps
+    them valid when RotatingFileHandler renames ``chocomap.log`` to
+    ``chocomap.log.1``. The last records are found by reading blocks
+    backwards from the end of the file, newer ones by reading forward from
+    a cursor, and both stop after LOG_VIEWER_MAX_SCAN_BYTES so a filter
+    that rarely matches cannot scan every backup in one request. Memory is
+    bounded by the block size, the line size cap and the page size.
+    """
+
+    @staticmethod
+    def _files() -> List[Tuple[str, int]]:
+        """(path, inode) of the log and its backups, oldest first"""
+        base = Config.ADMIN_LOG_FILE
+        paths = [f"{base}.{i}" for i in range(Config.LOG_VIEWER_BACKUPS, 0, -1)] + [base]
+        files = []
+        for path in paths:
+            try:
+                files.append((path, os.stat(path).st_ino))
+            except OSError:
+                continue
+        return files
+
+    @staticmethod
+    def encode_cursor(inode: int, offset: int) -> str:
+        return f"{inode}:{offset}"
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> Tuple[int, int]:
+        """Raises ValueError for malformed cursors"""
+        inode, offset = cursor.split(':', 1)
+        return int(inode), int(offset)
+
+    @staticmethod
+    def end_cursor() -> Optional[str]:
+        """Cursor at the current end of the log"""
+        files = LogService._files()
+        if not files:
+            return None
+        path, inode = files[-1]
+        return LogService.encode_cursor(inode, os.path.getsize(path))
+
+    @staticmethod
+    def _matches(lines: List[bytes], min_level: int, needle: Optional[bytes]) -> bool:
+        if min_level:
+            found = LEVEL.search(lines[0]) if HEADER.match(lines[0]) else None
+            if not found or LEVELS[found.group(1).decode()] < min_level:
+                return False
+        return needle is None or any(needle in line.lower() for line in lines)
+
+    @staticmethod
+    def _lines_backward(f, end: int) -> Iterator[Tuple[int, bytes]]:
+        """(offset, line) from ``end`` back to the start of the file.
+
+        Like readline() going forward, only the first LOG_VIEWER_MAX_LINE_BYTES
+        of a line are kept, so one huge line cannot be pulled into memory.
+        """
+        cap = Config.LOG_VIEWER_MAX_LINE_BYTES
+        pos = end
+        pending = b''
+        while pos > 0:
+            size = min(Config.LOG_VIEWER_BLOCK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            block = f.read(size)
+            stop = len(block)
+            newline = block.rfind(b'\n')
+            while newline >= 0:
+                line = (block[newline + 1:stop] + pending)[:cap]
+                if line:
+                    yield pos + newline + 1, line
+                pending = b''
+                stop = newline
+                newline = block.rfind(b'\n', 0, stop)
+            # The line continues in the previous block
+            pending = (block[:stop] + pending)[:cap]
+        if pending:
+            yield 0, pending
+
+    @staticmethod
+    def _records_backward(path: str, inode: int, end: int) -> Iterator[Record]:
+        with open(path, 'rb') as f:
+            continuation: List[bytes] = []
+            record_end = end
+            for offset, line in LogService._lines_backward(f, end):
+                if HEADER.match(line):
+                    continuation.reverse()
+                    yield inode, offset, record_end, [line] + continuation
+                    continuation = []
+                    record_end = offset
+                elif len(continuation) < Config.LOG_VIEWER_MAX_RECORD_LINES:
+                    continuation.append(line)
+            if continuation:
+                continuation.reverse()
+                yield inode, 0, record_end, continuation
+
+    @staticmethod
+    def _skip_line(f) -> Optional[int]:
+        """Bytes up to and including the next newline; None when the file ends first"""
+        skipped = 0
+        while True:
+            chunk = f.readline(Config.LOG_VIEWER_BLOCK_SIZE)
+            if not chunk:
+                return None
+            skipped += len(chunk)
+            if chunk.endswith(b'\n'):
+                return skipped
+
+    @staticmethod
+    def _records_forward(path: str, inode: int, start: int, complete: bool) -> Iterator[Record]:
+        """Records from ``start``; a trailing line still being written is left for later"""
+        with open(path, 'rb') as f:
+            f.seek(start)
+            record: List[bytes] = []
+            record_start = offset = start
+            while True:
+                line = f.readline(Config.LOG_VIEWER_MAX_LINE_BYTES)
+                size = len(line)
+                if not line.endswith(b'\n'):
+                    if size < Config.LOG_VIEWER_MAX_LINE_BYTES:
+                        # End of file
+                        if not line or not complete:
+                            break
+                    else:
+                        # Over-long line: keep its start, skip to the next one
+                        rest = LogService._skip_line(f)
+                        if rest is None and not complete:
+                            break
+                        size += rest or 0
+                if HEADER.match(line) and record:
+                    yield inode, record_start, offset, record
+                    record, record_start = [], offset
+                if len(record) < Config.LOG_VIEWER_MAX_RECORD_LINES:
+                    record.append(line.rstrip(b'\n'))
+                offset += size
+            if record:
+                yield inode, record_start, offset, record
+
+    @staticmethod
+    def _page(records: List[Record], before: str, after: str) -> Dict[str, Any]:
+        return {
+            'logs': [line.decode('utf-8', 'replace') for record in records for line in record[3]],
+            'before': before,
+            'after': after
+        }
+
+    @staticmethod
+    def tail(limit: int, level: Optional[str] = None, contains: Optional[str] = None,
+             before: Optional[str] = None) -> Dict[str, Any]:
+        """The last ``limit`` matching records, or the ones preceding ``before``"""
+        min_level = LEVELS.get((level or '').upper(), 0)
+        needle = contains.lower().encode() if contains else None
+        files = LogService._files()
+        if not files:
+            return {'logs': [], 'before': None, 'after': None}
+
+        if before:
+            inode, end = LogService.decode_cursor(before)
+            index = next((i for i, f in enumerate(files) if f[1] == inode), None)
+            if index is None:
+                return {'logs': [], 'before': None, 'after': before}
+        else:
+            index = len(files) - 1
+            end = os.path.getsize(files[index][0])
+        after = LogService.encode_cursor(files[index][1], end)
+
+        found: List[Record] = []
+        scanned = 0
+        cursor = after
+        for i in range(index, -1, -1):
+            path, inode = files[i]
+            stop = end if i == index else os.path.getsize(path)
+            for record in LogService._records_backward(path, inode, stop):
+                scanned += record[2] - record[1]
+                cursor = LogService.encode_cursor(inode, record[1])
+                if LogService._matches(record[3], min_level, needle):
+                    found.append(record)
+                if len(found) >= limit or scanned >= Config.LOG_VIEWER_MAX_SCAN_BYTES:
+                    found.reverse()
+                    return LogService._page(found, cursor, after)
+        found.reverse()
+        # Reached the start of the oldest backup: nothing before this page
+        return LogService._page(found, None, after)
+
+    @staticmethod
+    def read_forward(after: str, limit: int, level: Optional[str] = None,
+                     contains: Optional[str] = None) -> Dict[str, Any]:
+        """Matching records written after the ``after`` cursor, oldest first"""
+        min_level = LEVELS.get((level or '').upper(), 0)
+        needle = contains.lower().encode() if contains else None
+        files = LogService._files()
+        if not files:
+            return {'logs': [], 'before': after, 'after': after}
+
+        inode, start = LogService.decode_cursor(after)
+        index = next((i for i, f in enumerate(files) if f[1] == inode), None)
+        if index is None:
+            # Rotated out of the backups: continue with the oldest one left
+            index, start = 0, 0
+
+        found: List[Record] = []
+        scanned = 0
+        cursor = after
+        for i in range(index, len(files)):
+            path, inode = files[i]
+            offset = start if i == index else 0
+            cursor = LogService.encode_cursor(inode, offset)
+            newest = i == len(files) - 1
+            for record in LogService._records_forward(path, inode, offset, complete=not newest):
+                scanned += record[2] - record[1]
+                cursor = LogService.encode_cursor(inode, record[2])
+                if LogService._matches(record[3], min_level, needle):
+                    found.append(record)
+                if len(found) >= limit or scanned >= Config.LOG_VIEWER_MAX_SCAN_BYTES:
+                    return LogService._page(found, after, cursor)
+        return LogService._page(found, after, cursor)
+
+    @staticmethod
+    def follow(after: Optional[str], level: Optional[str] = None,
+               contains: Optional[str] = None) -> Iterator[str]:
+        """Server-sent events with new matching lines, ending after LOG_FOLLOW_MAX_SECONDS.
+
+        Each event carries its cursor as the id, so a reconnecting
+        EventSource resumes where it stopped via Last-Event-ID.
+        """
+        if not after:
+            after = LogService.end_cursor()
+            if after is None:
+                return
+        deadline = time.time() + Config.LOG_FOLLOW_MAX_SECONDS
+        idle = 0.0
+        while time.time() < deadline:
+            page = LogService.read_forward(after, Config.LOG_VIEWER_MAX_LINES, level, contains)
+            after = page['after']
+            if page['logs']:
+                data = '\n'.join(f"data: {line}" for line in page['logs'])
+                yield f"id: {after}\n{data}\n\n"
+                idle = 0.0
+                continue
+            if idle >= Config.LOG_FOLLOW_KEEPALIVE:
+                # Comment line: keeps proxies from closing an idle stream
+                yield f"id: {after}\n: keepalive\n\n"
+                idle = 0.0
+            time.sleep(Config.LOG_FOLLOW_INTERVAL)
+            idle += Config.LOG_FOLLOW_INTERVAL
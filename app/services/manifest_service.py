@@ -0,0 +1,81 @@
+from datetime import datetime
+from typing import List, Dict, Any, Tuple
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.services.delivery_service import DeliveryService
+from app.services.scheduling_service import SchedulingService
+from app.services.sync_service import SyncService
+from app.utils import generate_hash
+import logging
+import MySQLdb.cursors
+
+logger = logging.getLogger(__name__)
+
+class ManifestService:
+    """Per driver/day manifest: the day's deliveries and the driver's stats.
+
+    A manifest is built once and cached together with the schedule
+    version of the day it was built from and a hash of its content, which
+    serves as the ETag. Every write to the driver's day bumps that version,
+    so a cached manifest is valid as long as the versions match; checking
+    that costs two cache reads and no query. Route arrivals are rewritten
+    on every live-ETA tick without a version bump, so they are left out;
+    the driver app reads them from /driver/api/live-eta.
+    """
+
+    @staticmethod
+    def _key(driver_id: int, delivery_date: str) -> str:
+        return f"driver_manifest:{int(driver_id)}:{delivery_date}"
+
+    @staticmethod
+    def _load_deliveries(driver_id: int, delivery_date: str) -> List[Dict[str, Any]]:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT d.id, d.delivery_date, d.start_time, d.end_time, d.status, d.notes,
+                       d.eta_minutes, d.updated_at, a.label, a.street_address,
+                       a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.driver_id = %s AND d.delivery_date = %s
+                ORDER BY d.start_time, d.id
+            """, (driver_id, delivery_date))
+            return [SyncService._serialize(row) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _build(driver_id: int, delivery_date: str) -> Tuple[Dict[str, Any], str]:
+        manifest = {
+            'driver_id': int(driver_id),
+            'date': delivery_date,
+            'deliveries': ManifestService._load_deliveries(driver_id, delivery_date),
+            'stats': DeliveryService.get_driver_stats(driver_id)
+        }
+        etag = generate_hash(manifest)[:32]
+        manifest['generated_at'] = datetime.now().isoformat(timespec='seconds')
+        return manifest, etag
+
+    @staticmethod
+    def get_manifest(driver_id: int, delivery_date: str) -> Tuple[Dict[str, Any], str]:
+        """The manifest of a driver's day and its ETag, rebuilt only after changes"""
+        delivery_date = str(delivery_date)[:10]
+        key = ManifestService._key(driver_id, delivery_date)
+        # Read the version first: a write during the build then forces a rebuild
+        version = SchedulingService._current_version(int(driver_id), delivery_date)
+        try:
+            cached = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Could not read driver manifest: {str(e)}")
+            cached = None
+        if cached and cached['version'] == version:
+            return cached['manifest'], cached['etag']
+
+        manifest, etag = ManifestService._build(driver_id, delivery_date)
+        try:
+            cache.set(key, {'version': version, 'manifest': manifest, 'etag': etag},
+                      timeout=Config.MANIFEST_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not cache driver manifest: {str(e)}")
+        return manifest, etag
@@ -0,0 +1,201 @@
+from array import array
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.services.routing_service import RoutingService
+from app.utils import generate_hash, get_warehouse_location
+import logging
+import MySQLdb.cursors
+import threading
+
+logger = logging.getLogger(__name__)
+
+WAREHOUSE = 'warehouse'
+
+class DayMatrix:
+    """Square travel-time matrix over a fixed set of keyed points.
+
+    Minutes are packed row-major into an ``array('H')`` so a day with a
+    few dozen stops takes a few kilobytes in the shared cache.
+    """
+
+    def __init__(self, keys: List[Any], points: List[Tuple[float, float]], data: array):
+        self.keys = keys
+        self.points = points
+        self.data = data
+        self.index = {key: i for i, key in enumerate(keys)}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.index
+
+    def minutes(self, a: Any, b: Any) -> int:
+        """Travel minutes from key a to key b"""
+        n = len(self.keys)
+        return self.data[self.index[a] * n + self.index[b]]
+
+    def row(self, key: Any) -> List[int]:
+        n = len(self.keys)
+        start = self.index[key] * n
+        return list(self.data[start:start + n])
+
+    def dump(self) -> Dict[str, Any]:
+        return {'keys': self.keys, 'points': self.points, 'data': self.data.tobytes()}
+
+    @staticmethod
+    def load(payload: Dict[str, Any]) -> 'DayMatrix':
+        data = array('H')
+        data.frombytes(payload['data'])
+        return DayMatrix(list(payload['keys']), [tuple(p) for p in payload['points']], data)
+
+    def subset(self, keys: List[Any], size: Optional[int] = None) -> 'DayMatrix':
+        """The sub-matrix over existing keys, with room for ``size`` keys in total"""
+        n, old_n = size or len(keys), len(self.keys)
+        data = array('H', bytes(2 * n * n))
+        for i, ki in enumerate(keys):
+            src = self.index[ki] * old_n
+            for j, kj in enumerate(keys):
+                data[i * n + j] = self.data[src + self.index[kj]]
+        return DayMatrix(list(keys), [self.points_of(k) for k in keys], data)
+
+    def extended(self, extra: Dict[Any, Tuple[float, float]]) -> 'DayMatrix':
+        """A copy with additional points; only their rows and columns are routed"""
+        new = [(k, tuple(p)) for k, p in extra.items() if self.points_of(k) != tuple(p)]
+        if not new:
+            return self
+        keep = [k for k in self.keys if k not in extra or self.points_of(k) == tuple(extra[k])]
+        keys = keep + [k for k, _ in new]
+        points = [self.points_of(k) for k in keep] + [p for _, p in new]
+        n, old_n = len(keys), len(keep)
+        data = self.subset(keep, n).data
+
+        new_points = [p for _, p in new]
+        rows = RoutingService.travel_rect(new_points, points)
+        cols = RoutingService.travel_rect(points[:old_n], new_points)
+        for r, row in enumerate(rows):
+            for j, minutes in enumerate(row):
+                data[(old_n + r) * n + j] = min(minutes, 65535)
+        for i, col in enumerate(cols):
+            for r, minutes in enumerate(col):
+                data[i * n + old_n + r] = min(minutes, 65535)
+        return DayMatrix(keys, points, data)
+
+    def points_of(self, key: Any) -> Optional[Tuple[float, float]]:
+        i = self.index.get(key)
+        return tuple(self.points[i]) if i is not None else None
+
+
+class MatrixService:
+    """Travel-time matrix for each driver's day.
+
+    The matrix covers the warehouse and the addresses of the driver's
+    non-cancelled deliveries on that date. It is stored in the shared cache
+    under a hash of the point set, with a per driver/day pointer to the
+    latest hash. When the day's stops change, only the rows and columns of
+    the new addresses are routed; removed addresses are simply dropped.
+    """
+    _local: 'OrderedDict[str, DayMatrix]' = OrderedDict()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _pointer_key(driver_id: int, delivery_date: str) -> str:
+        return f"day_matrix:{int(driver_id)}:{str(delivery_date)[:10]}"
+
+    @staticmethod
+    def _matrix_key(digest: str) -> str:
+        return f"travel_matrix:{digest}"
+
+    @staticmethod
+    def _digest(points: Dict[Any, Tuple[float, float]]) -> str:
+        return generate_hash(sorted(f"{k}:{p[0]:.6f}:{p[1]:.6f}" for k, p in points.items()))
+
+    @staticmethod
+    def _day_points(driver_id: int, delivery_date: str) -> Dict[Any, Tuple[float, float]]:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT DISTINCT a.id, a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.driver_id = %s AND d.delivery_date = %s AND d.status != 'cancelled'
+                AND a.latitude IS NOT NULL AND a.longitude IS NOT NULL
+            """, (driver_id, delivery_date))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        warehouse = get_warehouse_location()
+        points = {WAREHOUSE: (warehouse['lat'], warehouse['lng'])}
+        for row in rows:
+            points[row['id']] = (float(row['latitude']), float(row['longitude']))
+        return points
+
+    @staticmethod
+    def _get_cached(digest: str) -> Optional[DayMatrix]:
+        matrix = MatrixService._local.get(digest)
+        if matrix is not None:
+            return matrix
+        try:
+            payload = cache.get(MatrixService._matrix_key(digest))
+        except Exception as e:
+            logger.warning(f"Could not read travel matrix: {str(e)}")
+            payload = None
+        if not payload:
+            return None
+        matrix = DayMatrix.load(payload)
+        MatrixService._remember(digest, matrix)
+        return matrix
+
+    @staticmethod
+    def _remember(digest: str, matrix: DayMatrix) -> None:
+        with MatrixService._lock:
+            MatrixService._local[digest] = matrix
+            MatrixService._local.move_to_end(digest)
+            while len(MatrixService._local) > Config.MATRIX_LOCAL_ENTRIES:
+                MatrixService._local.popitem(last=False)
+
+    @staticmethod
+    def get_day_matrix(
+        driver_id: int,
+        delivery_date: str,
+        extra: Optional[Dict[Any, Tuple[float, float]]] = None
+    ) -> DayMatrix:
+        """Matrix for a driver's day, keyed by address id and ``WAREHOUSE``.
+
+        ``extra`` points (e.g. a delivery that is about to be scheduled) are
+        added for this call only and do not change the stored matrix.
+        """
+        delivery_date = str(delivery_date)[:10]
+        points = MatrixService._day_points(driver_id, delivery_date)
+        digest = MatrixService._digest(points)
+
+        matrix = MatrixService._get_cached(digest)
+        if matrix is None:
+            try:
+                previous = cache.get(MatrixService._pointer_key(driver_id, delivery_date))
+            except Exception as e:
+                logger.warning(f"Could not read travel matrix pointer: {str(e)}")
+                previous = None
+            base = MatrixService._get_cached(previous) if previous else None
+            if base is None:
+                base = DayMatrix([], [], array('H'))
+
+            # Reuse the previous matrix: drop removed stops, route new ones
+            kept = [k for k in base.keys if points.get(k) == base.points_of(k)]
+            trimmed = base.subset(kept)
+            matrix = trimmed.extended({k: p for k, p in points.items() if k not in trimmed})
+
+            MatrixService._remember(digest, matrix)
+            try:
+                cache.set(MatrixService._matrix_key(digest), matrix.dump(), timeout=Config.MATRIX_CACHE_TTL)
+                cache.set(MatrixService._pointer_key(driver_id, delivery_date), digest,
+                          timeout=Config.MATRIX_CACHE_TTL)
+            except Exception as e:
+                logger.warning(f"Could not store travel matrix: {str(e)}")
+
+        if extra:
+            matrix = matrix.extended({k: tuple(p) for k, p in extra.items() if p})
+        return matrix
@@ -0,0 +1,347 @@
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.services.matrix_service import MatrixService, WAREHOUSE
+from app.utils import time_to_minutes, minutes_to_time
+import logging
+import MySQLdb.cursors
+
+logger = logging.getLogger(__name__)
+
+ORIGIN = 'origin'
+
+class RouteService:
+    """Per driver/day stop order, kept up to date incrementally.
+
+    The last planned order of a driver's open stops is cached. When stops
+    are completed, cancelled, added or reassigned the cached order is
+    reconciled with the database by removing and inserting single stops
+    and then repairing only the neighbourhood of each change, so the rest
+    of the route keeps the order the driver already knows.
+    """
+
+    @staticmethod
+    def _key(driver_id: int, delivery_date: str) -> str:
+        return f"route_plan:{int(driver_id)}:{str(delivery_date)[:10]}"
+
+    @staticmethod
+    def _cached_order(driver_id: int, delivery_date: str) -> Optional[List[int]]:
+        try:
+            cached = cache.get(RouteService._key(driver_id, delivery_date))
+        except Exception as e:
+            logger.warning(f"Could not read cached route: {str(e)}")
+            return None
+        return list(cached['order']) if cached else None
+
+    @staticmethod
+    def store_route(driver_id: int, delivery_date: str, order: List[int]) -> None:
+        """Remember a planned stop order for a driver's day"""
+        try:
+            cache.set(RouteService._key(driver_id, delivery_date),
+                      {'order': [int(d) for d in order]}, timeout=Config.ROUTE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not cache route: {str(e)}")
+
+    @staticmethod
+    def _load_day(driver_id: int, delivery_date: str) -> Tuple[Dict[int, Dict[str, Any]], Optional[int]]:
+        """Open stops of the day and the address of the last completed one"""
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT d.id, d.address_id, d.status, d.start_time, d.end_time, d.updated_at,
+                       a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.driver_id = %s AND d.delivery_date = %s
+                AND d.status IN ('pending', 'in_progress', 'completed')
+            """, (driver_id, delivery_date))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        shift_start = time_to_minutes(Config.DISPATCH_SHIFT_START)
+        shift_end = time_to_minutes(Config.DISPATCH_SHIFT_END)
+        stops = {}
+        last_done = None
+        for row in rows:
+            # Stops without coordinates are not in the day matrix
+            node = row['address_id'] if row['latitude'] is not None and row['longitude'] is not None else None
+            if row['status'] == 'completed':
+                finished = row['updated_at'] or datetime.min
+                if node is not None and (last_done is None or finished > last_done[0]):
+                    last_done = (finished, node)
+                continue
+            ready = time_to_minutes(row['start_time'])
+            due = time_to_minutes(row['end_time'])
+            stops[row['id']] = {
+                'status': row['status'],
+                'node': node,
+                'ready': ready if ready is not None else shift_start,
+                'due': due if due is not None else shift_end
+            }
+        return stops, last_done[1] if last_done else None
+
+    @staticmethod
+    def _context(driver_id: int, delivery_date: str) -> Dict[str, Any]:
+        """Everything the cost function needs for one driver's day"""
+        stops, last_node = RouteService._load_day(driver_id, delivery_date)
+        nodes = {stop_id: stop['node'] for stop_id, stop in stops.items()}
+        nodes[WAREHOUSE] = nodes[ORIGIN] = WAREHOUSE
+        clock = time_to_minutes(Config.DISPATCH_SHIFT_START)
+        if str(delivery_date)[:10] == date.today().isoformat():
+            # Mid-day: the driver continues from the last finished stop, now
+            now = datetime.now()
+            clock = max(clock, now.hour * 60 + now.minute)
+            if last_node is not None:
+                nodes[ORIGIN] = last_node
+        matrix = MatrixService.get_day_matrix(driver_id, delivery_date)
+        return {'stops': stops, 'nodes': nodes, 'matrix': matrix, 'clock': clock}
+
+    @staticmethod
+    def _travel(ctx: Dict[str, Any], a: Any, b: Any) -> int:
+        # Stops without coordinates cost nothing to reach
+        na, nb = ctx['nodes'].get(a), ctx['nodes'].get(b)
+        if na not in ctx['matrix'] or nb not in ctx['matrix']:
+            return 0
+        return ctx['matrix'].minutes(na, nb)
+
+    @staticmethod
+    def _cost(ctx: Dict[str, Any], order: List[int]) -> int:
+        """Drive minutes back to the warehouse plus a penalty for lateness"""
+        stops = ctx['stops']
+        clock, prev, travel, late = ctx['clock'], ORIGIN, 0, 0
+        for stop_id in order:
+            leg = RouteService._travel(ctx, prev, stop_id)
+            travel += leg
+            clock = max(clock + leg, stops[stop_id]['ready'])
+            late += max(0, clock - stops[stop_id]['due'])
+            clock += Config.DISPATCH_SERVICE_MINUTES
+            prev = stop_id
+        travel += RouteService._travel(ctx, prev, WAREHOUSE)
+        return travel + Config.ROUTE_LATE_PENALTY * late
+
+    @staticmethod
+    def _insert(ctx: Dict[str, Any], order: List[int], stop_id: int, first: int) -> int:
+        """Insert a stop at its cheapest position at or after ``first``"""
+        best_pos, best_cost = first, None
+        for pos in range(first, len(order) + 1):
+            cost = RouteService._cost(ctx, order[:pos] + [stop_id] + order[pos:])
+            if best_cost is None or cost < best_cost:
+                best_pos, best_cost = pos, cost
+        order.insert(best_pos, stop_id)
+        return best_pos
+
+    @staticmethod
+    def _repair(ctx: Dict[str, Any], order: List[int], lo: int, hi: int, first: int) -> List[int]:
+        """Bounded local search over positions [lo, hi] of the route.
+
+        Only relocations and segment reversals that stay inside the window
+        are tried, for at most ROUTE_REPAIR_MAX_PASSES passes.
+        """
+        lo = max(first, lo)
+        hi = min(len(order) - 1, hi)
+        best = RouteService._cost(ctx, order)
+        for _ in range(Config.ROUTE_REPAIR_MAX_PASSES):
+            improved = False
+            for i in range(lo, hi + 1):
+                for j in range(lo, hi + 1):
+                    if i == j:
+                        continue
+                    # Relocate the stop at i to position j
+                    candidate = order[:i] + order[i + 1:]
+                    candidate.insert(j, order[i])
+                    cost = RouteService._cost(ctx, candidate)
+                    if cost < best:
+                        order, best, improved = candidate, cost, True
+                        continue
+                    if i < j:
+                        # Reverse the segment i..j
+                        candidate = order[:i] + order[i:j + 1][::-1] + order[j + 1:]
+                        cost = RouteService._cost(ctx, candidate)
+                        if cost < best:
+                            order, best, improved = candidate, cost, True
+            if not improved:
+                break
+        return order
+
+    @staticmethod
+    def _build(ctx: Dict[str, Any]) -> List[int]:
+        """Plan a route from scratch: earliest windows first, then repair"""
+        stops = ctx['stops']
+        pinned = [s for s in stops if stops[s]['status'] == 'in_progress']
+        order = list(pinned)
+        for stop_id in sorted((s for s in stops if s not in pinned),
+                              key=lambda s: (stops[s]['ready'], stops[s]['due'], s)):
+            RouteService._insert(ctx, order, stop_id, len(pinned))
+        return RouteService._repair(ctx, order, len(pinned), len(order) - 1, len(pinned))
+
+    @staticmethod
+    def _reconcile(ctx: Dict[str, Any], order: List[int]) -> Tuple[List[int], bool]:
+        """Apply removal/insertion moves so the cached order matches the open stops"""
+        stops = ctx['stops']
+        W = Config.ROUTE_REPAIR_WINDOW
+        changed = False
+
+        # Drop stops that were completed, cancelled or moved elsewhere
+        kept = []
+        removed_at = []
+        for stop_id in order:
+            if stop_id in stops:
+                kept.append(stop_id)
+            else:
+                removed_at.append(len(kept))
+                changed = True
+        order = kept
+
+        # A started stop is where the driver is heading, keep it in front
+        pinned = [s for s in order if stops[s]['status'] == 'in_progress']
+        pinned += [s for s in stops if stops[s]['status'] == 'in_progress' and s not in pinned]
+        if order[:len(pinned)] != pinned:
+            order = pinned + [s for s in order if s not in pinned]
+            changed = True
+        first = len(pinned)
+
+        for pos in removed_at:
+            order = RouteService._repair(ctx, order, pos - W, pos + W, first)
+
+        # New or reassigned stops go to their cheapest slot
+        for stop_id in sorted(s for s in stops if s not in order):
+            pos = RouteService._insert(ctx, order, stop_id, first)
+            order = RouteService._repair(ctx, order, pos - W, pos + W, first)
+            changed = True
+        return order, changed
+
+    @staticmethod
+    def _plan(driver_id: int, delivery_date: str) -> Tuple[Dict[str, Any], List[int]]:
+        """Context and current order of a day, storing it and its ETAs when it changed"""
+        ctx = RouteService._context(driver_id, delivery_date)
+        order = RouteService._cached_order(driver_id, delivery_date)
+        if order is None:
+            order = RouteService._build(ctx)
+        else:
+            order, changed = RouteService._reconcile(ctx, order)
+            if not changed:
+                return ctx, order
+        RouteService.store_route(driver_id, delivery_date, order)
+        RouteService._write_etas(RouteService._timeline(ctx, order))
+        return ctx, order
+
+    @staticmethod
+    def get_route(driver_id: int, delivery_date: str) -> List[int]:
+        """Ordered open delivery ids for a driver's day, planning it on first use"""
+        return RouteService._plan(driver_id, str(delivery_date)[:10])[1]
+
+    @staticmethod
+    def _timeline(ctx: Dict[str, Any], order: List[int]) -> Dict[str, Any]:
+        """Arrival, wait and slack for each stop of an ordered route.
+
+        ETAs are minutes after the shift start: ``arrival_minutes`` is the
+        arrival at the stop and ``return_eta_minutes`` the arrival back at
+        the warehouse after the last stop, the same for the whole route.
+        """
+        stops = ctx['stops']
+        shift_start = time_to_minutes(Config.DISPATCH_SHIFT_START)
+        clock, prev, travel, late = ctx['clock'], ORIGIN, 0, 0
+        timeline = []
+        for stop_id in order:
+            leg = RouteService._travel(ctx, prev, stop_id)
+            travel += leg
+            arrival = clock + leg
+            service_start = max(arrival, stops[stop_id]['ready'])
+            slack = stops[stop_id]['due'] - service_start
+            late += max(0, -slack)
+            timeline.append({
+                'delivery_id': stop_id,
+                'arrival': minutes_to_time(arrival),
+                'service_start': minutes_to_time(service_start),
+                'wait_minutes': service_start - arrival,
+                'window': [minutes_to_time(stops[stop_id]['ready']), minutes_to_time(stops[stop_id]['due'])],
+                'slack_minutes': slack,
+                'late': slack < 0,
+                'arrival_minutes': arrival - shift_start
+            })
+            clock = service_start + Config.DISPATCH_SERVICE_MINUTES
+            prev = stop_id
+        back = RouteService._travel(ctx, prev, WAREHOUSE)
+        travel += back
+        clock += back
+        return {
+            'start': minutes_to_time(ctx['clock']),
+            'stops': timeline,
+            'travel_minutes': travel,
+            'late_minutes': late,
+            'return_at': minutes_to_time(clock),
+            'return_eta_minutes': clock - shift_start
+        }
+
+    @staticmethod
+    def _write_etas(timeline: Dict[str, Any]) -> bool:
+        """Store every stop's arrival and the route's return ETA in one UPDATE.
+
+        eta_minutes stays the warehouse-to-stop travel time set when the
+        delivery is created, which the ETA averages and exports report.
+        """
+        if not timeline['stops']:
+            return True
+        ids = [stop['delivery_id'] for stop in timeline['stops']]
+        cases = ' '.join(['WHEN %s THEN %s'] * len(ids))
+        placeholders = ', '.join(['%s'] * len(ids))
+        params: List[Any] = []
+        for stop in timeline['stops']:
+            params.extend([stop['delivery_id'], stop['arrival_minutes']])
+        params.append(timeline['return_eta_minutes'])
+        params.extend(ids)
+
+        cursor = mysql.connection.cursor()
+        try:
+            cursor.execute(f"""
+                UPDATE deliveries
+                SET arrival_minutes = CASE id {cases} END,
+                    return_eta_minutes = %s
+                WHERE id IN ({placeholders})
+            """, tuple(params))
+            mysql.connection.commit()
+            return True
+        except Exception as e:
+            mysql.connection.rollback()
+            logger.error(f"Error writing route ETAs: {str(e)}")
+            return False
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def get_timeline(driver_id: int, delivery_date: str) -> Dict[str, Any]:
+        """Timeline of a driver's open stops in their planned order"""
+        delivery_date = str(delivery_date)[:10]
+        ctx, order = RouteService._plan(driver_id, delivery_date)
+        timeline = RouteService._timeline(ctx, order)
+        timeline.update(driver_id=driver_id, date=delivery_date)
+        return timeline
+
+    @staticmethod
+    def update_etas(driver_id: int, delivery_date: str) -> bool:
+        """Recompute and store the ETAs of a driver's day from its planned order"""
+        try:
+            ctx, order = RouteService._plan(driver_id, str(delivery_date)[:10])
+            return RouteService._write_etas(RouteService._timeline(ctx, order))
+        except Exception as e:
+            logger.error(f"Error updating ETAs for driver {driver_id} on {delivery_date}: {str(e)}")
+            return False
+
+    @staticmethod
+    def sync(slots: Iterable[Tuple[int, str]]) -> None:
+        """Update the cached routes of changed driver/days.
+
+        Days that were never planned are skipped; they are planned lazily
+        by get_route when somebody asks for them.
+        """
+        for driver_id, delivery_date in set(slots):
+            if not driver_id or not delivery_date:
+                continue
+            try:
+                if RouteService._cached_order(driver_id, delivery_date) is not None:
+                    RouteService.get_route(driver_id, delivery_date)
+            except Exception as e:
+                logger.error(f"Error updating route for driver {driver_id} on {delivery_date}: {str(e)}")
@@ -0,0 +1,349 @@
+from array import array
+from typing import Optional, List, Dict, Any, Tuple
+from app.config import Config
+from app.utils import calculate_distance, estimate_travel_minutes
+from math import ceil, cos, floor, radians
+import csv
+import heapq
+import logging
+import os
+import pickle
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Fallback speeds (km/h) by OSM highway class when an edge has no maxspeed
+HIGHWAY_SPEEDS = {
+    'motorway': 110, 'motorway_link': 60,
+    'trunk': 80, 'trunk_link': 50,
+    'primary': 50, 'primary_link': 40,
+    'secondary': 45, 'secondary_link': 35,
+    'tertiary': 40, 'tertiary_link': 30,
+    'unclassified': 30, 'residential': 30,
+    'living_street': 10, 'service': 15,
+}
+
+# Size of a snapping grid cell in degrees (roughly 500 m)
+GRID_CELL = 0.005
+
+class RoadGraph:
+    """Directed road graph in compressed sparse row form.
+
+    Nodes are numbered 0..n-1 with coordinates in two ``array('d')``; the
+    outgoing edges of node ``u`` are ``targets[offsets[u]:offsets[u + 1]]``
+    with travel seconds in the matching slots of ``weights``. The reversed
+    graph is stored the same way for the backward half of bidirectional
+    searches.
+    """
+
+    def __init__(self, lats: array, lons: array, edges: List[Tuple[int, int, float]]):
+        self.lats = lats
+        self.lons = lons
+        self.offsets, self.targets, self.weights = self._csr(len(lats), edges, 0, 1)
+        self.r_offsets, self.r_targets, self.r_weights = self._csr(len(lats), edges, 1, 0)
+        self.grid: Dict[Tuple[int, int], array] = {}
+        for node in range(len(lats)):
+            # Only nodes with outgoing edges are useful snapping targets
+            if self.offsets[node] != self.offsets[node + 1]:
+                cell = (floor(lats[node] / GRID_CELL), floor(lons[node] / GRID_CELL))
+                self.grid.setdefault(cell, array('i')).append(node)
+
+    @staticmethod
+    def _csr(n: int, edges: List[Tuple[int, int, float]], src: int, dst: int) -> Tuple[array, array, array]:
+        counts = [0] * (n + 1)
+        for edge in edges:
+            counts[edge[src] + 1] += 1
+        for i in range(n):
+            counts[i + 1] += counts[i]
+        offsets = array('i', counts)
+        fill = list(counts[:n])
+        targets = array('i', bytes(4 * len(edges)))
+        weights = array('f', bytes(4 * len(edges)))
+        for edge in edges:
+            slot = fill[edge[src]]
+            targets[slot] = edge[dst]
+            weights[slot] = edge[2]
+            fill[edge[src]] += 1
+        return offsets, targets, weights
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    def nearest(self, lat: float, lon: float, max_rings: int = 4) -> Optional[Tuple[int, float]]:
+        """Closest routable node to a point, as (node, distance in km)"""
+        cy, cx = floor(lat / GRID_CELL), floor(lon / GRID_CELL)
+        best = None
+        for ring in range(max_rings + 1):
+            for dy in range(-ring, ring + 1):
+                for dx in range(-ring, ring + 1):
+                    if max(abs(dy), abs(dx)) != ring:
+                        continue
+                    for node in self.grid.get((cy + dy, cx + dx), ()):
+                        km = calculate_distance(lat, lon, self.lats[node], self.lons[node])
+                        if best is None or km < best[1]:
+                            best = (node, km)
+            # Anything in the next ring is at least ``ring`` cells away
+            if best and best[1] < ring * GRID_CELL * 111.32 * cos(radians(lat)):
+                break
+        return best
+
+    def shortest_time(self, source: int, target: int) -> Optional[float]:
+        """Travel seconds from source to target using bidirectional Dijkstra"""
+        if source == target:
+            return 0.0
+        dist = ({source: 0.0}, {target: 0.0})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        graphs = ((self.offsets, self.targets, self.weights),
+                  (self.r_offsets, self.r_targets, self.r_weights))
+        best = None
+        while heaps[0] and heaps[1]:
+            # Stop once the two frontiers cannot produce a shorter path
+            if best is not None and heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side].get(u, float('inf')):
+                continue
+            offsets, targets, weights = graphs[side]
+            mine, other = dist[side], dist[1 - side]
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = targets[slot]
+                nd = d + weights[slot]
+                if nd < mine.get(v, float('inf')):
+                    mine[v] = nd
+                    heapq.heappush(heaps[side], (nd, v))
+                    if v in other and (best is None or nd + other[v] < best):
+                        best = nd + other[v]
+        return best
+
+    def one_to_many(self, source: int, targets: List[int], reverse: bool = False) -> Dict[int, float]:
+        """Travel seconds from source to each target with a single Dijkstra.
+
+        With ``reverse`` the search runs on the reversed graph and returns
+        the travel seconds from each target to source instead. The search
+        stops as soon as every target has been settled.
+        """
+        remaining = set(targets)
+        found: Dict[int, float] = {}
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        if reverse:
+            offsets, adjacent, weights = self.r_offsets, self.r_targets, self.r_weights
+        else:
+            offsets, adjacent, weights = self.offsets, self.targets, self.weights
+        while heap and remaining:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            if u in remaining:
+                found[u] = d
+                remaining.discard(u)
+            for slot in range(offsets[u], offsets[u + 1]):
+                v = adjacent[slot]
+                nd = d + weights[slot]
+                if nd < dist.get(v, float('inf')):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return found
+
+
+class RoutingService:
+    """Travel times from a local road network, with no network calls.
+
+    The graph is loaded once per process from ``ROAD_NETWORK_PATH``, either
+    an OSM ``.pbf`` extract (needs the optional ``osmium`` package) or an
+    edge CSV with the columns ``u,v,u_lat,u_lon,v_lat,v_lon`` and optionally
+    ``length_m``, ``maxspeed``, ``highway`` and ``oneway``. The parsed graph
+    is pickled next to the extract so later starts skip parsing. Without a
+    configured extract every call falls back to estimate_travel_minutes.
+    """
+    _graph: Optional[RoadGraph] = None
+    _loaded = False
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _edge_seconds(length_m: float, maxspeed: Any, highway: Optional[str]) -> float:
+        try:
+            speed = float(str(maxspeed).split()[0])
+        except (TypeError, ValueError, IndexError):
+            speed = HIGHWAY_SPEEDS.get(highway or '', Config.SCHEDULE_AVG_SPEED_KMH)
+        return length_m / (max(speed, 5.0) / 3.6)
+
+    @staticmethod
+    def _parse_csv(path: str) -> RoadGraph:
+        ids: Dict[str, int] = {}
+        lats, lons = array('d'), array('d')
+        edges: List[Tuple[int, int, float]] = []
+
+        def node(key: str, lat: str, lon: str) -> int:
+            if key not in ids:
+                ids[key] = len(lats)
+                lats.append(float(lat))
+                lons.append(float(lon))
+            return ids[key]
+
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                u = node(row['u'], row['u_lat'], row['u_lon'])
+                v = node(row['v'], row['v_lat'], row['v_lon'])
+                length_m = float(row.get('length_m') or 0) or \
+                    calculate_distance(lats[u], lons[u], lats[v], lons[v]) * 1000
+                seconds = RoutingService._edge_seconds(length_m, row.get('maxspeed'), row.get('highway'))
+                edges.append((u, v, seconds))
+                if str(row.get('oneway', '')).lower() not in ('yes', 'true', '1'):
+                    edges.append((v, u, seconds))
+        return RoadGraph(lats, lons, edges)
+
+    @staticmethod
+    def _parse_pbf(path: str) -> RoadGraph:
+        try:
+            import osmium
+        except ImportError:
+            raise RuntimeError("Reading .pbf road networks requires the 'osmium' package")
+
+        ids: Dict[int, int] = {}
+        lats, lons = array('d'), array('d')
+        edges: List[Tuple[int, int, float]] = []
+
+        class WayHandler(osmium.SimpleHandler):
+            def way(self, w):
+                highway = w.tags.get('highway')
+                if highway not in HIGHWAY_SPEEDS:
+                    return
+                oneway = w.tags.get('oneway', 'no') in ('yes', 'true', '1') or highway.startswith('motorway')
+                maxspeed = w.tags.get('maxspeed')
+                prev = None
+                for n in w.nodes:
+                    if not n.location.valid():
+                        prev = None
+                        continue
+                    if n.ref not in ids:
+                        ids[n.ref] = len(lats)
+                        lats.append(n.location.lat)
+                        lons.append(n.location.lon)
+                    cur = ids[n.ref]
+                    if prev is not None:
+                        length_m = calculate_distance(lats[prev], lons[prev], lats[cur], lons[cur]) * 1000
+                        seconds = RoutingService._edge_seconds(length_m, maxspeed, highway)
+                        edges.append((prev, cur, seconds))
+                        if not oneway:
+                            edges.append((cur, prev, seconds))
+                    prev = cur
+
+        WayHandler().apply_file(path, locations=True)
+        return RoadGraph(lats, lons, edges)
+
+    @staticmethod
+    def load_graph(path: str, rebuild: bool = False) -> RoadGraph:
+        """Parse an extract, reusing the pickled graph when it is up to date"""
+        compiled = path + '.graph'
+        if not rebuild and os.path.exists(compiled) and os.path.getmtime(compiled) >= os.path.getmtime(path):
+            with open(compiled, 'rb') as f:
+                return pickle.load(f)
+
+        if path.endswith('.pbf'):
+            graph = RoutingService._parse_pbf(path)
+        else:
+            graph = RoutingService._parse_csv(path)
+        try:
+            with open(compiled, 'wb') as f:
+                pickle.dump(graph, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            logger.warning(f"Could not write compiled road network: {str(e)}")
+        return graph
+
+    @staticmethod
+    def get_graph() -> Optional[RoadGraph]:
+        """The process-wide road graph, or None when no extract is configured"""
+        if RoutingService._loaded:
+            return RoutingService._graph
+        with RoutingService._lock:
+            if not RoutingService._loaded:
+                path = Config.ROAD_NETWORK_PATH
+                if path:
+                    try:
+                        RoutingService._graph = RoutingService.load_graph(path)
+                        logger.info(f"Loaded road network: {len(RoutingService._graph)} nodes, "
+                                    f"{RoutingService._graph.edge_count} edges")
+                    except Exception as e:
+                        logger.error(f"Error loading road network from {path}: {str(e)}")
+                RoutingService._loaded = True
+        return RoutingService._graph
+
+    @staticmethod
+    def available() -> bool:
+        return RoutingService.get_graph() is not None
+
+    @staticmethod
+    def _snap(graph: RoadGraph, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+        """Nearest node and the minutes needed to reach it off-network"""
+        hit = graph.nearest(float(lat), float(lng))
+        if not hit:
+            return None
+        node, km = hit
+        return node, km * Config.SCHEDULE_ROAD_FACTOR / Config.SCHEDULE_AVG_SPEED_KMH * 60
+
+    @staticmethod
+    def travel_minutes(lat1: float, lng1: float, lat2: float, lng2: float) -> int:
+        """Driving minutes between two points"""
+        graph = RoutingService.get_graph()
+        if graph is not None:
+            a = RoutingService._snap(graph, lat1, lng1)
+            b = RoutingService._snap(graph, lat2, lng2)
+            if a and b:
+                seconds = graph.shortest_time(a[0], b[0])
+                if seconds is not None:
+                    return int(ceil(seconds / 60 + a[1] + b[1]))
+        return estimate_travel_minutes(lat1, lng1, lat2, lng2)
+
+    @staticmethod
+    def travel_rect(
+        origins: List[Tuple[float, float]],
+        destinations: List[Tuple[float, float]]
+    ) -> List[List[int]]:
+        """Driving minutes from every origin (rows) to every destination (columns).
+
+        With a road network this runs one bounded Dijkstra per origin, or
+        one per destination on the reversed graph when there are fewer
+        destinations; pairs the network cannot connect use the
+        straight-line estimate.
+        """
+        matrix = [[0] * len(destinations) for _ in origins]
+        graph = RoutingService.get_graph()
+        if graph:
+            src = [RoutingService._snap(graph, lat, lng) for lat, lng in origins]
+            dst = [RoutingService._snap(graph, lat, lng) for lat, lng in destinations]
+        else:
+            src, dst = [None] * len(origins), [None] * len(destinations)
+
+        reverse = len(destinations) < len(origins)
+        searched = {}
+        if reverse:
+            nodes = [s[0] for s in src if s]
+            for j, d in enumerate(dst):
+                searched[j] = graph.one_to_many(d[0], nodes, reverse=True) if d else {}
+        else:
+            nodes = [d[0] for d in dst if d]
+            for i, s in enumerate(src):
+                searched[i] = graph.one_to_many(s[0], nodes) if s else {}
+
+        for i, (s, origin) in enumerate(zip(src, origins)):
+            for j, (d, destination) in enumerate(zip(dst, destinations)):
+                if origin == destination:
+                    continue
+                found = searched[j] if reverse else searched[i]
+                node = (s if reverse else d)[0] if s and d else None
+                if node is not None and node in found:
+                    matrix[i][j] = int(ceil(found[node] / 60 + s[1] + d[1]))
+                else:
+                    matrix[i][j] = estimate_travel_minutes(origin[0], origin[1], destination[0], destination[1])
+        return matrix
+
+    @staticmethod
+    def travel_matrix(points: List[Tuple[float, float]]) -> List[List[int]]:
+        """Driving minutes between every pair of points"""
+        return RoutingService.travel_rect(points, points)
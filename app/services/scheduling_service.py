@@ -0,0 +1,371 @@
+from typing import Optional, List, Dict, Any, Iterable, Tuple
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.services.matrix_service import MatrixService
+from app.utils import time_to_minutes, minutes_to_time
+import logging
+import MySQLdb.cursors
+import random
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class _Node:
+    __slots__ = ('key', 'start', 'end', 'item', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, start: int, end: int, item: Dict[str, Any]):
+        self.key = (start, item['id'])
+        self.start = start
+        self.end = end
+        self.item = item
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+
+class IntervalTree:
+    """Interval tree over [start, end) minute ranges.
+
+    Implemented as a treap ordered by (start, id) where every node also
+    stores the largest end in its subtree, so insert/remove are O(log n)
+    and an overlap query is O(log n + k).
+    """
+
+    def __init__(self, items: Iterable[Dict[str, Any]] = ()):
+        self._root = None
+        self._keys: Dict[Any, Tuple[int, Any]] = {}
+        for item in items:
+            self.insert(item)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, item_id) -> bool:
+        return item_id in self._keys
+
+    @staticmethod
+    def _update(node: _Node) -> _Node:
+        node.max_end = node.end
+        if node.left and node.left.max_end > node.max_end:
+            node.max_end = node.left.max_end
+        if node.right and node.right.max_end > node.max_end:
+            node.max_end = node.right.max_end
+        return node
+
+    def _insert(self, node: Optional[_Node], new: _Node) -> _Node:
+        if node is None:
+            return new
+        if new.key < node.key:
+            node.left = self._insert(node.left, new)
+            if node.left.priority > node.priority:
+                # Rotate right
+                top = node.left
+                node.left = top.right
+                top.right = self._update(node)
+                node = top
+        else:
+            node.right = self._insert(node.right, new)
+            if node.right.priority > node.priority:
+                # Rotate left
+                top = node.right
+                node.right = top.left
+                top.left = self._update(node)
+                node = top
+        return self._update(node)
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            return self._update(left)
+        right.left = self._merge(left, right.left)
+        return self._update(right)
+
+    def _remove(self, node: Optional[_Node], key: Tuple[int, Any]) -> Optional[_Node]:
+        if node is None:
+            return None
+        if key == node.key:
+            return self._merge(node.left, node.right)
+        if key < node.key:
+            node.left = self._remove(node.left, key)
+        else:
+            node.right = self._remove(node.right, key)
+        return self._update(node)
+
+    def insert(self, item: Dict[str, Any]) -> None:
+        """Insert an item with integer 'start', 'end' and a unique 'id'"""
+        if item['id'] in self._keys:
+            self.remove(item['id'])
+        node = _Node(item['start'], item['end'], item)
+        self._keys[item['id']] = node.key
+        self._root = self._insert(self._root, node)
+
+    def remove(self, item_id) -> bool:
+        key = self._keys.pop(item_id, None)
+        if key is None:
+            return False
+        self._root = self._remove(self._root, key)
+        return True
+
+    def overlapping(self, lo: int, hi: int) -> List[Dict[str, Any]]:
+        """All items whose [start, end) intersects [lo, hi), ordered by start"""
+        result: List[Dict[str, Any]] = []
+        stack = []
+        node = self._root
+        # Iterative in-order walk that skips subtrees which cannot overlap
+        while stack or node:
+            while node is not None and node.max_end > lo:
+                stack.append(node)
+                node = node.left
+            if not stack:
+                break
+            node = stack.pop()
+            if node.start >= hi:
+                break
+            if node.end > lo:
+                result.append(node.item)
+            node = node.right
+        return result
+
+
+class SchedulingService:
+    # (driver_id, 'YYYY-MM-DD') -> (tree, version token, loaded_at)
+    _trees: Dict[Tuple[int, str], Tuple[IntervalTree, Optional[str], float]] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _version_key(driver_id: int, delivery_date: str) -> str:
+        return f"schedule_version:{driver_id}:{delivery_date}"
+
+    @staticmethod
+    def _current_version(driver_id: int, delivery_date: str) -> Optional[str]:
+        try:
+            return cache.get(SchedulingService._version_key(driver_id, delivery_date))
+        except Exception as e:
+            logger.warning(f"Could not read schedule version: {str(e)}")
+            return None
+
+    @staticmethod
+    def invalidate(driver_id: Optional[int], delivery_date: Any) -> None:
+        """Drop the cached tree for a driver/day here and in every other worker"""
+        if not driver_id or not delivery_date:
+            return
+        delivery_date = str(delivery_date)[:10]
+        with SchedulingService._lock:
+            SchedulingService._trees.pop((int(driver_id), delivery_date), None)
+        try:
+            cache.set(SchedulingService._version_key(int(driver_id), delivery_date),
+                      uuid.uuid4().hex, timeout=86400)
+        except Exception as e:
+            logger.warning(f"Could not bump schedule version: {str(e)}")
+
+    @staticmethod
+    def invalidate_deliveries(delivery_ids: Iterable[int]) -> List[Tuple[int, str]]:
+        """Invalidate the driver/days that currently hold the given deliveries.
+
+        Returns the (driver_id, date) pairs so callers can invalidate them
+        again after a write that moves the deliveries.
+        """
+        delivery_ids = [int(d) for d in delivery_ids]
+        if not delivery_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(delivery_ids))
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute(f"""
+                SELECT DISTINCT driver_id, delivery_date
+                FROM deliveries
+                WHERE id IN ({placeholders})
+            """, tuple(delivery_ids))
+            slots = [(row['driver_id'], str(row['delivery_date'])[:10]) for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Error looking up delivery slots: {str(e)}")
+            return []
+        finally:
+            cursor.close()
+        for driver_id, delivery_date in slots:
+            SchedulingService.invalidate(driver_id, delivery_date)
+        return slots
+
+    @staticmethod
+    def _load_tree(driver_id: int, delivery_date: str) -> IntervalTree:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT d.id, d.start_time, d.end_time, d.address_id, a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.driver_id = %s AND d.delivery_date = %s AND d.status != 'cancelled'
+            """, (driver_id, delivery_date))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        tree = IntervalTree()
+        for row in rows:
+            item = SchedulingService._make_item(
+                row['id'], row['start_time'], row['end_time'],
+                row['address_id'], row['latitude'], row['longitude']
+            )
+            if item:
+                tree.insert(item)
+        return tree
+
+    @staticmethod
+    def _make_item(delivery_id, start_time, end_time, address_id, lat, lng) -> Optional[Dict[str, Any]]:
+        start = time_to_minutes(start_time)
+        end = time_to_minutes(end_time)
+        if start is None or end is None:
+            return None
+        return {
+            'id': delivery_id,
+            'start': start,
+            'end': max(end, start),
+            'address_id': address_id,
+            'lat': float(lat) if lat is not None else None,
+            'lng': float(lng) if lng is not None else None
+        }
+
+    @staticmethod
+    def get_tree(driver_id: int, delivery_date: str) -> IntervalTree:
+        """Get the interval tree for a driver's day, loading it lazily"""
+        key = (int(driver_id), str(delivery_date)[:10])
+        version = SchedulingService._current_version(*key)
+        cached = SchedulingService._trees.get(key)
+        if cached:
+            tree, cached_version, loaded_at = cached
+            if cached_version == version and time.time() - loaded_at < Config.SCHEDULE_CACHE_TTL:
+                return tree
+
+        tree = SchedulingService._load_tree(*key)
+        with SchedulingService._lock:
+            SchedulingService._trees[key] = (tree, version, time.time())
+        return tree
+
+    @staticmethod
+    def _conflicts_in(tree: IntervalTree, item: Dict[str, Any], matrix, exclude_ids=()) -> List[Dict[str, Any]]:
+        """Check one interval against a tree, including travel buffers from the day matrix"""
+        buffer = Config.SCHEDULE_MAX_TRAVEL_MINUTES
+        conflicts = []
+        for other in tree.overlapping(item['start'] - buffer, item['end'] + buffer):
+            if other['id'] == item['id'] or other['id'] in exclude_ids:
+                continue
+            conflict = {
+                'delivery_id': other['id'],
+                'start': minutes_to_time(other['start']),
+                'end': minutes_to_time(other['end'])
+            }
+            if other['start'] < item['end'] and other['end'] > item['start']:
+                conflict['type'] = 'overlap'
+                conflicts.append(conflict)
+                continue
+
+            travel = 0
+            if item['address_id'] in matrix and other['address_id'] in matrix:
+                if other['end'] <= item['start']:
+                    travel = matrix.minutes(other['address_id'], item['address_id'])
+                else:
+                    travel = matrix.minutes(item['address_id'], other['address_id'])
+                travel = min(travel, buffer)
+            gap = item['start'] - other['end'] if other['end'] <= item['start'] else other['start'] - item['end']
+            if gap < travel:
+                conflict.update(type='travel', gap_minutes=gap, travel_minutes=travel)
+                conflicts.append(conflict)
+        return conflicts
+
+    @staticmethod
+    def _matrix_for(driver_id: int, delivery_date: str, items: List[Dict[str, Any]]):
+        """The driver's day matrix plus the addresses of items being placed"""
+        extra = {item['address_id']: (item['lat'], item['lng'])
+                 for item in items if item['lat'] is not None and item['lng'] is not None}
+        return MatrixService.get_day_matrix(driver_id, delivery_date, extra)
+
+    @staticmethod
+    def check_delivery(
+        driver_id: int,
+        delivery_date: str,
+        start_time: Any,
+        end_time: Any,
+        address_id: int,
+        exclude_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Return the existing deliveries a new or moved delivery would conflict with"""
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("SELECT latitude, longitude FROM addresses WHERE id = %s", (address_id,))
+            address = cursor.fetchone() or {}
+        finally:
+            cursor.close()
+
+        item = SchedulingService._make_item(
+            exclude_id, start_time, end_time, address_id,
+            address.get('latitude'), address.get('longitude')
+        )
+        if not item:
+            return []
+        tree = SchedulingService.get_tree(driver_id, delivery_date)
+        matrix = SchedulingService._matrix_for(driver_id, delivery_date, [item])
+        return SchedulingService._conflicts_in(tree, item, matrix)
+
+    @staticmethod
+    def validate_bulk(
+        delivery_ids: List[int],
+        new_date: Optional[str] = None,
+        new_driver_id: Optional[int] = None
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Check a bulk reschedule/reassignment before it is written.
+
+        Every moved delivery is checked against the target day's tree and
+        against the other deliveries moved in the same batch; the result
+        maps delivery id to its conflicts (empty when the batch is clean).
+        """
+        delivery_ids = [int(d) for d in delivery_ids]
+        if not delivery_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(delivery_ids))
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute(f"""
+                SELECT d.id, d.driver_id, d.delivery_date, d.start_time, d.end_time,
+                       d.address_id, a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.id IN ({placeholders}) AND d.status = 'pending'
+                ORDER BY d.start_time, d.id
+            """, tuple(delivery_ids))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+
+        moved_ids = {row['id'] for row in rows}
+        groups: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+        for row in rows:
+            driver_id = int(new_driver_id or row['driver_id'])
+            delivery_date = str(new_date or row['delivery_date'])[:10]
+            item = SchedulingService._make_item(
+                row['id'], row['start_time'], row['end_time'],
+                row['address_id'], row['latitude'], row['longitude']
+            )
+            if item:
+                groups.setdefault((driver_id, delivery_date), []).append(item)
+
+        result: Dict[int, List[Dict[str, Any]]] = {}
+        for (driver_id, delivery_date), items in groups.items():
+            tree = SchedulingService.get_tree(driver_id, delivery_date)
+            matrix = SchedulingService._matrix_for(driver_id, delivery_date, items)
+            pending = IntervalTree()
+            for item in items:
+                conflicts = SchedulingService._conflicts_in(tree, item, matrix, moved_ids)
+                conflicts += SchedulingService._conflicts_in(pending, item, matrix)
+                if conflicts:
+                    result[item['id']] = conflicts
+                pending.insert(item)
+        return result
@@ -0,0 +1,224 @@
+from datetime import date, datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
+from app import mysql
+from app.config import Config
+from app.services.scheduling_service import SchedulingService
+from app.services.route_service import RouteService
+from app.utils import encode_cursor, decode_cursor, time_to_minutes, minutes_to_time
+import logging
+import MySQLdb.cursors
+
+logger = logging.getLogger(__name__)
+
+# Forward progress of a delivery; cancelled is final and set by the office only
+STATUS_RANK = {'pending': 0, 'in_progress': 1, 'completed': 2}
+
+class SyncService:
+    """Offline-first sync for the driver app.
+
+    The client queues status changes while offline and sends them in one
+    batch, each with an idempotency key and the time it happened on the
+    device. The whole batch is applied in one transaction:
+
+    * a key that was already applied returns its stored result;
+    * deliveries that are not the driver's are rejected;
+    * forward progress (pending -> in_progress -> completed) always wins;
+    * a step backwards only wins if it happened after the server's last
+      change of the delivery, otherwise it is a conflict and the server
+      state stays;
+    * cancelled deliveries cannot be changed from the app.
+
+    The response carries the driver's deliveries that changed since the
+    client's cursor, so one round trip brings the device up to date.
+    """
+
+    @staticmethod
+    def _parse_ops(ops: List[Any]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Split raw client operations into valid ones and rejections"""
+        valid, rejected = [], []
+        for op in ops:
+            if not isinstance(op, dict):
+                continue
+            key = str(op.get('id') or '')[:64]
+            try:
+                parsed = {
+                    'key': key,
+                    'type': op.get('type', 'status'),
+                    'delivery_id': int(op['delivery_id']),
+                    'status': op.get('status'),
+                    'client_ts': datetime.fromtimestamp(int(op['client_ts']))
+                }
+            except (KeyError, TypeError, ValueError, OverflowError, OSError):
+                rejected.append({'id': key, 'result': 'rejected', 'reason': 'invalid'})
+                continue
+            if not key or parsed['type'] != 'status' or parsed['status'] not in STATUS_RANK:
+                rejected.append({'id': key, 'result': 'rejected', 'reason': 'invalid'})
+                continue
+            valid.append(parsed)
+        valid.sort(key=lambda op: op['client_ts'])
+        return valid, rejected
+
+    @staticmethod
+    def _resolve(current: Optional[Dict[str, Any]], op: Dict[str, Any], driver_id: int) -> Tuple[str, str]:
+        """Decide whether one operation applies: (result, reason)"""
+        if current is None or current['driver_id'] != driver_id:
+            return 'rejected', 'not_found'
+        if current['status'] == op['status']:
+            return 'applied', 'unchanged'
+        if current['status'] not in STATUS_RANK:
+            return 'conflict', current['status']
+        if STATUS_RANK[op['status']] > STATUS_RANK[current['status']]:
+            return 'applied', 'forward'
+        if current['updated_at'] is None or op['client_ts'] >= current['updated_at']:
+            return 'applied', 'newer'
+        return 'conflict', 'stale'
+
+    @staticmethod
+    def apply(driver_id: int, ops: List[Any]) -> List[Dict[str, Any]]:
+        """Apply a batch of queued operations in a single transaction"""
+        valid, results = SyncService._parse_ops(ops)
+        if not valid:
+            return results
+
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        changed = set()
+        try:
+            delivery_ids = sorted({op['delivery_id'] for op in valid})
+            placeholders = ', '.join(['%s'] * len(delivery_ids))
+            cursor.execute(f"""
+                SELECT id, driver_id, status, updated_at
+                FROM deliveries
+                WHERE id IN ({placeholders})
+                FOR UPDATE
+            """, tuple(delivery_ids))
+            current = {row['id']: dict(row) for row in cursor.fetchall()}
+
+            # Locking read after the delivery locks: a resent batch waits for
+            # the first one to commit and then sees its keys as replays
+            keys = [op['key'] for op in valid]
+            placeholders = ', '.join(['%s'] * len(keys))
+            cursor.execute(f"""
+                SELECT idempotency_key, result, reason
+                FROM sync_operations
+                WHERE user_id = %s AND idempotency_key IN ({placeholders})
+                FOR UPDATE
+            """, (driver_id, *keys))
+            seen = {row['idempotency_key']: row for row in cursor.fetchall()}
+
+            log, activity = [], []
+            for op in valid:
+                if op['key'] in seen:
+                    row = seen[op['key']]
+                    results.append({'id': op['key'], 'result': row['result'], 'reason': row['reason'],
+                                    'replayed': True})
+                    continue
+                delivery = current.get(op['delivery_id'])
+                result, reason = SyncService._resolve(delivery, op, driver_id)
+                if result == 'applied' and reason != 'unchanged':
+                    cursor.execute("""
+                        UPDATE deliveries
+                        SET status = %s, updated_at = NOW()
+                        WHERE id = %s
+                    """, (op['status'], op['delivery_id']))
+                    # Later operations in the batch resolve against this one
+                    delivery.update(status=op['status'], updated_at=op['client_ts'])
+                    changed.add(op['delivery_id'])
+                    activity.append((driver_id, 'update_delivery_status', str({
+                        'delivery_id': op['delivery_id'], 'status': op['status'],
+                        'client_ts': op['client_ts'].isoformat(), 'source': 'sync'
+                    })))
+                seen[op['key']] = {'result': result, 'reason': reason}
+                log.append((driver_id, op['key'], op['delivery_id'], op['status'], op['client_ts'], result, reason))
+                results.append({'id': op['key'], 'result': result, 'reason': reason,
+                                'status': delivery['status'] if delivery else None})
+
+            if log:
+                cursor.executemany("""
+                    INSERT INTO sync_operations (
+                        user_id, idempotency_key, delivery_id, status, client_ts, result, reason, applied_at
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, NOW())
+                """, log)
+            if activity:
+                cursor.executemany("""
+                    INSERT INTO user_activity (user_id, action, details, created_at)
+                    VALUES (%s, %s, %s, NOW())
+                """, activity)
+            mysql.connection.commit()
+        except Exception:
+            mysql.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        if changed:
+            slots = SchedulingService.invalidate_deliveries(changed)
+            RouteService.sync(slots)
+        return results
+
+    @staticmethod
+    def _serialize(row: Dict[str, Any]) -> Dict[str, Any]:
+        item = dict(row)
+        for field in ('start_time', 'end_time'):
+            minutes = time_to_minutes(item.get(field))
+            item[field] = minutes_to_time(minutes) if minutes is not None else None
+        item['delivery_date'] = str(item['delivery_date'])[:10] if item['delivery_date'] else None
+        item['updated_at'] = item['updated_at'].isoformat() if item['updated_at'] else None
+        for field in ('latitude', 'longitude'):
+            item[field] = float(item[field]) if item[field] is not None else None
+        return item
+
+    @staticmethod
+    def delta(driver_id: int, cursor_token: Optional[str]) -> Dict[str, Any]:
+        """Deliveries changed since the cursor, plus the ids the device should keep"""
+        values, _ = decode_cursor(cursor_token)
+        since = None
+        if values:
+            try:
+                since = datetime.strptime(values[0], '%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                since = None
+
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("SELECT NOW() AS now")
+            now = cursor.fetchone()['now']
+            query = """
+                SELECT d.id, d.delivery_date, d.start_time, d.end_time, d.status, d.notes,
+                       d.eta_minutes, d.updated_at, a.label, a.street_address,
+                       a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.driver_id = %s AND d.delivery_date >= %s
+            """
+            params: List[Any] = [driver_id, date.today()]
+            if since:
+                query += " AND d.updated_at >= %s"
+                params.append(since)
+            cursor.execute(query + " ORDER BY d.delivery_date, d.start_time, d.id", tuple(params))
+            changed = [SyncService._serialize(row) for row in cursor.fetchall()]
+
+            # Reassigned or deleted deliveries leave no row behind to report
+            cursor.execute("""
+                SELECT id FROM deliveries
+                WHERE driver_id = %s AND delivery_date >= %s AND status != 'cancelled'
+            """, (driver_id, date.today()))
+            active_ids = sorted(row['id'] for row in cursor.fetchall())
+        finally:
+            cursor.close()
+
+        # Overlap the next window slightly so rows committed late are not missed
+        next_since = now - timedelta(seconds=Config.SYNC_CURSOR_OVERLAP)
+        return {
+            'deliveries': changed,
+            'active_ids': active_ids,
+            'full': since is None,
+            'cursor': encode_cursor([next_since])
+        }
+
+    @staticmethod
+    def sync(driver_id: int, ops: List[Any], cursor_token: Optional[str]) -> Dict[str, Any]:
+        """Apply queued operations and return everything the device needs"""
+        results = SyncService.apply(driver_id, ops[:Config.SYNC_MAX_OPERATIONS])
+        response = SyncService.delta(driver_id, cursor_token)
+        response['results'] = results
+        return response
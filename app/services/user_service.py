@@ -1,7 +1,8 @@
 from datetime import datetime
 from typing import Optional, Dict, Any, List, Tuple
 from app import mysql
-from app.utils import hash_password, is_valid_password, verify_password
+from app.utils import hash_password, is_valid_password, verify_password, password_needs_rehash
+from app.templating import invalidate_fragments
 import logging
 import MySQLdb
 
@@ -36,6 +37,7 @@ class UserService:
             """, (name, email, username, password_hash, role))
             
             mysql.connection.commit()
+            invalidate_fragments('drivers')
             return cursor.lastrowid
         except Exception as e:
             mysql.connection.rollback()
@@ -96,6 +98,7 @@ class UserService:
             """
             cursor.execute(query, tuple(params))
             mysql.connection.commit()
+            invalidate_fragments('drivers')
             return cursor.rowcount > 0
         except Exception as e:
             mysql.connection.rollback()
@@ -188,6 +191,18 @@ class UserService:
         finally:
             cursor.close()
 
+    @staticmethod
+    def _rehash_password(cursor, user_id: int, password: str) -> None:
+        """Re-hash a verified password with the current work factor"""
+        try:
+            cursor.execute("UPDATE users SET password_hash = %s WHERE id = %s",
+                           (hash_password(password), user_id))
+            mysql.connection.commit()
+            logger.info(f"Password hash of user {user_id} upgraded to the current work factor")
+        except Exception as e:
+            mysql.connection.rollback()
+            logger.warning(f"Could not rehash password of user {user_id}: {str(e)}")
+    
     @staticmethod
     def authenticate_user(login_input: str, password: str) -> Optional[Dict[str, Any]]:
         """Authenticate a user with email or username and password"""
@@ -218,6 +233,9 @@ class UserService:
                 logger.info(f"Password verified for user: {user['id']}")
                 # Update last login - removed since there's no last_login column
                 
+                if password_needs_rehash(user['password_hash']):
+                    UserService._rehash_password(cursor, user['id'], password)
+                
                 # Remove password_hash from user dict
                 user.pop('password_hash', None)
                 return user
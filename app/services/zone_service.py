@@ -0,0 +1,202 @@
+from typing import Optional, List, Dict, Any, Tuple
+from app import mysql
+from app.config import Config
+from app.extensions import cache
+from app.models.users import get_all_drivers
+from math import ceil, cos, radians, sqrt
+import logging
+import MySQLdb.cursors
+import random
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('kmeans', 'kmedoids')
+
+class ZoneService:
+    """Split a day's deliveries into geographic zones.
+
+    Coordinates are projected to a local kilometre grid so plain Euclidean
+    distances can be used. ``kmeans`` places zone centres at the mean of
+    their deliveries, ``kmedoids`` at the most central delivery. With
+    ``balanced`` every zone takes at most ceil(n / k) deliveries: points
+    whose nearest and second-nearest centres differ most choose first.
+    Results are cached per date and keyed by a fingerprint of the date's
+    deliveries and their addresses' coordinates, so any insert, update or
+    delete, or a moved address, recomputes them.
+    """
+
+    @staticmethod
+    def _fingerprint(delivery_date: str) -> str:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT COUNT(*) AS total, MAX(d.updated_at) AS changed,
+                       COALESCE(SUM(d.id * d.address_id), 0) AS checksum,
+                       COALESCE(SUM(d.id * CRC32(CONCAT_WS(',', a.latitude, a.longitude))), 0) AS coordinates
+                FROM deliveries d
+                LEFT JOIN addresses a ON d.address_id = a.id
+                WHERE d.delivery_date = %s AND d.status != 'cancelled'
+            """, (delivery_date,))
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+        return f"{row['total']}:{row['changed']}:{row['checksum']}:{row['coordinates']}"
+
+    @staticmethod
+    def _load_points(delivery_date: str) -> List[Dict[str, Any]]:
+        cursor = mysql.connection.cursor(MySQLdb.cursors.DictCursor)
+        try:
+            cursor.execute("""
+                SELECT d.id, d.driver_id, a.latitude, a.longitude
+                FROM deliveries d
+                JOIN addresses a ON d.address_id = a.id
+                WHERE d.delivery_date = %s AND d.status != 'cancelled'
+                AND a.latitude IS NOT NULL AND a.longitude IS NOT NULL
+                ORDER BY d.id
+            """, (delivery_date,))
+            return list(cursor.fetchall())
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def _project(rows: List[Dict[str, Any]]) -> Tuple[List[Tuple[float, float]], float]:
+        """Equirectangular projection to kilometres around the mean latitude"""
+        lat0 = sum(float(r['latitude']) for r in rows) / len(rows)
+        kx = 111.32 * cos(radians(lat0))
+        return [(float(r['longitude']) * kx, float(r['latitude']) * 110.57) for r in rows], kx
+
+    @staticmethod
+    def _nearest(point: Tuple[float, float], centers: List[Tuple[float, float]]) -> Tuple[int, float]:
+        best, best_d = 0, None
+        for c, (cx, cy) in enumerate(centers):
+            d = (point[0] - cx) ** 2 + (point[1] - cy) ** 2
+            if best_d is None or d < best_d:
+                best, best_d = c, d
+        return best, best_d
+
+    @staticmethod
+    def _seed(points: List[Tuple[float, float]], k: int, rng: random.Random) -> List[Tuple[float, float]]:
+        """k-means++ initialisation"""
+        centers = [points[rng.randrange(len(points))]]
+        while len(centers) < k:
+            weights = [ZoneService._nearest(p, centers)[1] for p in points]
+            total = sum(weights)
+            if not total:
+                break
+            pick, acc = rng.random() * total, 0.0
+            for p, w in zip(points, weights):
+                acc += w
+                if acc >= pick:
+                    centers.append(p)
+                    break
+        return centers
+
+    @staticmethod
+    def _assign(points: List[Tuple[float, float]], centers: List[Tuple[float, float]],
+                capacity: Optional[int]) -> List[int]:
+        if capacity is None:
+            return [ZoneService._nearest(p, centers)[0] for p in points]
+
+        # Balanced: most constrained points (largest regret) choose first
+        ranked = []
+        for i, p in enumerate(points):
+            dists = sorted(((p[0] - cx) ** 2 + (p[1] - cy) ** 2, c) for c, (cx, cy) in enumerate(centers))
+            regret = dists[1][0] - dists[0][0] if len(dists) > 1 else 0
+            ranked.append((-regret, i, dists))
+        ranked.sort()
+        load = [0] * len(centers)
+        labels = [0] * len(points)
+        for _, i, dists in ranked:
+            for _, c in dists:
+                if load[c] < capacity:
+                    labels[i] = c
+                    load[c] += 1
+                    break
+        return labels
+
+    @staticmethod
+    def _update(points: List[Tuple[float, float]], labels: List[int], centers: List[Tuple[float, float]],
+                method: str) -> List[Tuple[float, float]]:
+        members: List[List[Tuple[float, float]]] = [[] for _ in centers]
+        for p, c in zip(points, labels):
+            members[c].append(p)
+        updated = []
+        for c, group in enumerate(members):
+            if not group:
+                updated.append(centers[c])
+            elif method == 'kmedoids':
+                updated.append(min(group, key=lambda m: sum(sqrt((m[0] - q[0]) ** 2 + (m[1] - q[1]) ** 2)
+                                                             for q in group)))
+            else:
+                updated.append((sum(q[0] for q in group) / len(group), sum(q[1] for q in group) / len(group)))
+        return updated
+
+    @staticmethod
+    def cluster(points: List[Tuple[float, float]], k: int, method: str = 'kmeans',
+                balanced: bool = False, seed: int = 0) -> Tuple[List[int], List[Tuple[float, float]]]:
+        """Cluster projected points, returning a zone label per point and the zone centres"""
+        k = max(1, min(k, len(points)))
+        rng = random.Random(seed)
+        centers = ZoneService._seed(points, k, rng)
+        k = len(centers)
+        capacity = ceil(len(points) / k) if balanced else None
+        labels: List[int] = []
+        for _ in range(Config.ZONE_MAX_ITERATIONS):
+            new_labels = ZoneService._assign(points, centers, capacity)
+            if new_labels == labels:
+                break
+            labels = new_labels
+            centers = ZoneService._update(points, labels, centers, method)
+        return labels, centers
+
+    @staticmethod
+    def get_zones(delivery_date: str, k: Optional[int] = None, method: str = 'kmeans',
+                  balanced: bool = False) -> Dict[str, Any]:
+        """Zones for a date with their centroids and workload, cached until deliveries change"""
+        if method not in METHODS:
+            raise ValueError(f"Unknown clustering method: {method}")
+        if not k:
+            k = len(get_all_drivers()) or Config.ZONE_DEFAULT_K
+
+        fingerprint = ZoneService._fingerprint(delivery_date)
+        key = f"zones:{delivery_date}:{method}:{k}:{int(balanced)}"
+        try:
+            cached = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Could not read cached zones: {str(e)}")
+            cached = None
+        if cached and cached['fingerprint'] == fingerprint:
+            return cached['result']
+
+        rows = ZoneService._load_points(delivery_date)
+        result = {'date': delivery_date, 'method': method, 'balanced': balanced, 'k': 0,
+                  'zones': [], 'assignments': {}}
+        if rows:
+            points, kx = ZoneService._project(rows)
+            seed = int(delivery_date.replace('-', ''))
+            labels, centers = ZoneService.cluster(points, k, method, balanced, seed)
+            zones = [{'zone': z, 'delivery_ids': [], 'drivers': set(), 'spread_km': 0.0}
+                     for z in range(len(centers))]
+            for row, point, z in zip(rows, points, labels):
+                zones[z]['delivery_ids'].append(row['id'])
+                if row['driver_id']:
+                    zones[z]['drivers'].add(row['driver_id'])
+                zones[z]['spread_km'] += sqrt((point[0] - centers[z][0]) ** 2 + (point[1] - centers[z][1]) ** 2)
+                result['assignments'][row['id']] = z
+            for zone, (cx, cy) in zip(zones, centers):
+                count = len(zone['delivery_ids'])
+                zone.update(
+                    centroid={'lat': round(cy / 110.57, 6), 'lng': round(cx / kx, 6)},
+                    deliveries=count,
+                    service_minutes=count * Config.DISPATCH_SERVICE_MINUTES,
+                    spread_km=round(zone['spread_km'] / count, 2) if count else 0.0,
+                    drivers=sorted(zone['drivers'])
+                )
+            result['zones'] = [z for z in zones if z['deliveries']]
+            result['k'] = len(result['zones'])
+
+        try:
+            cache.set(key, {'fingerprint': fingerprint, 'result': result}, timeout=Config.ZONE_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not cache zones: {str(e)}")
+        return result
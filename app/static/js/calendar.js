@@ -50,6 +50,18 @@ const eventColors = {
     }
 };
 
+// Format a Date as a local YYYY-MM-DD string
+function toIsoDate(date) {
+    const pad = n => String(n).padStart(2, '0');
+    return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}`;
+}
+
+// Format minutes after midnight as HH:MM:00
+function minutesToTime(minutes) {
+    const pad = n => String(n).padStart(2, '0');
+    return `${pad(Math.floor(minutes / 60))}:${pad(minutes % 60)}:00`;
+}
+
 // Calendar Class
 class DeliveryCalendar {
     constructor(elementId, options = {}) {
@@ -57,14 +69,23 @@ class DeliveryCalendar {
         this.options = { ...calendarConfig, ...options };
         this.calendar = null;
         this.events = new Map();
+        // Loaded weeks keyed by their Monday (YYYY-MM-DD), each a Promise of events
+        this.windows = new Map();
     }
 
     init() {
         const calendarElement = document.getElementById(this.elementId);
         if (!calendarElement) return null;
 
+        const { dataUrl, filters, ...calendarOptions } = this.options;
+        const rangeOptions = dataUrl ? {
+            events: this.fetchEvents.bind(this),
+            datesSet: this.prefetchAdjacent.bind(this)
+        } : {};
+
         this.calendar = new FullCalendar.Calendar(calendarElement, {
-            ...this.options,
+            ...calendarOptions,
+            ...rangeOptions,
             eventClick: this.handleEventClick.bind(this),
             eventDrop: this.handleEventDrop.bind(this),
             eventResize: this.handleEventResize.bind(this),
@@ -75,6 +96,111 @@ class DeliveryCalendar {
         return this.calendar;
     }
 
+    // Monday of the week containing date, at local midnight
+    weekStart(date) {
+        const offset = (date.getDay() + 6) % 7;
+        return new Date(date.getFullYear(), date.getMonth(), date.getDate() - offset);
+    }
+
+    // Week-aligned chunk starts covering [start, end)
+    chunksFor(start, end) {
+        const chunks = [];
+        for (let day = this.weekStart(start); day < end;
+             day = new Date(day.getFullYear(), day.getMonth(), day.getDate() + 7)) {
+            chunks.push(day);
+        }
+        return chunks;
+    }
+
+    // Load one week from the calendar API once and reuse it
+    loadChunk(chunkStart) {
+        const key = toIsoDate(chunkStart);
+        if (!this.windows.has(key)) {
+            const last = new Date(chunkStart.getFullYear(), chunkStart.getMonth(), chunkStart.getDate() + 6);
+            const params = new URLSearchParams({
+                ...(this.options.filters || {}),
+                start: key,
+                end: toIsoDate(last)
+            });
+            const request = fetch(`${this.options.dataUrl}?${params}`)
+                .then(response => {
+                    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                    return response.json();
+                })
+                .then(payload => this.decodeWindow(payload))
+                .catch(error => {
+                    this.windows.delete(key);
+                    throw error;
+                });
+            this.windows.set(key, request);
+        }
+        return this.windows.get(key);
+    }
+
+    // Load every week overlapping the visible [start, end) range
+    loadWindow(start, end) {
+        return Promise.all(this.chunksFor(start, end).map(chunk => this.loadChunk(chunk)))
+            .then(weeks => weeks.flat());
+    }
+
+    // Expand the columnar payload into FullCalendar event objects
+    decodeWindow(payload) {
+        const cols = payload.deliveries;
+        const [y, m, d] = payload.start.split('-').map(Number);
+        const events = [];
+
+        for (let i = 0; i < cols.id.length; i++) {
+            const day = toIsoDate(new Date(y, m - 1, d + cols.day[i]));
+            const addr = cols.address[i];
+            const status = payload.statuses[cols.status[i]];
+            const event = {
+                id: String(cols.id[i]),
+                title: payload.addresses.label[addr],
+                start: cols.start[i] !== null ? `${day}T${minutesToTime(cols.start[i])}` : day,
+                end: cols.end[i] !== null ? `${day}T${minutesToTime(cols.end[i])}` : null,
+                type: 'delivery',
+                backgroundColor: eventColors.delivery.background,
+                borderColor: eventColors.delivery.border,
+                classNames: [`status-${status}`],
+                extendedProps: {
+                    status: status,
+                    driverId: payload.drivers.id[cols.driver[i]],
+                    driverName: payload.drivers.name[cols.driver[i]],
+                    addressId: payload.addresses.id[addr],
+                    street: payload.addresses.street[addr],
+                    city: payload.addresses.city[addr]
+                }
+            };
+            this.events.set(event.id, event);
+            events.push(event);
+        }
+        return events;
+    }
+
+    fetchEvents(info, successCallback, failureCallback) {
+        this.loadWindow(info.start, info.end).then(successCallback, failureCallback);
+    }
+
+    // Warm the cache with as many weeks before and after the view as it shows
+    prefetchAdjacent(info) {
+        const chunks = this.chunksFor(info.start, info.end);
+        const first = chunks[0];
+        const last = chunks[chunks.length - 1];
+        for (let i = 1; i <= chunks.length; i++) {
+            const before = new Date(first.getFullYear(), first.getMonth(), first.getDate() - 7 * i);
+            const after = new Date(last.getFullYear(), last.getMonth(), last.getDate() + 7 * i);
+            this.loadChunk(before).catch(() => {});
+            this.loadChunk(after).catch(() => {});
+        }
+    }
+
+    // Drop cached windows so the next render refetches them
+    invalidate() {
+        this.windows.clear();
+        this.events.clear();
+        if (this.calendar) this.calendar.refetchEvents();
+    }
+
     addEvent(event) {
         const eventWithColor = {
             ...event,
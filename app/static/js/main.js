@@ -217,21 +217,36 @@ document.addEventListener('DOMContentLoaded', () => {
     // Logs modal - load logs when modal is shown
     const logsModal = document.getElementById('logsModal');
     if (logsModal) {
+        let logStream = null;
         logsModal.addEventListener('shown.bs.modal', function() {
+            const logsContent = document.getElementById('logs-content');
             fetch('/admin/logs')
                 .then(response => response.json())
                 .then(data => {
                     if (data.logs) {
-                        document.getElementById('logs-content').textContent = data.logs.join('\n');
+                        logsContent.textContent = data.logs.join('\n');
                     } else {
-                        document.getElementById('logs-content').textContent = 'No logs available.';
+                        logsContent.textContent = 'No logs available.';
+                    }
+                    // Follow new lines while the modal is open
+                    if (data.after && window.EventSource) {
+                        logStream = new EventSource('/admin/logs/stream?after=' + encodeURIComponent(data.after));
+                        logStream.onmessage = function(event) {
+                            logsContent.textContent += '\n' + event.data;
+                        };
                     }
                 })
                 .catch(error => {
                     console.error('Error fetching logs:', error);
-                    document.getElementById('logs-content').textContent = 'Error fetching logs.';
+                    logsContent.textContent = 'Error fetching logs.';
                 });
         });
+        logsModal.addEventListener('hidden.bs.modal', function() {
+            if (logStream) {
+                logStream.close();
+                logStream = null;
+            }
+        });
     }
 
     // Database maintenance buttons
@@ -0,0 +1,148 @@
+"""Template compilation and fragment caching.
+
+Compiled templates are kept in a Jinja bytecode cache (a directory or
+Redis, TEMPLATE_BYTECODE_CACHE) so that recycled workers load them
+instead of compiling the large templates again.
+
+``{% cache %}`` stores the rendered HTML of a block in the shared cache::
+
+    {% cache 'driver-options' depends 'drivers' %}
+      ...
+    {% endcache %}
+
+The first argument names the fragment; further arguments are extra key
+parts. Each distinct value stores another copy, so they must never come
+from the request. The key always includes the locale, the user's role
+and a digest of the template source, so translations, role-specific
+markup and template edits never mix. Names after ``depends`` are invalidation
+namespaces: ``invalidate_fragments('addresses')`` from a write path bumps
+that namespace's version and every fragment built from it is rebuilt on
+its next render.
+"""
+import hashlib
+import logging
+import os
+import uuid
+from typing import Any, Callable, Iterator, List, Optional
+from flask import Flask, session
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from app.config import Config
+from app.extensions import cache
+
+logger = logging.getLogger(__name__)
+
+
+def _version_key(namespace: str) -> str:
+    return f"fragment_version:{namespace}"
+
+
+def invalidate_fragments(*namespaces: str) -> None:
+    """Rebuild every cached fragment that depends on the given namespaces"""
+    for namespace in namespaces:
+        try:
+            cache.set(_version_key(namespace), uuid.uuid4().hex, timeout=Config.FRAGMENT_VERSION_TTL)
+        except Exception as e:
+            logger.warning(f"Could not bump fragment version: {str(e)}")
+
+
+def _versions(namespaces: List[str]) -> List[str]:
+    keys = [_version_key(ns) for ns in namespaces]
+    versions = list(cache.get_many(*keys))
+    for i, version in enumerate(versions):
+        if version is None:
+            # A fresh token rather than a default: a lost version key must
+            # never bring back fragments cached under an earlier one
+            cache.add(keys[i], uuid.uuid4().hex, timeout=Config.FRAGMENT_VERSION_TTL)
+            versions[i] = cache.get(keys[i])
+    return versions
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        depends = []
+        if parser.stream.skip_if('name:depends'):
+            depends.append(parser.parse_expression())
+            while parser.stream.skip_if('comma'):
+                depends.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+
+        source = self.environment.loader.get_source(self.environment, parser.name)[0] if parser.name else ''
+        digest = hashlib.sha1(f"{source}:{lineno}".encode()).hexdigest()[:12]
+        call = self.call_method('_render', [
+            nodes.Const(digest), nodes.List(args), nodes.List(depends)
+        ])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, digest: str, args: List[Any], depends: List[str], caller: Callable[[], str]) -> str:
+        from flask_babel import get_locale
+        if not Config.FRAGMENT_CACHE_ENABLED:
+            return caller()
+        try:
+            parts = [str(get_locale()), session.get('user_role') or '-', digest]
+            parts += _versions(depends) if depends else []
+            parts += [str(arg) for arg in args]
+            key = 'fragment:' + hashlib.sha1('\x1f'.join(parts).encode()).hexdigest()
+            html = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Could not read template fragment: {str(e)}")
+            return caller()
+        if html is not None:
+            return Markup(html)
+
+        html = caller()
+        try:
+            cache.set(key, str(html), timeout=Config.FRAGMENT_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not cache template fragment: {str(e)}")
+        return html
+
+
+class Deferred:
+    """A query result loaded on first use, so a cached fragment skips the query"""
+
+    def __init__(self, loader: Callable[[], List[Any]]):
+        self._loader = loader
+        self._items: Optional[List[Any]] = None
+
+    def _load(self) -> List[Any]:
+        if self._items is None:
+            self._items = self._loader()
+        return self._items
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __bool__(self) -> bool:
+        return bool(self._load())
+
+
+def _bytecode_cache():
+    from jinja2 import FileSystemBytecodeCache, MemcachedBytecodeCache
+    if Config.TEMPLATE_BYTECODE_CACHE == 'redis':
+        import redis
+        # MemcachedBytecodeCache only needs get() and set(key, value, timeout)
+        client = redis.Redis.from_url(Config.CACHE_REDIS_URL)
+        return MemcachedBytecodeCache(client, prefix='jinja_bytecode:', timeout=Config.TEMPLATE_BYTECODE_TTL,
+                                      ignore_memcache_errors=True)
+    if Config.TEMPLATE_BYTECODE_CACHE == 'filesystem':
+        if Config.TEMPLATE_BYTECODE_DIR:
+            os.makedirs(Config.TEMPLATE_BYTECODE_DIR, exist_ok=True)
+        return FileSystemBytecodeCache(Config.TEMPLATE_BYTECODE_DIR or None)
+    return None
+
+
+def init_app(app: Flask) -> None:
+    """Register the bytecode cache and the {% cache %} tag"""
+    app.jinja_env.bytecode_cache = _bytecode_cache()
+    app.jinja_env.add_extension(FragmentCacheExtension)
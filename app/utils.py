@@ -1,16 +1,20 @@
 import re
-from datetime import datetime, timezone
+from datetime import datetime, date, timedelta, timezone
+from decimal import Decimal
 from functools import wraps
+import base64
 import hashlib
-from typing import Optional, Any, Dict, List
+from typing import Optional, Any, Dict, List, Tuple
 import json
 import secrets
 import logging
 from flask import request, jsonify
 import jwt
+from app import metrics
 from app.config import Config
 import bcrypt
 import os
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -74,18 +78,73 @@ def validate_password(password: str) -> bool:
         return False
     return True
 
+_password_pool = None
+_password_pool_pid = None
+_password_slots = None
+
+def _password_executor():
+    """Native-thread pool for bcrypt under gevent; None when not monkey-patched.
+
+    bcrypt releases the GIL, so hashing in a real thread keeps the hub and
+    the other greenlets of the worker running. Without gevent the calling
+    thread only blocks itself and the work is done inline.
+    """
+    global _password_pool, _password_pool_pid, _password_slots
+    if _password_pool is not None and _password_pool_pid == os.getpid():
+        return _password_pool
+    try:
+        from gevent import monkey
+        from gevent.threadpool import ThreadPool
+    except ImportError:
+        return None
+    if not monkey.is_module_patched('thread'):
+        return None
+    import threading
+    _password_pool = ThreadPool(Config.PASSWORD_HASH_THREADS)
+    # Patched, so waiting for a slot only suspends the calling greenlet
+    _password_slots = threading.BoundedSemaphore(Config.PASSWORD_HASH_THREADS + Config.PASSWORD_HASH_QUEUE)
+    _password_pool_pid = os.getpid()
+    return _password_pool
+
+def _run_bcrypt(op: str, func, *args):
+    start = time.perf_counter()
+    pool = _password_executor()
+    if pool is None:
+        try:
+            return func(*args)
+        finally:
+            metrics.observe_password(op, time.perf_counter() - start)
+    if not _password_slots.acquire(timeout=Config.PASSWORD_HASH_TIMEOUT):
+        metrics.observe_password_rejected(op)
+        raise RuntimeError("Password hashing queue is full")
+    metrics.track_password_queue(1)
+    try:
+        return pool.apply(func, args)
+    finally:
+        metrics.track_password_queue(-1)
+        _password_slots.release()
+        metrics.observe_password(op, time.perf_counter() - start)
+
 def hash_password(password: str) -> str:
-    """Hash password using bcrypt."""
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+    """Hash password using bcrypt with the configured work factor."""
+    salt = bcrypt.gensalt(rounds=Config.BCRYPT_ROUNDS)
+    return _run_bcrypt('hash', bcrypt.hashpw, password.encode(), salt).decode()
 
 def verify_password(password: str, hashed: str) -> bool:
     """Verify password against bcrypt hash."""
     try:
-        return bcrypt.checkpw(password.encode(), hashed.encode())
+        return _run_bcrypt('verify', bcrypt.checkpw, password.encode(), hashed.encode())
     except Exception as e:
         logger.error(f"Error verifying password: {str(e)}")
         return False
 
+def password_needs_rehash(hashed: str) -> bool:
+    """True when a bcrypt hash was made with a different work factor than configured"""
+    try:
+        return int(hashed.split('$')[2]) != Config.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return False
+
 def format_datetime(dt: Optional[datetime], format_str: str = '%Y-%m-%d %H:%M:%S') -> str:
     """Format datetime object to string"""
     if not dt:
@@ -136,6 +195,83 @@ def paginate(items: List[Any], page: int, per_page: int) -> Dict[str, Any]:
         'has_next': page < pages
     }
 
+def get_page_size(requested: Any = None) -> int:
+    """Clamp a requested page size to the configured bounds"""
+    try:
+        size = int(requested) if requested else Config.PAGE_SIZE
+    except (TypeError, ValueError):
+        size = Config.PAGE_SIZE
+    return min(max(size, 1), Config.MAX_PAGE_SIZE)
+
+def _cursor_value(value: Any) -> Any:
+    """Convert a sort-key value into something JSON- and MySQL-friendly"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        # MySQLdb returns TIME columns as timedelta
+        seconds = int(value.total_seconds())
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+def encode_cursor(values: List[Any], direction: str = 'next') -> str:
+    """Encode the sort key of a boundary row as an opaque cursor token"""
+    payload = json.dumps({'k': [_cursor_value(v) for v in values], 'd': direction},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(token: Optional[str]) -> Tuple[Optional[List[Any]], str]:
+    """Decode a cursor token into (sort key values, direction)"""
+    if not token:
+        return None, 'next'
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        direction = 'prev' if payload.get('d') == 'prev' else 'next'
+        return list(payload['k']), direction
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Invalid pagination cursor: {str(e)}")
+        return None, 'next'
+
+def keyset_condition(columns: List[str], values: List[Any], descending: bool = False) -> Tuple[str, List[Any]]:
+    """Build a seek predicate such as ``a > %s OR (a = %s AND b > %s)``.
+
+    The expanded form (rather than a row constructor) lets MySQL use a
+    composite index on ``columns`` for the range scan.
+    """
+    op = '<' if descending else '>'
+    clauses = []
+    params: List[Any] = []
+    for i, column in enumerate(columns):
+        parts = [f"{c} = %s" for c in columns[:i]] + [f"{column} {op} %s"]
+        clauses.append("(" + " AND ".join(parts) + ")")
+        params.extend(values[:i] + [values[i]])
+    return "(" + " OR ".join(clauses) + ")", params
+
+def build_keyset_page(rows: List[Any], per_page: int, key_fn, direction: str,
+                      has_cursor: bool) -> Dict[str, Any]:
+    """Turn ``per_page + 1`` rows fetched in seek order into a page dict"""
+    rows = list(rows)
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+        has_prev, has_next = has_more, has_cursor
+    else:
+        has_prev, has_next = has_cursor, has_more
+
+    return {
+        'items': rows,
+        'per_page': per_page,
+        'has_prev': has_prev and bool(rows),
+        'has_next': has_next and bool(rows),
+        'prev_cursor': encode_cursor(key_fn(rows[0]), 'prev') if has_prev and rows else None,
+        'next_cursor': encode_cursor(key_fn(rows[-1]), 'next') if has_next and rows else None
+    }
+
 def memoize(timeout: int = 300):
     """Memoize a function result with timeout"""
     cache = {}
@@ -304,4 +440,31 @@ def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> fl
     c = 2 * atan2(sqrt(a), sqrt(1-a))
     distance = R * c
     
-    return distance
\ No newline at end of file
+    return distance
+
+def estimate_travel_minutes(lat1: float, lng1: float, lat2: float, lng2: float) -> int:
+    """Estimate driving time between two points from straight-line distance."""
+    from math import ceil
+    
+    km = calculate_distance(float(lat1), float(lng1), float(lat2), float(lng2)) * Config.SCHEDULE_ROAD_FACTOR
+    return int(ceil(km / Config.SCHEDULE_AVG_SPEED_KMH * 60))
+
+def time_to_minutes(value: Any) -> Optional[int]:
+    """Convert a TIME value (timedelta, time, datetime or 'HH:MM[:SS]') to minutes after midnight."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, timedelta):
+        return int(value.total_seconds()) // 60
+    if isinstance(value, datetime):
+        return value.hour * 60 + value.minute
+    if hasattr(value, 'hour') and hasattr(value, 'minute'):
+        return value.hour * 60 + value.minute
+    try:
+        parts = str(value).strip().split(' ')[-1].split(':')
+        return int(parts[0]) * 60 + int(parts[1])
+    except (ValueError, IndexError):
+        return None
+
+def minutes_to_time(minutes: int) -> str:
+    """Format minutes after midnight as 'HH:MM'."""
+    return f"{int(minutes) // 60:02d}:{int(minutes) % 60:02d}"
@@ -1,5 +1,6 @@
 import multiprocessing
 import os
+import shutil
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -11,13 +12,33 @@ timeout = 30
 keepalive = 5
 worker_connections = 1000
 
+# Metrics: workers share Prometheus samples through files in RAM.
+# Must be set before the app (and prometheus_client) is imported.
+metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/dev/shm/chocomap-metrics")
+# Clear the previous run's files and create the directory here, before
+# the preloaded app opens its own. This file is read again on SIGHUP;
+# the marker keeps a reload from deleting files of running workers.
+if os.environ.get("CHOCOMAP_METRICS_OWNER") != str(os.getpid()):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.environ["CHOCOMAP_METRICS_OWNER"] = str(os.getpid())
+os.makedirs(metrics_dir, exist_ok=True)
+
+# Load the app once in the master: forked workers share the imported code
+# and are ready as soon as they start, which matters with max_requests
+# recycling workers all the time. gevent must patch before that import so
+# that locks and sockets created at import time are cooperative.
+preload_app = True
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 # Memory management
 max_requests = 1000
 max_requests_jitter = 50
 worker_tmp_dir = "/dev/shm"  # Use RAM for temporary files
 
 # Logging
-loglevel = "debug"
+loglevel = os.environ.get("GUNICORN_LOGLEVEL", "info")
 accesslog = "logs/access.log"
 errorlog = "logs/error.log"
 
@@ -40,6 +61,19 @@ def on_starting(server):
     """Log when server starts."""
     server.log.info("Starting ChocoMap server")
 
+def child_exit(server, worker):
+    """Merge the metrics of an exited worker into the totals."""
+    try:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+    except ImportError:
+        pass
+
+def post_worker_init(worker):
+    """Watch the worker's gevent hub for calls that block it."""
+    from app.loop_monitor import LoopMonitor
+    LoopMonitor.start()
+
 def on_exit(server):
     """Log when server exits."""
     server.log.info("Stopping ChocoMap server")
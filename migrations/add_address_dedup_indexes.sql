@@ -0,0 +1,3 @@
+-- Indexes used by duplicate address lookups at insert time
+CREATE INDEX IF NOT EXISTS idx_addresses_zip_code ON addresses (zip_code);
+CREATE INDEX IF NOT EXISTS idx_addresses_lat_lng ON addresses (latitude, longitude);
@@ -0,0 +1,30 @@
+-- Normalized ZIP code for duplicate address lookups at insert time.
+-- Holds AddressDedupService.normalize_zip(zip_code): alphanumerics only,
+-- uppercased ('110 00' and '110-00' -> '11000'). Triggers keep it in step
+-- on every write path, so an indexed equality replaces REPLACE(zip_code).
+
+ALTER TABLE addresses ADD COLUMN IF NOT EXISTS zip_norm VARCHAR(20) NOT NULL DEFAULT '';
+CREATE INDEX IF NOT EXISTS idx_addresses_zip_norm ON addresses (zip_norm);
+
+DROP TRIGGER IF EXISTS addresses_zip_norm_insert;
+DROP TRIGGER IF EXISTS addresses_zip_norm_update;
+
+DELIMITER //
+
+CREATE TRIGGER addresses_zip_norm_insert BEFORE INSERT ON addresses
+FOR EACH ROW
+BEGIN
+    SET NEW.zip_norm = UPPER(REGEXP_REPLACE(COALESCE(NEW.zip_code, ''), '[^0-9A-Za-z]', ''));
+END //
+
+CREATE TRIGGER addresses_zip_norm_update BEFORE UPDATE ON addresses
+FOR EACH ROW
+BEGIN
+    SET NEW.zip_norm = UPPER(REGEXP_REPLACE(COALESCE(NEW.zip_code, ''), '[^0-9A-Za-z]', ''));
+END //
+
+DELIMITER ;
+
+-- Backfill existing rows
+UPDATE addresses
+SET zip_norm = UPPER(REGEXP_REPLACE(COALESCE(zip_code, ''), '[^0-9A-Za-z]', ''));
@@ -0,0 +1,5 @@
+-- Arrival/departure times recorded by geofence detection
+ALTER TABLE deliveries
+ADD COLUMN IF NOT EXISTS arrived_at DATETIME NULL,
+ADD COLUMN IF NOT EXISTS departed_at DATETIME NULL,
+ADD COLUMN IF NOT EXISTS actual_service_minutes INT NULL;
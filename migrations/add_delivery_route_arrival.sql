@@ -0,0 +1,5 @@
+-- Planned arrival at each stop of a driver's route, in minutes after
+-- DISPATCH_SHIFT_START. Written by RouteService and LiveEtaService;
+-- eta_minutes keeps the warehouse-to-stop travel time.
+ALTER TABLE deliveries
+ADD COLUMN IF NOT EXISTS arrival_minutes INT NULL;
@@ -0,0 +1,3 @@
+-- Composite indexes backing keyset pagination of the listing pages
+CREATE INDEX IF NOT EXISTS idx_addresses_label_id ON addresses (label, id);
+CREATE INDEX IF NOT EXISTS idx_deliveries_date_start ON deliveries (delivery_date, start_time, id);
@@ -0,0 +1,117 @@
+-- Maintained per-driver delivery counters, lifetime and per delivery date.
+-- Triggers on deliveries keep them in step inside the writing transaction,
+-- so every create, delete, status change and reassignment is covered no
+-- matter which code path performs it. `flask reconcile-driver-stats`
+-- verifies them against the deliveries table and repairs drift.
+
+CREATE TABLE IF NOT EXISTS driver_stats (
+    driver_id INT NOT NULL PRIMARY KEY,
+    total_deliveries INT NOT NULL DEFAULT 0,
+    pending_deliveries INT NOT NULL DEFAULT 0,
+    in_progress_deliveries INT NOT NULL DEFAULT 0,
+    completed_deliveries INT NOT NULL DEFAULT 0,
+    cancelled_deliveries INT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS driver_stats_daily (
+    driver_id INT NOT NULL,
+    delivery_date DATE NOT NULL,
+    total_deliveries INT NOT NULL DEFAULT 0,
+    pending_deliveries INT NOT NULL DEFAULT 0,
+    in_progress_deliveries INT NOT NULL DEFAULT 0,
+    completed_deliveries INT NOT NULL DEFAULT 0,
+    cancelled_deliveries INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (driver_id, delivery_date)
+);
+
+DROP TRIGGER IF EXISTS deliveries_stats_insert;
+DROP TRIGGER IF EXISTS deliveries_stats_update;
+DROP TRIGGER IF EXISTS deliveries_stats_delete;
+DROP PROCEDURE IF EXISTS driver_stats_apply;
+
+DELIMITER //
+
+CREATE PROCEDURE driver_stats_apply(IN p_driver INT, IN p_date DATE, IN p_status VARCHAR(20), IN p_delta INT)
+BEGIN
+    IF p_driver IS NOT NULL THEN
+        INSERT INTO driver_stats (driver_id, total_deliveries, pending_deliveries, in_progress_deliveries,
+                                  completed_deliveries, cancelled_deliveries)
+        VALUES (p_driver, p_delta, IF(p_status = 'pending', p_delta, 0), IF(p_status = 'in_progress', p_delta, 0),
+                IF(p_status = 'completed', p_delta, 0), IF(p_status = 'cancelled', p_delta, 0))
+        ON DUPLICATE KEY UPDATE
+            total_deliveries = total_deliveries + VALUES(total_deliveries),
+            pending_deliveries = pending_deliveries + VALUES(pending_deliveries),
+            in_progress_deliveries = in_progress_deliveries + VALUES(in_progress_deliveries),
+            completed_deliveries = completed_deliveries + VALUES(completed_deliveries),
+            cancelled_deliveries = cancelled_deliveries + VALUES(cancelled_deliveries);
+
+        IF p_date IS NOT NULL THEN
+            INSERT INTO driver_stats_daily (driver_id, delivery_date, total_deliveries, pending_deliveries,
+                                            in_progress_deliveries, completed_deliveries, cancelled_deliveries)
+            VALUES (p_driver, p_date, p_delta, IF(p_status = 'pending', p_delta, 0),
+                    IF(p_status = 'in_progress', p_delta, 0), IF(p_status = 'completed', p_delta, 0),
+                    IF(p_status = 'cancelled', p_delta, 0))
+            ON DUPLICATE KEY UPDATE
+                total_deliveries = total_deliveries + VALUES(total_deliveries),
+                pending_deliveries = pending_deliveries + VALUES(pending_deliveries),
+                in_progress_deliveries = in_progress_deliveries + VALUES(in_progress_deliveries),
+                completed_deliveries = completed_deliveries + VALUES(completed_deliveries),
+                cancelled_deliveries = cancelled_deliveries + VALUES(cancelled_deliveries);
+        END IF;
+    END IF;
+END //
+
+DELIMITER ;
+
+-- Backfill from the existing deliveries, then create the triggers, with
+-- writes to deliveries blocked in between: a row written after the
+-- backfill but before the triggers would be missed, and one written
+-- between the triggers and the backfill counted twice.
+LOCK TABLES deliveries WRITE, driver_stats WRITE, driver_stats_daily WRITE;
+
+DELETE FROM driver_stats;
+DELETE FROM driver_stats_daily;
+
+INSERT INTO driver_stats (driver_id, total_deliveries, pending_deliveries, in_progress_deliveries,
+                          completed_deliveries, cancelled_deliveries)
+SELECT driver_id, COUNT(*), SUM(status = 'pending'), SUM(status = 'in_progress'),
+       SUM(status = 'completed'), SUM(status = 'cancelled')
+FROM deliveries
+WHERE driver_id IS NOT NULL
+GROUP BY driver_id;
+
+INSERT INTO driver_stats_daily (driver_id, delivery_date, total_deliveries, pending_deliveries,
+                                in_progress_deliveries, completed_deliveries, cancelled_deliveries)
+SELECT driver_id, delivery_date, COUNT(*), SUM(status = 'pending'), SUM(status = 'in_progress'),
+       SUM(status = 'completed'), SUM(status = 'cancelled')
+FROM deliveries
+WHERE driver_id IS NOT NULL AND delivery_date IS NOT NULL
+GROUP BY driver_id, delivery_date;
+
+DELIMITER //
+
+CREATE TRIGGER deliveries_stats_insert AFTER INSERT ON deliveries
+FOR EACH ROW
+BEGIN
+    CALL driver_stats_apply(NEW.driver_id, NEW.delivery_date, NEW.status, 1);
+END //
+
+CREATE TRIGGER deliveries_stats_update AFTER UPDATE ON deliveries
+FOR EACH ROW
+BEGIN
+    IF NOT (OLD.driver_id <=> NEW.driver_id) OR NOT (OLD.delivery_date <=> NEW.delivery_date)
+       OR NOT (OLD.status <=> NEW.status) THEN
+        CALL driver_stats_apply(OLD.driver_id, OLD.delivery_date, OLD.status, -1);
+        CALL driver_stats_apply(NEW.driver_id, NEW.delivery_date, NEW.status, 1);
+    END IF;
+END //
+
+CREATE TRIGGER deliveries_stats_delete AFTER DELETE ON deliveries
+FOR EACH ROW
+BEGIN
+    CALL driver_stats_apply(OLD.driver_id, OLD.delivery_date, OLD.status, -1);
+END //
+
+DELIMITER ;
+
+UNLOCK TABLES;
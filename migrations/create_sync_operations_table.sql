@@ -0,0 +1,16 @@
+-- Operations applied through the driver sync endpoint, keyed for idempotent replays
+CREATE TABLE IF NOT EXISTS sync_operations (
+    user_id INT NOT NULL,
+    idempotency_key VARCHAR(64) NOT NULL,
+    delivery_id INT NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    client_ts DATETIME NOT NULL,
+    result ENUM('applied', 'conflict', 'rejected') NOT NULL,
+    reason VARCHAR(20) NULL,
+    applied_at DATETIME NOT NULL,
+    PRIMARY KEY (user_id, idempotency_key),
+    KEY idx_sync_operations_applied (applied_at)
+);
+
+-- Delta queries read a driver's deliveries changed since the sync cursor
+CREATE INDEX IF NOT EXISTS idx_deliveries_driver_updated ON deliveries (driver_id, updated_at);
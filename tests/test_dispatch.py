@@ -0,0 +1,114 @@
+from math import atan2, ceil, hypot
+
+import pytest
+
+from app.config import Config
+from app.services.dispatch_service import DispatchService
+
+SHIFT_START, SHIFT_END, SERVICE = 480, 1080, 10
+
+
+def problem(coords, windows=None):
+    """Stops at grid coordinates around a warehouse at (0, 0), one minute per unit"""
+    points = [(0, 0)] + coords
+    matrix = [[ceil(hypot(a[0] - b[0], a[1] - b[1])) for b in points] for a in points]
+    stops = []
+    for i, (x, y) in enumerate(coords):
+        ready, due = (windows or {}).get(i, (SHIFT_START, SHIFT_END))
+        stops.append({'ready': ready, 'due': due, 'angle': atan2(y, x)})
+    return stops, matrix
+
+
+def check(routes, unassigned, stops, matrix, max_stops):
+    """Every stop placed once and every route within its windows, cap and shift"""
+    placed = [s for route in routes for s in route] + list(unassigned)
+    assert sorted(placed) == list(range(len(stops)))
+    for route in routes:
+        assert len(route) <= max_stops
+        clock, prev = SHIFT_START, 0
+        for s in route:
+            clock = max(clock + matrix[prev][s + 1], stops[s]['ready'])
+            assert clock <= stops[s]['due']
+            clock += SERVICE
+            prev = s + 1
+        assert clock + matrix[prev][0] <= SHIFT_END
+
+
+def route_minutes(route, matrix):
+    nodes = [0] + [s + 1 for s in route] + [0]
+    return sum(matrix[a][b] for a, b in zip(nodes, nodes[1:]))
+
+
+def solve(stops, matrix, drivers, max_stops=20, time_limit=1.0):
+    return DispatchService.solve(stops, drivers, matrix, SHIFT_START, SHIFT_END, SERVICE,
+                                 max_stops, time_limit)
+
+
+def test_no_stops_or_no_drivers():
+    stops, matrix = problem([(10, 0)])
+    assert DispatchService.solve([], 2, [[0]], SHIFT_START, SHIFT_END, SERVICE, 5, 1.0) == ([[], []], [])
+    assert solve(stops, matrix, 0) == ([], [0])
+
+
+def test_two_clusters_go_to_two_drivers():
+    east = [(30, 1), (32, -1), (34, 2), (31, 3)]
+    west = [(-30, 1), (-32, -1), (-34, 2), (-31, 3)]
+    stops, matrix = problem(east + west)
+
+    routes, unassigned = solve(stops, matrix, 2)
+
+    check(routes, unassigned, stops, matrix, 20)
+    assert unassigned == []
+    assert sorted(sorted(route) for route in routes) == [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+
+def test_time_windows_order_the_route():
+    stops, matrix = problem([(10, 0), (20, 0), (30, 0)],
+                            windows={0: (700, 720), 1: (600, 620), 2: (500, 520)})
+
+    routes, unassigned = solve(stops, matrix, 1)
+
+    check(routes, unassigned, stops, matrix, 20)
+    assert routes == [[2, 1, 0]]
+
+
+def test_unreachable_stop_is_left_unassigned():
+    # Due before anyone can drive 100 minutes out from the shift start
+    stops, matrix = problem([(10, 0), (100, 0)], windows={1: (480, 500)})
+
+    routes, unassigned = solve(stops, matrix, 2)
+
+    check(routes, unassigned, stops, matrix, 20)
+    assert unassigned == [1]
+
+
+def test_load_is_balanced(monkeypatch):
+    monkeypatch.setattr(Config, 'DISPATCH_BALANCE_TOLERANCE', 1.0)
+    stops, matrix = problem([(x, 1) for x in range(1, 13)])
+
+    routes, unassigned = solve(stops, matrix, 3)
+
+    check(routes, unassigned, stops, matrix, 20)
+    assert sorted(len(route) for route in routes) == [4, 4, 4]
+
+
+def test_local_search_does_not_cross_routes():
+    # Points on a circle visited in angular order are a crossing-free tour
+    coords = [(20, 0), (0, 20), (-20, 0), (0, -20), (14, 14), (-14, 14), (-14, -14), (14, -14)]
+    stops, matrix = problem(coords)
+
+    routes, unassigned = solve(stops, matrix, 1)
+
+    check(routes, unassigned, stops, matrix, 20)
+    route = routes[0]
+    assert route_minutes(route, matrix) == pytest.approx(route_minutes(
+        sorted(route, key=lambda s: stops[s]['angle']), matrix), abs=2)
+
+
+def test_max_stops_caps_every_route():
+    stops, matrix = problem([(x, 0) for x in range(1, 9)])
+
+    routes, unassigned = solve(stops, matrix, 2, max_stops=3)
+
+    check(routes, unassigned, stops, matrix, 3)
+    assert len(unassigned) == 2
@@ -0,0 +1,92 @@
+import pytest
+
+from app.config import Config
+from app.services.geofence_service import FenceGrid, GeofenceService, METRES_PER_DEGREE
+
+LAT, LNG = 50.08, 14.42
+
+
+@pytest.fixture(autouse=True)
+def fence_config(monkeypatch):
+    monkeypatch.setattr(Config, 'GEOFENCE_DWELL_SECONDS', 60)
+    monkeypatch.setattr(Config, 'GEOFENCE_EXIT_FACTOR', 1.5)
+
+
+def north(metres):
+    return LAT + metres / METRES_PER_DEGREE
+
+
+def ping(ts, metres_north, lon=LNG):
+    return {'ts': ts, 'lat': north(metres_north), 'lon': lon}
+
+
+def fresh_state():
+    return {'date': '2026-01-01', 'inside': None, 'arrived': False, 'last_ts': 0}
+
+
+def grid(*fences):
+    return FenceGrid([{'id': i, 'lat': lat, 'lng': lng} for i, (lat, lng) in fences], 0.002, 75)
+
+
+def test_locate_finds_fences_across_cell_borders():
+    # A fence centre just south of a cell border still covers points north of it
+    border = 0.002 * round(LAT / 0.002)
+    fences = grid((1, (border - 0.0001, LNG)), (2, (LAT + 0.01, LNG)))
+
+    assert fences.locate(border + 0.0003, LNG)['id'] == 1
+    assert fences.locate(border + 0.001, LNG) is None
+    assert fences.locate(LAT + 0.01, LNG + 0.0005)['id'] == 2
+
+
+def test_locate_prefers_the_nearest_fence():
+    fences = grid((1, (LAT, LNG)), (2, (north(60), LNG)))
+
+    assert fences.locate(north(20), LNG)['id'] == 1
+    assert fences.locate(north(40), LNG)['id'] == 2
+
+
+def test_arrive_after_dwell_and_depart_past_exit_radius():
+    fences = grid((1, (LAT, LNG)))
+    state = fresh_state()
+
+    events = GeofenceService.detect(fences, state, [
+        ping(0, 300), ping(100, 50), ping(130, 10), ping(170, 0),
+        # Drifting outside the radius but within the exit radius keeps it inside
+        ping(200, 100), ping(260, 20),
+        ping(300, 200),
+    ])
+
+    assert events == [
+        {'type': 'arrive', 'delivery_id': 1, 'ts': 100},
+        {'type': 'depart', 'delivery_id': 1, 'ts': 260, 'arrived_ts': 100},
+    ]
+    assert state['inside'] is None and state['last_ts'] == 300
+
+
+def test_short_stop_is_not_an_arrival():
+    fences = grid((1, (LAT, LNG)))
+
+    assert GeofenceService.detect(fences, fresh_state(), [ping(100, 0), ping(150, 0), ping(200, 300)]) == []
+
+
+def test_state_carries_across_batches_and_skips_old_pings():
+    fences = grid((1, (LAT, LNG)))
+    state = fresh_state()
+
+    assert GeofenceService.detect(fences, state, [ping(100, 0), ping(130, 0)]) == []
+    # Replayed and out-of-order pings are ignored
+    assert GeofenceService.detect(fences, state, [ping(130, 300), ping(120, 300), ping(160, 0)]) == \
+        [{'type': 'arrive', 'delivery_id': 1, 'ts': 100}]
+    assert GeofenceService.detect(fences, state, [ping(400, 500)]) == \
+        [{'type': 'depart', 'delivery_id': 1, 'ts': 160, 'arrived_ts': 100}]
+
+
+def test_fence_removed_meanwhile_resets_the_state():
+    state = fresh_state()
+    GeofenceService.detect(grid((1, (LAT, LNG))), state, [ping(100, 0), ping(200, 0)])
+    assert state['inside'] == 1 and state['arrived']
+
+    # Delivery 1 was completed by hand; the driver moves on to delivery 2 next door
+    events = GeofenceService.detect(grid((2, (north(30), LNG))), state, [ping(300, 30), ping(400, 30)])
+
+    assert events == [{'type': 'arrive', 'delivery_id': 2, 'ts': 300}]
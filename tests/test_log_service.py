@@ -0,0 +1,125 @@
+import os
+
+import pytest
+
+from app.config import Config
+from app.services.log_service import LogService
+
+
+def record(level, message):
+    return f"2026-01-01 12:00:00,000 {level} app: {message}\n".encode()
+
+
+@pytest.fixture
+def log_file(tmp_path, monkeypatch):
+    path = tmp_path / 'chocomap.log'
+    monkeypatch.setattr(Config, 'ADMIN_LOG_FILE', str(path))
+    monkeypatch.setattr(Config, 'LOG_VIEWER_BACKUPS', 2)
+    monkeypatch.setattr(Config, 'LOG_VIEWER_BLOCK_SIZE', 64)
+    monkeypatch.setattr(Config, 'LOG_VIEWER_MAX_LINE_BYTES', 100)
+    monkeypatch.setattr(Config, 'LOG_VIEWER_MAX_SCAN_BYTES', 1 << 20)
+    return path
+
+
+def write(path, *chunks):
+    with open(path, 'ab') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def rotate(path):
+    # What RotatingFileHandler does with backupCount=2
+    if os.path.exists(f"{path}.1"):
+        os.replace(f"{path}.1", f"{path}.2")
+    os.rename(path, f"{path}.1")
+
+
+def messages(page):
+    return [line.split(': ', 1)[1] for line in page['logs']]
+
+
+def test_forward_moves_past_a_long_line(log_file):
+    write(log_file, record('INFO', 'start'))
+    start = LogService.end_cursor()
+    write(log_file, record('DEBUG', 'x' * 300), record('ERROR', 'boom'))
+
+    page = LogService.read_forward(start, 10)
+
+    assert len(page['logs']) == 2
+    assert len(page['logs'][0]) == 100
+    assert page['logs'][1].endswith('boom')
+    assert page['after'] == LogService.end_cursor()
+    assert LogService.read_forward(page['after'], 10)['logs'] == []
+
+
+def test_forward_leaves_a_partial_line_for_later(log_file):
+    write(log_file, record('INFO', 'start'))
+    start = LogService.end_cursor()
+    write(log_file, b"2026-01-01 12:00:01,000 INFO app: half")
+
+    page = LogService.read_forward(start, 10)
+    assert page['logs'] == []
+    assert page['after'] == start
+
+    write(log_file, b" done\n")
+    assert LogService.read_forward(start, 10)['logs'] == ['2026-01-01 12:00:01,000 INFO app: half done']
+
+
+def test_forward_waits_for_the_end_of_a_long_partial_line(log_file):
+    write(log_file, record('INFO', 'start'))
+    start = LogService.end_cursor()
+    write(log_file, b"2026-01-01 12:00:01,000 DEBUG app: " + b'y' * 300)
+
+    assert LogService.read_forward(start, 10)['after'] == start
+
+    write(log_file, b"\n", record('ERROR', 'boom'))
+    page = LogService.read_forward(start, 10)
+    assert [line[-4:] for line in page['logs']] == ['yyyy', 'boom']
+
+
+def test_tail_truncates_a_long_line(log_file):
+    write(log_file, record('INFO', 'first'), record('DEBUG', 'x' * 300), record('ERROR', 'last'))
+
+    page = LogService.tail(10)
+
+    assert [len(line) <= 100 for line in page['logs']] == [True, True, True]
+    assert page['logs'][0].endswith('first')
+    assert page['logs'][1].startswith('2026-01-01 12:00:00,000 DEBUG app: xxx')
+    assert page['logs'][2].endswith('last')
+    assert page['before'] is None
+
+
+def test_tail_filters_and_pages_back(log_file):
+    write(log_file, *[record('ERROR' if i % 2 else 'INFO', f"message {i}") for i in range(10)])
+
+    page = LogService.tail(2, level='error')
+    assert [line[-9:] for line in page['logs']] == ['message 7', 'message 9']
+
+    older = LogService.tail(2, level='error', before=page['before'])
+    assert [line[-9:] for line in older['logs']] == ['message 3', 'message 5']
+
+
+def test_traceback_lines_stay_with_their_record(log_file):
+    write(log_file, record('INFO', 'ok'), record('ERROR', 'failed'),
+          b"Traceback (most recent call last):\n", b"ValueError: bad\n")
+
+    page = LogService.tail(1)
+    assert page['logs'] == ['2026-01-01 12:00:00,000 ERROR app: failed',
+                            'Traceback (most recent call last):', 'ValueError: bad']
+
+
+def test_cursors_survive_rotation(log_file):
+    write(log_file, record('INFO', 'before'))
+    cursor = LogService.end_cursor()
+    write(log_file, record('INFO', 'rotated'))
+    rotate(log_file)
+    write(log_file, record('INFO', 'after'))
+
+    page = LogService.read_forward(cursor, 10)
+    assert messages(page) == ['rotated', 'after']
+    assert page['after'] == LogService.end_cursor()
+
+    page = LogService.tail(10)
+    assert messages(page) == ['before', 'rotated', 'after']
+    assert page['before'] is None
+
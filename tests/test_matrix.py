@@ -0,0 +1,73 @@
+from array import array
+
+import pytest
+
+from app.services.matrix_service import DayMatrix, WAREHOUSE
+from app.services.routing_service import RoutingService
+
+
+def minutes(a, b):
+    return int(abs(a[0] - b[0]) * 100 + abs(a[1] - b[1]) * 100)
+
+
+def full(keys, points):
+    data = array('H', [minutes(a, b) for a in points for b in points])
+    return DayMatrix(keys, points, data)
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    calls = []
+
+    def travel_rect(origins, destinations):
+        calls.append((len(origins), len(destinations)))
+        return [[minutes(a, b) for b in destinations] for a in origins]
+
+    monkeypatch.setattr(RoutingService, 'travel_rect', staticmethod(travel_rect))
+    return calls
+
+
+def test_subset_keeps_values_and_order():
+    keys = [WAREHOUSE, 1, 2, 3]
+    points = [(50.0, 14.0), (50.1, 14.0), (50.0, 14.2), (50.3, 14.3)]
+    matrix = full(keys, points)
+
+    sub = matrix.subset([3, WAREHOUSE])
+
+    assert sub.keys == [3, WAREHOUSE]
+    assert sub.points == [(50.3, 14.3), (50.0, 14.0)]
+    assert sub.minutes(3, WAREHOUSE) == matrix.minutes(3, WAREHOUSE)
+    assert sub.minutes(WAREHOUSE, 3) == matrix.minutes(WAREHOUSE, 3)
+    assert sub.row(3) == [0, matrix.minutes(3, WAREHOUSE)]
+
+
+def test_extended_routes_only_new_and_moved_points(routed):
+    keys = [WAREHOUSE, 1, 2]
+    points = [(50.0, 14.0), (50.1, 14.0), (50.0, 14.2)]
+    matrix = full(keys, points)
+
+    # 2 moved, 3 is new, 1 is unchanged
+    extended = matrix.extended({1: (50.1, 14.0), 2: (50.2, 14.2), 3: (50.3, 14.1)})
+
+    assert extended.keys == [WAREHOUSE, 1, 2, 3]
+    expected = full(extended.keys, [(50.0, 14.0), (50.1, 14.0), (50.2, 14.2), (50.3, 14.1)])
+    assert list(extended.data) == list(expected.data)
+    # One call for the new rows, one for the new columns of the kept points
+    assert routed == [(2, 4), (2, 2)]
+
+
+def test_extended_without_changes_is_the_same_matrix(routed):
+    matrix = full([WAREHOUSE, 1], [(50.0, 14.0), (50.1, 14.0)])
+
+    assert matrix.extended({1: (50.1, 14.0)}) is matrix
+    assert routed == []
+
+
+def test_dump_and_load_round_trip():
+    matrix = full([WAREHOUSE, 1, 2], [(50.0, 14.0), (50.1, 14.0), (50.0, 14.2)])
+
+    loaded = DayMatrix.load(matrix.dump())
+
+    assert loaded.keys == matrix.keys
+    assert loaded.points == matrix.points
+    assert list(loaded.data) == list(matrix.data)
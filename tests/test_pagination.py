@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from app.utils import build_keyset_page, decode_cursor, encode_cursor, keyset_condition
+
+
+def test_keyset_condition_expands_the_row_comparison():
+    sql, params = keyset_condition(['d.delivery_date', 'd.id'], ['2026-01-01', 42])
+
+    assert sql == "((d.delivery_date > %s) OR (d.delivery_date = %s AND d.id > %s))"
+    assert params == ['2026-01-01', '2026-01-01', 42]
+
+
+def test_keyset_condition_descending():
+    sql, params = keyset_condition(['a', 'b', 'c'], [1, 2, 3], descending=True)
+
+    assert sql == "((a < %s) OR (a = %s AND b < %s) OR (a = %s AND b = %s AND c < %s))"
+    assert params == [1, 1, 2, 1, 2, 3]
+
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 1, 2, 8, 30), date(2026, 1, 2), timedelta(hours=9, minutes=5),
+              Decimal('50.0755'), 'label', 17, None]
+    token = encode_cursor(values, 'prev')
+
+    assert '=' not in token
+    assert decode_cursor(token) == (
+        ['2026-01-02 08:30:00', '2026-01-02', '09:05:00', '50.0755', 'label', 17, None], 'prev')
+
+
+def test_invalid_cursor_starts_from_the_beginning():
+    assert decode_cursor(None) == (None, 'next')
+    assert decode_cursor('not a cursor') == (None, 'next')
+    assert decode_cursor(encode_cursor([1])[:-3]) == (None, 'next')
+
+
+def test_keyset_page_directions():
+    rows = [{'id': i} for i in (1, 2, 3, 4)]
+    page = build_keyset_page(rows, 3, lambda r: [r['id']], 'next', has_cursor=False)
+
+    assert [r['id'] for r in page['items']] == [1, 2, 3]
+    assert page['has_next'] and not page['has_prev']
+    assert decode_cursor(page['next_cursor']) == ([3], 'next')
+
+    # Fetched in reverse seek order when paging back
+    page = build_keyset_page(rows[::-1], 3, lambda r: [r['id']], 'prev', has_cursor=True)
+    assert [r['id'] for r in page['items']] == [2, 3, 4]
+    assert page['has_prev'] and page['has_next']
+    assert decode_cursor(page['prev_cursor']) == ([2], 'prev')
@@ -0,0 +1,72 @@
+import heapq
+import random
+from array import array
+
+from app.services.routing_service import RoadGraph
+
+
+def graph(n, edges):
+    return RoadGraph(array('d', [50.0 + i * 0.001 for i in range(n)]),
+                     array('d', [14.0] * n), edges)
+
+
+def dijkstra(n, edges, source):
+    adjacent = [[] for _ in range(n)]
+    for u, v, w in edges:
+        adjacent[u].append((v, w))
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for v, w in adjacent[u]:
+            if d + w < dist.get(v, float('inf')):
+                dist[v] = d + w
+                heapq.heappush(heap, (d + w, v))
+    return dist
+
+
+def test_one_way_streets():
+    # 0 -> 1 -> 2 one way, 2 -> 0 directly
+    g = graph(3, [(0, 1, 10.0), (1, 2, 10.0), (2, 0, 50.0)])
+
+    assert g.shortest_time(0, 2) == 20.0
+    assert g.shortest_time(2, 1) == 60.0
+    assert g.shortest_time(1, 1) == 0.0
+    assert g.one_to_many(0, [1, 2]) == {1: 10.0, 2: 20.0}
+    # Reversed: from each target to the source
+    assert g.one_to_many(0, [1, 2], reverse=True) == {1: 60.0, 2: 50.0}
+
+
+def test_unreachable_targets():
+    g = graph(4, [(0, 1, 5.0), (1, 0, 5.0), (2, 3, 5.0)])
+
+    assert g.shortest_time(0, 3) is None
+    assert g.one_to_many(0, [1, 3]) == {1: 5.0}
+
+
+def test_matches_plain_dijkstra_on_a_random_graph():
+    rng = random.Random(3)
+    n = 300
+    edges = [(rng.randrange(n), rng.randrange(n), float(rng.randrange(1, 100))) for _ in range(1500)]
+    g = graph(n, edges)
+
+    for source in rng.sample(range(n), 10):
+        expected = dijkstra(n, edges, source)
+        targets = rng.sample(range(n), 20)
+        assert g.one_to_many(source, targets) == {t: expected[t] for t in targets if t in expected}
+        for target in targets[:5]:
+            assert g.shortest_time(source, target) == expected.get(target)
+
+        reverse = g.one_to_many(source, targets, reverse=True)
+        for target in targets:
+            assert reverse.get(target) == dijkstra(n, edges, target).get(source)
+
+
+def test_nearest_skips_nodes_without_outgoing_edges():
+    g = graph(3, [(0, 1, 1.0), (1, 0, 1.0)])
+
+    node, km = g.nearest(50.002, 14.0)
+    assert node == 1
+    assert 0.1 < km < 0.12
@@ -0,0 +1,55 @@
+import random
+
+from app.services.scheduling_service import IntervalTree
+
+
+def brute_force(items, lo, hi):
+    return sorted((i for i in items.values() if i['start'] < hi and i['end'] > lo),
+                  key=lambda i: (i['start'], i['id']))
+
+
+def test_overlapping_is_half_open():
+    tree = IntervalTree([
+        {'id': 1, 'start': 540, 'end': 600},
+        {'id': 2, 'start': 600, 'end': 660},
+        {'id': 3, 'start': 630, 'end': 720},
+    ])
+
+    assert [i['id'] for i in tree.overlapping(600, 630)] == [2]
+    assert [i['id'] for i in tree.overlapping(599, 631)] == [1, 2, 3]
+    assert tree.overlapping(720, 800) == []
+    assert tree.overlapping(0, 540) == []
+
+
+def test_insert_replaces_and_remove_forgets():
+    tree = IntervalTree([{'id': 1, 'start': 540, 'end': 600}])
+    tree.insert({'id': 1, 'start': 700, 'end': 760})
+
+    assert len(tree) == 1
+    assert tree.overlapping(540, 600) == []
+    assert [i['id'] for i in tree.overlapping(720, 730)] == [1]
+
+    assert tree.remove(1) is True
+    assert tree.remove(1) is False
+    assert 1 not in tree
+    assert tree.overlapping(0, 1440) == []
+
+
+def test_matches_brute_force_after_random_changes():
+    rng = random.Random(7)
+    tree = IntervalTree()
+    items = {}
+    for step in range(2000):
+        item_id = rng.randrange(200)
+        if rng.random() < 0.3:
+            assert tree.remove(item_id) == (items.pop(item_id, None) is not None)
+        else:
+            start = rng.randrange(1440)
+            item = {'id': item_id, 'start': start, 'end': start + rng.randrange(1, 240)}
+            tree.insert(item)
+            items[item_id] = item
+        if step % 50 == 0:
+            lo = rng.randrange(1440)
+            hi = lo + rng.randrange(1, 300)
+            assert tree.overlapping(lo, hi) == brute_force(items, lo, hi)
+    assert len(tree) == len(items)
@@ -0,0 +1,58 @@
+from datetime import datetime
+
+from app.services.sync_service import SyncService
+
+
+def op(status, ts, delivery_id=1, key='k1'):
+    return {'key': key, 'type': 'status', 'delivery_id': delivery_id, 'status': status,
+            'client_ts': datetime.fromtimestamp(ts)}
+
+
+def delivery(status, updated_ts=None, driver_id=7):
+    updated = datetime.fromtimestamp(updated_ts) if updated_ts is not None else None
+    return {'id': 1, 'driver_id': driver_id, 'status': status, 'updated_at': updated}
+
+
+def test_parse_ops_sorts_and_rejects():
+    valid, rejected = SyncService._parse_ops([
+        {'id': 'b', 'delivery_id': '2', 'status': 'completed', 'client_ts': 2000},
+        {'id': 'a', 'delivery_id': 1, 'status': 'in_progress', 'client_ts': 1000},
+        {'id': 'c', 'delivery_id': 'x', 'status': 'completed', 'client_ts': 1000},
+        {'id': 'd', 'delivery_id': 3, 'status': 'cancelled', 'client_ts': 1000},
+        {'id': '', 'delivery_id': 3, 'status': 'completed', 'client_ts': 1000},
+        {'id': 'e', 'type': 'note', 'delivery_id': 3, 'status': 'completed', 'client_ts': 1000},
+        {'id': 'f', 'delivery_id': 3, 'status': 'completed'},
+        'garbage',
+    ])
+
+    assert [(o['key'], o['delivery_id']) for o in valid] == [('a', 1), ('b', 2)]
+    assert [r['id'] for r in rejected] == ['c', 'd', '', 'e', 'f']
+    assert all(r['result'] == 'rejected' and r['reason'] == 'invalid' for r in rejected)
+
+
+def test_parse_ops_truncates_keys():
+    valid, _ = SyncService._parse_ops([{'id': 'x' * 100, 'delivery_id': 1, 'status': 'pending',
+                                        'client_ts': 1000}])
+    assert valid[0]['key'] == 'x' * 64
+
+
+def test_resolve_rejects_other_drivers_deliveries():
+    assert SyncService._resolve(None, op('completed', 100), 7) == ('rejected', 'not_found')
+    assert SyncService._resolve(delivery('pending', driver_id=8), op('completed', 100), 7) == \
+        ('rejected', 'not_found')
+
+
+def test_resolve_forward_progress_always_wins():
+    assert SyncService._resolve(delivery('pending', 500), op('in_progress', 100), 7) == ('applied', 'forward')
+    assert SyncService._resolve(delivery('in_progress', 500), op('completed', 100), 7) == ('applied', 'forward')
+    assert SyncService._resolve(delivery('completed', 500), op('completed', 100), 7) == ('applied', 'unchanged')
+
+
+def test_resolve_backward_step_needs_a_newer_client_time():
+    assert SyncService._resolve(delivery('completed', 500), op('in_progress', 600), 7) == ('applied', 'newer')
+    assert SyncService._resolve(delivery('completed', 500), op('in_progress', 400), 7) == ('conflict', 'stale')
+    assert SyncService._resolve(delivery('completed'), op('pending', 400), 7) == ('applied', 'newer')
+
+
+def test_resolve_never_changes_cancelled_deliveries():
+    assert SyncService._resolve(delivery('cancelled', 500), op('completed', 600), 7) == ('conflict', 'cancelled')